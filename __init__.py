@@ -23,6 +23,29 @@ import base64
 import quopri
 import sys
 import re
+import threading
+import time
+import contextlib
+import asyncore
+import socket
+import os
+import errno
+import collections
+import struct
+import Queue
+import itertools
+import hashlib
+import bisect
+import heapq
+import binascii
+import email.utils
+import random
+import zlib
+import bz2
+import multiprocessing
+import json
+import marshal
+import cPickle
 
 class TycoonBaseError(Exception):
   pass
@@ -60,13 +83,48 @@ class TycoonInvalidCursorError(TycoonBaseError):
 class TycoonNotImplementedError(TycoonBaseError):
   pass
 
+class TycoonPoolTimeoutError(TycoonBaseError):
+  pass
+
+class TycoonClosedError(TycoonBaseError):
+  pass
+
+class TycoonCodecError(TycoonBaseError):
+  pass
+
+class TycoonBulkError(TycoonBaseError):
+  def __init__(self, result, errors):
+    TycoonBaseError.__init__(self, "{0} chunks failed".format(len(errors)))
+    self.result = result
+    self.errors = errors
+
 MAJOR_VERSION = 2.6
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 1978
 DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_IDLE_TIMEOUT = 30
+DEFAULT_POOL_MAX_LIFETIME = 600
+DEFAULT_BULK_COUNT = 1000
+DEFAULT_BULK_SIZE = 1 << 20
+DEFAULT_BULK_WORKERS = 4
+DEFAULT_SCAN_BATCH = 100
+DEFAULT_SCAN_PREFETCH = 4
+CACHE_ENTRY_OVERHEAD = 64
+DEFAULT_SHARD_POINTS = 160
+DEFAULT_REPLICA_POOL_SIZE = 4
+DEFAULT_HEALTH_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_COMPRESS_THRESHOLD = 1024
+DEFAULT_PARALLEL_COMPRESS_SIZE = 1 << 20
+CODEC_MAGIC = "\xfeKC"
+CODEC_STORED = "-"
+CODECS = {"zlib" : ("z", zlib.compress, zlib.decompress)
+          ,"bz2" : ("b", bz2.compress, bz2.decompress)}
 ENCODE_TYPE = {"BASE64" : "B"
                ,"QUOTED_PRINTABLE" : "Q"
                ,"URL" : "U"}
+COLENC_RAW = ""
 COLENC_MATCH = re.compile(r".*colenc=([{0}])$".format("|".join(ENCODE_TYPE.values())))
 RESPONSE_STATUS = {"echo" : {200 : None}
                    ,"report" : {200 : None}
@@ -95,6 +153,10 @@ RESPONSE_STATUS = {"echo" : {200 : None}
                    ,"set_bulk" : {200 : None}
                    ,"remove_bulk" : {200 : None}
                    ,"get_bulk" : {200 : None}
+                   ,"match_prefix" : {200 : None}
+                   ,"match_regex" : {200 : None
+                                     ,450 : TycoonLogicalError}
+                   ,"match_similar" : {200 : None}
                    ,"vacuum" : {200 : None}
                    ,"cur_jump" : {200 : None
                                   ,450 : TycoonInvalidCursorError}
@@ -119,113 +181,972 @@ RESPONSE_STATUS = {"echo" : {200 : None}
                    ,"cur_delete" : {200 : None
                                     ,450 : TycoonInvalidCursorError}
                    }
-METHOD_TYPE=("GET", "POST", "REST")
-
-def open(method="GET", host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+REQUIRED_ARGUMENTS = {"play_script" : ("name",)
+                      ,"set" : ("key", "value")
+                      ,"add" : ("key", "value")
+                      ,"replace" : ("key", "value")
+                      ,"append" : ("key", "value")
+                      ,"increment" : ("key", "num")
+                      ,"increment_double" : ("key", "num")
+                      ,"cas" : ("key",)
+                      ,"remove" : ("key",)
+                      ,"get" : ("key",)
+                      ,"match_prefix" : ("prefix",)
+                      ,"match_regex" : ("regex",)
+                      ,"match_similar" : ("origin",)
+                      ,"vget" : ("key",)
+                      ,"vcas" : ("key",)
+                      ,"cur_jump" : ("CUR",)
+                      ,"cur_jump_back" : ("CUR",)
+                      ,"cur_step" : ("CUR",)
+                      ,"cur_step_back" : ("CUR",)
+                      ,"cur_set_value" : ("CUR", "value")
+                      ,"cur_remove" : ("CUR",)
+                      ,"cur_get_key" : ("CUR",)
+                      ,"cur_get_value" : ("CUR",)
+                      ,"cur_get" : ("CUR",)
+                      ,"cur_delete" : ("CUR",)
+                      }
+METHOD_TYPE=("GET", "POST", "REST", "BINARY")
+BINARY_MAGIC = {"nop" : 0xB0
+                ,"replication" : 0xB1
+                ,"play_script" : 0xB4
+                ,"set_bulk" : 0xB8
+                ,"remove_bulk" : 0xB9
+                ,"get_bulk" : 0xBA
+                ,"error" : 0xBF}
+REST_STATUS = {"get" : {200 : None
+                         ,404 : TycoonRecordNotExistError}
+               ,"check" : {200 : None
+                           ,404 : TycoonRecordNotExistError}
+               ,"set" : {201 : None}
+               ,"add" : {201 : None
+                         ,450 : TycoonRecordExistError}
+               ,"replace" : {201 : None
+                             ,450 : TycoonRecordNotExistError}
+               ,"remove" : {204 : None
+                            ,404 : TycoonRecordNotExistError}}
+DEFAULT_REST_CHUNK = 1 << 16
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 0.05
+DEFAULT_RETRY_MAX_BACKOFF = 2.0
+# Procedures leaving the same state behind however often they are repeated,
+# so a call whose response was lost can be sent again. The others would
+# count twice (increment, append), report a failure for their own earlier
+# success (add, replace, remove, cas), or depend on a cursor that did not
+# survive the reconnect.
+IDEMPOTENT_PROCEDURES = frozenset(("echo", "report", "status", "synchronize", "vacuum", "clear"
+                                   ,"set", "get", "check", "set_bulk", "get_bulk", "remove_bulk"
+                                   ,"match_prefix", "match_regex", "match_similar"))
+BINARY_NOREPLY = 0x01
+SCRIPT_BATCH_PROCEDURE = "pytycoon_batch"
+SCRIPT_BATCH_OPERATIONS = ("get", "set", "add", "replace", "append", "increment", "increment_double"
+                           ,"cas", "remove", "vget", "vcas")
+SCRIPT_BATCH_STATUS = {"vget" : {450 : TycoonRecordNotExistError}
+                       ,"vcas" : {450 : TycoonAssumptionFaildError}}
+REPLICATION_WHITESID = 0x01
+DEFAULT_REPLICATION_SID = 0xFFFF
+ULOG_OPS = {0xA1 : "set"
+            ,0xA2 : "remove"
+            ,0xA5 : "clear"}
+ULOG_NO_XT = (1 << 40) - 1
+BINARY_NO_XT = 0x7FFFFFFFFFFFFFFF
+
+def open(method="GET", host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT
+         ,pool_size=0, pool_timeout=None
+         ,idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT, max_lifetime=DEFAULT_POOL_MAX_LIFETIME
+         ,cache_size=0, cache_max_age=None, instrument=None, retry=None, codec=None
+         ,serializer=None, coalesce=False, batch_window=None, batch_size=DEFAULT_BATCH_SIZE):
   if method not in METHOD_TYPE: raise TycoonRequiredArgumentError()
   version = float(sys.version[0:3])
-  if version >= MAJOR_VERSION:
+  if version < MAJOR_VERSION:
+    raise TycoonPythonVersionError()
+
+  def connect():
     if method == "GET":
-      return __GETPyTycoon(httplib.HTTPConnection(host, port, timeout))
+      client = __GETPyTycoon(httplib.HTTPConnection(host, port, timeout))
     elif method == "POST":
-      return __POSTPyTycoon(httplib.HTTPConnection(host, port, timeout))
+      client = __POSTPyTycoon(httplib.HTTPConnection(host, port, timeout))
     elif method == "REST":
-      return __RESTPyTycoon(httplib.HTTPConnection(host, port, timeout))
+      client = __RESTPyTycoon(httplib.HTTPConnection(host, port, timeout))
+    elif method == "BINARY":
+      client = __BINARYPyTycoon(httplib.HTTPConnection(host, port, timeout))
+    client.retry = retry
+    if instrument is not None:
+      client = _InstrumentedPyTycoon(client, instrument)
+    return client
+
+  if pool_size > 0:
+    tycoon = _PooledPyTycoon(connect, pool_size, pool_timeout, idle_timeout, max_lifetime)
+  else:
+    tycoon = connect()
+  if codec is not None:
+    tycoon = _CodecPyTycoon(tycoon, codec)
+  if coalesce or batch_window:
+    tycoon = _CoalescedPyTycoon(tycoon, batch_window, batch_size)
+  if cache_size > 0:
+    tycoon = _CachedPyTycoon(tycoon, _RecordCache(cache_size, cache_max_age))
+  tycoon.serializer = serializer
+  return tycoon
+
+# Client spreading records over several servers by consistent hashing.
+# nodes is a list of "host:port" strings or (host, port) tuples; each node
+# gets points virtual nodes on a ketama-style ring, so adding or removing a
+# node only moves the keys nearest to its points. Every other argument is
+# passed on to open() for each node.
+#   tycoon = PyTycoon.open_sharded(["10.0.0.1:1978", "10.0.0.2:1978"])
+def open_sharded(nodes, method="GET", timeout=DEFAULT_TIMEOUT, points=DEFAULT_SHARD_POINTS
+                 ,**kwargs):
+  if not nodes: raise TycoonRequiredArgumentError()
+  serializer = kwargs.pop("serializer", None)
+  names = []
+  clients = []
+  try:
+    for node in nodes:
+      host, port = _parseNode(node)
+      names.append("{0}:{1}".format(host, port))
+      clients.append(open(method, host, port, timeout, **kwargs))
+  except:
+    for client in clients:
+      client.close()
+    raise
+  tycoon = _ShardedPyTycoon(clients, _HashRing(names, points))
+  tycoon.serializer = serializer
+  return tycoon
+
+# Client over a primary server and its replicas, for master/slave and
+# dual-master setups. Writes go to the primary; get, get_bulk, status,
+# report and echo go to the healthy replica with the fewest calls in flight,
+# falling back to the primary. A node that fails with a socket or HTTP
+# error is marked down and reads move on to the next node; a background
+# thread pings every node with echo each check_interval seconds (0 to
+# disable) and marks it up again once it answers. With failover, writes go
+# to the first healthy replica while the primary is down, which only makes
+# sense when that replica is a master too. The nodes are pooled, with
+# pool_size connections each, so the client is thread safe; every other
+# argument is passed on to open() for each node.
+#   tycoon = PyTycoon.open_replicated("10.0.0.1:1978", ["10.0.0.2:1978"])
+def open_replicated(primary, replicas=(), method="GET", timeout=DEFAULT_TIMEOUT
+                    ,failover=False, check_interval=DEFAULT_HEALTH_INTERVAL, **kwargs):
+  kwargs.setdefault("pool_size", DEFAULT_REPLICA_POOL_SIZE)
+  serializer = kwargs.pop("serializer", None)
+  nodes = []
+  try:
+    for node in [primary] + list(replicas):
+      host, port = _parseNode(node)
+      nodes.append(_ReplicaNode("{0}:{1}".format(host, port)
+                                ,open(method, host, port, timeout, **kwargs)))
+  except:
+    for node in nodes:
+      node.client.close()
+    raise
+  tycoon = _ReplicatedPyTycoon(nodes[0], nodes[1:], failover, check_interval)
+  tycoon.serializer = serializer
+  return tycoon
+
+def _parseNode(node):
+  if isinstance(node, basestring):
+    host, port = node.rsplit(":", 1)
+  else:
+    host, port = node
+  return host, int(port)
+
+# Non-blocking client driven by an asyncore loop on a background thread.
+# Every RPC method returns a future immediately and up to pool_size requests
+# are in flight at once, each on its own keep-alive connection.
+#   tycoon = PyTycoon.open_async(method="POST")
+#   f = tycoon.get({"key" : "hello"})
+#   print f.result()["value"]
+def open_async(method="GET", host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT
+               ,pool_size=8):
+  if method not in ("GET", "POST"): raise TycoonRequiredArgumentError()
+  version = float(sys.version[0:3])
+  if version < MAJOR_VERSION:
+    raise TycoonPythonVersionError()
+  if method == "GET":
+    codec = __GETPyTycoon(None)
   else:
+    codec = __POSTPyTycoon(None)
+  return _AsyncPyTycoon(codec, host, port, timeout, pool_size)
+
+# Stream of the changes made to a server, read from its update log with
+# the replication protocol of the binary interface, which requires ktserver
+# to run with an update log (-ulog) and a server ID (-sid). Iterating yields
+# Change tuples for the set, remove and clear operations logged after ts,
+# in nanoseconds since the epoch, except those of server sid, or only those
+# with white. The ts attribute of the stream is the position to resume
+# from; it also moves forward with the heartbeats of an idle server. A read
+# times out with socket.timeout after timeout seconds without any data.
+#   changes = PyTycoon.open_changes(ts=int(time.time() * 1e9))
+#   for change in changes:
+#     print change.op, change.key
+def open_changes(host=DEFAULT_HOST, port=DEFAULT_PORT, ts=0, sid=DEFAULT_REPLICATION_SID
+                 ,timeout=DEFAULT_TIMEOUT, white=False):
+  version = float(sys.version[0:3])
+  if version < MAJOR_VERSION:
     raise TycoonPythonVersionError()
+  sock = socket.create_connection((host, port), timeout)
+  try:
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(_REPLICATION_REQUEST.pack(BINARY_MAGIC["replication"]
+                                           ,white and REPLICATION_WHITESID or 0, ts, sid))
+    if sock.recv(1) != chr(BINARY_MAGIC["replication"]):
+      raise TycoonUnexpectedStatusError()
+  except:
+    sock.close()
+    raise
+  return _ChangeStream(sock, ts)
+
+def _chunkRecords(records, params, maxCount, maxSize):
+  chunk = dict(params)
+  count = 0
+  size = 0
+  for k, v in records:
+    chunk[k] = v
+    count += 1
+    size += len(k) + len(v) + 2
+    if count >= maxCount or size >= maxSize:
+      yield chunk
+      chunk = dict(params)
+      count = 0
+      size = 0
+  if count:
+    yield chunk
+
+# Bytes urllib.quote leaves as they are.
+_URL_SAFE = urllib.always_safe + "/"
+_COLENC_SPECIAL = re.compile("[\t\n\r]")
+
+# The records of a request with unicode keys and values encoded to UTF-8,
+# for _chooseColenc and _encodeTsv alike; d itself when there are none.
+def _encodeUnicode(d):
+  if not d: return d
+  for k, v in d.iteritems():
+    if isinstance(k, unicode) or isinstance(v, unicode):
+      break
+  else:
+    return d
+  return dict((isinstance(k, unicode) and k.encode("utf-8") or k
+               ,isinstance(v, unicode) and v.encode("utf-8") or v) for k, v in d.iteritems())
+
+# The cheapest column encoding for the records of a request: none at all
+# when no key or value holds a tab or line break, URL encoding when few
+# bytes need escaping, at three bytes each, and base64, at four bytes for
+# every three, otherwise. colenc forces an encoding instead; it is one of
+# the ENCODE_TYPE values or COLENC_RAW.
+def _chooseColenc(d, colenc=None):
+  if colenc is not None: return colenc
+  if not d: return COLENC_RAW
+  size = 0
+  unsafe = 0
+  special = False
+  for k, v in d.iteritems():
+    size += len(k) + len(v)
+    rest = k.translate(None, _URL_SAFE) + v.translate(None, _URL_SAFE)
+    unsafe += len(rest)
+    if not special and rest and _COLENC_SPECIAL.search(rest):
+      special = True
+  if not special:
+    return COLENC_RAW
+  elif unsafe * 6 < size:
+    return ENCODE_TYPE["URL"]
+  else:
+    return ENCODE_TYPE["BASE64"]
+
+# Quoted-printable without the soft line breaks, which would end the row.
+def _quotePrintable(s):
+  return binascii.b2a_qp(s, True, False).replace("=\n", "")
+
+# Request bodies of the POST client, per column encoding.
+def _encodeTsv(d, colenc=COLENC_RAW):
+  if not d: return ""
+  if colenc == ENCODE_TYPE["BASE64"]:
+    encode = base64.b64encode
+  elif colenc == ENCODE_TYPE["QUOTED_PRINTABLE"]:
+    encode = _quotePrintable
+  elif colenc == ENCODE_TYPE["URL"]:
+    encode = urllib.quote
+  else:
+    return "\n".join(["{0}\t{1}".format(k, v) for k, v in d.iteritems()])
+  return "\n".join(["{0}\t{1}".format(encode(k), encode(v)) for k, v in d.iteritems()])
+
+_TSV_HEADERS = dict((colenc, {"Content-Type" : "text/tab-separated-values; colenc={0}".format(colenc)})
+                    for colenc in ENCODE_TYPE.itervalues())
+_TSV_HEADERS[COLENC_RAW] = {"Content-Type" : "text/tab-separated-values"}
+
+_BAD_URL_ESCAPE = re.compile(r"%(?![0-9A-Fa-f]{2})")
+
+# URL decoding by way of the C quoted-printable decoder, which is many times
+# faster than urllib.unquote. Both decode "%XX" and "=XX" alike once "%" is
+# replaced, so columns holding a literal "=" take the slow path, as do
+# columns with a "%" not followed by two hex digits, which a2b_qp would drop
+# or turn into "=" where urllib.unquote keeps it as is.
+def _unquote(s):
+  if "=" in s or "%" in s and _BAD_URL_ESCAPE.search(s):
+    return urllib.unquote(s)
+  return binascii.a2b_qp(s.replace("%", "="))
+
+# Column decoders by content type, filled in as content types are seen.
+_COLENC_DECODERS = {}
+_COLENC_FUNCTIONS = {ENCODE_TYPE["BASE64"] : binascii.a2b_base64
+                     ,ENCODE_TYPE["QUOTED_PRINTABLE"] : binascii.a2b_qp
+                     ,ENCODE_TYPE["URL"] : _unquote}
+
+def _colencDecoder(contentType):
+  try:
+    return _COLENC_DECODERS[contentType]
+  except KeyError:
+    m = COLENC_MATCH.match(contentType or "")
+    decoder = m and _COLENC_FUNCTIONS[m.group(1)]
+    if len(_COLENC_DECODERS) < 64:
+      _COLENC_DECODERS[contentType] = decoder
+    return decoder
+
+# Decode a tab separated values response body into a dict in one pass,
+# decoding the key and value columns separately as colenc requires.
+# With views, values of a response without colenc are memoryview slices of
+# the body instead of copies; encoded values have to be decoded anyway and
+# are returned as strings.
+def _decodeTsv(contentType, body, views=False):
+  if not body: return None
+  lines = body.split("\n")
+  if not lines[-1]:
+    lines.pop()
+  decoder = _colencDecoder(contentType)
+  if decoder:
+    d = {}
+    for line in lines:
+      k, v = line.split("\t", 1)
+      d[decoder(k)] = decoder(v)
+    return d
+  elif not views:
+    return dict(itertools.imap(str.split, lines, itertools.repeat("\t"), itertools.repeat(1)))
+  d = {}
+  view = memoryview(body)
+  start = 0
+  for line in lines:
+    tab = line.index("\t")
+    end = start + len(line)
+    d[line[:tab]] = view[start + tab + 1:end]
+    start = end + 1
+  return d
+
+# Cursor identifiers used by the helpers; kept clear of small numbers an
+# application is likely to pick for its own cursors.
+_CURSOR_IDS = itertools.count(1 << 32)
+
+# Helpers built on top of the RPC methods, shared by every client type.
+class _PyTycoonHelpers(object):
+  # the default Serializer, or its name, of the *_obj methods.
+  serializer = None
+
+  # A client for use from another thread, closed when the block exits.
+  @contextlib.contextmanager
+  def _spawn(self):
+    connection = self.connection
+    client = self.__class__(httplib.HTTPConnection(connection.host, connection.port, connection.timeout))
+    client.retry = self.retry
+    try:
+      yield client
+    finally:
+      client.close()
+
+  # A client whose calls all share one server session, as cursors require.
+  def _session(self):
+    return self._spawn()
+
+  # Iterate over the records of a database in key order.
+  # Yields (key, value, xt) tuples, xt being None for records that do not
+  # expire. With prefix, the scan starts at the first key not less than the
+  # prefix and ends at the first key not starting with it; with start and
+  # end, it covers the keys from start included to end excluded. Both
+  # require an ordered database such as a tree database. A background
+  # thread walks a cursor on a connection of its own with pipelined cur_get
+  # calls of batch records each, keeping up to prefetch batches ahead of the
+  # consumer, so memory use is bounded however large the database is.
+  def scan(self, prefix=None, db=None, batch=DEFAULT_SCAN_BATCH, prefetch=DEFAULT_SCAN_PREFETCH
+           ,start=None, end=None):
+    queue = Queue.Queue(prefetch)
+    stop = threading.Event()
+    worker = threading.Thread(target=self.__scan, args=(queue, stop, prefix, db, batch, start, end))
+    worker.daemon = True
+    worker.start()
+    try:
+      while True:
+        records = queue.get()
+        if records is None: break
+        if isinstance(records, Exception): raise records
+        for record in records:
+          yield record
+    finally:
+      stop.set()
+      while worker.isAlive():
+        try:
+          queue.get_nowait()
+        except Queue.Empty:
+          worker.join(0.1)
+
+  def __scan(self, queue, stop, prefix, db, batch, start, end):
+    try:
+      with self._session() as client:
+        cur = str(_CURSOR_IDS.next())
+        d = {"CUR" : cur}
+        if db is not None:
+          d["DB"] = db
+        if prefix or start:
+          d["key"] = max(prefix or "", start or "")
+        try:
+          client.cur_jump(d)
+        except TycoonInvalidCursorError:
+          return
+        try:
+          while not stop.isSet():
+            pipeline = client.pipeline()
+            for i in xrange(batch):
+              pipeline.cur_get({"CUR" : cur
+                                ,"step" : "true"})
+            records = []
+            done = False
+            for r in pipeline.execute(raise_on_error=False):
+              if isinstance(r, TycoonInvalidCursorError):
+                done = True
+                break
+              elif isinstance(r, Exception):
+                raise r
+              if prefix and not r["key"].startswith(prefix) or end is not None and r["key"] >= end:
+                done = True
+                break
+              records.append((r["key"], r["value"], r.get("xt")))
+            if records:
+              queue.put(records)
+            if done: break
+        finally:
+          try:
+            client.cur_delete({"CUR" : cur})
+          except TycoonBaseError:
+            pass
+    except Exception, e:
+      queue.put(e)
+    finally:
+      queue.put(None)
+
+  # Iterate over the records whose keys match prefix, regex, or are within
+  # distance edits of origin (counted in UTF-8 characters with utf), as
+  # (key, value) pairs. The keys come from a single match_prefix,
+  # match_regex or match_similar call of at most limit keys, ordered as the
+  # server numbered them, or nearest first for origin; the procedures have
+  # no offset, so use scan(prefix) to walk an unbounded prefix. Their values
+  # are fetched lazily with get_bulk calls of batch keys each, skipping the
+  # records removed in between.
+  def match(self, prefix=None, regex=None, origin=None, distance=1, utf=False
+            ,limit=None, db=None, batch=DEFAULT_SCAN_BATCH):
+    d = {}
+    if prefix is not None:
+      name = "match_prefix"
+      d["prefix"] = prefix
+    elif regex is not None:
+      name = "match_regex"
+      d["regex"] = regex
+    elif origin is not None:
+      name = "match_similar"
+      d["origin"] = origin
+      d["range"] = str(distance)
+      if utf:
+        d["utf"] = "true"
+    else:
+      raise TycoonRequiredArgumentError()
+    if limit is not None:
+      d["max"] = str(limit)
+    if db is not None:
+      d["DB"] = db
+    r = getattr(self, name)(d)
+    keys = sorted((int(v), k) for k, v in r.iteritems() if k[:1] == "_")
+    for i in xrange(0, len(keys), batch):
+      chunk = [k for n, k in keys[i:i + batch]]
+      params = dict((k, "") for k in chunk)
+      if db is not None:
+        params["DB"] = db
+      records = self.get_bulk(params)
+      for k in chunk:
+        if k in records:
+          yield k[1:], records[k]
+
+  # Store any number of records with set_bulk.
+  # records is a dict or an iterable of (key, value) pairs. It is consumed
+  # lazily and cut into chunks of at most max_count records or max_size
+  # bytes, which are sent concurrently over up to workers connections.
+  # output: num: the number of stored records over all chunks.
+  # Raises TycoonBulkError, holding the merged result of the chunks that
+  # succeeded and a (chunk, exception) pair for each one that failed.
+  def set_many(self, records, db=None, xt=None, max_count=DEFAULT_BULK_COUNT
+               ,max_size=DEFAULT_BULK_SIZE, workers=DEFAULT_BULK_WORKERS):
+    if hasattr(records, "iteritems"):
+      records = records.iteritems()
+    records = (("_" + k, v) for k, v in records)
+    chunks = _chunkRecords(records, self.__bulkParams(db, xt), max_count, max_size)
+    return self.__dispatchBulk("set_bulk", chunks, workers)
+
+  # Retrieve any number of records with get_bulk; keys is any iterable.
+  # output: num: the number of retrieved records over all chunks.
+  # output: arbitrary keys which trail the character "_".
+  # Chunking and errors as in set_many.
+  def get_many(self, keys, db=None, max_count=DEFAULT_BULK_COUNT
+               ,max_size=DEFAULT_BULK_SIZE, workers=DEFAULT_BULK_WORKERS):
+    records = (("_" + k, "") for k in keys)
+    chunks = _chunkRecords(records, self.__bulkParams(db, None), max_count, max_size)
+    return self.__dispatchBulk("get_bulk", chunks, workers)
+
+  # Remove any number of records with remove_bulk; keys is any iterable.
+  # output: num: the number of removed records over all chunks.
+  # Chunking and errors as in set_many.
+  def remove_many(self, keys, db=None, max_count=DEFAULT_BULK_COUNT
+                  ,max_size=DEFAULT_BULK_SIZE, workers=DEFAULT_BULK_WORKERS):
+    records = (("_" + k, "") for k in keys)
+    chunks = _chunkRecords(records, self.__bulkParams(db, None), max_count, max_size)
+    return self.__dispatchBulk("remove_bulk", chunks, workers)
+
+  # A _ScriptBatch over this client, on database db.
+  def batch(self, db=None):
+    return _ScriptBatch(self, db)
+
+  # Retrieve a record with its version, an opaque token of its value
+  # computed by the server with the pytycoon.lua library, for vcas.
+  # input: DB: (optional): the database identifier.
+  # input: key: the key of the record.
+  # output: value: the value of the record.
+  # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
+  # output: version: the version of the value.
+  # Raises TycoonRecordNotExistError if there is no such record.
+  # On a client opened with a codec, the version is that of the stored,
+  # compressed value, which is what vcas checks.
+  def vget(self, d):
+    return self.__script("vget", d)
+
+  # Perform compare-and-swap against the version of the value as given by
+  # vget, so neither the old value nor a copy of it has to be kept and sent.
+  # input: DB: (optional): the database identifier.
+  # input: key: the key of the record.
+  # input: version: (optional): the version of the current value. If it is omitted, no record is meant.
+  # input: nval: (optional): the new value. If it is omittted, the record is removed.
+  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
+  # output: version: (optional): the version of nval.
+  # Raises TycoonAssumptionFaildError if the version does not match.
+  def vcas(self, d):
+    return self.__script("vcas", d)
+
+  def __script(self, name, d):
+    batch = self.batch(d and d.get("DB"))
+    getattr(batch, name)(d)
+    return batch.execute()[0]
+
+  # A _WriteBehindBuffer over this client.
+  #   with tycoon.write_behind(interval=0.5) as buffer:
+  #     buffer.set({"key" : "hoge", "value" : "hage"})
+  def write_behind(self, max_count=DEFAULT_BULK_COUNT, max_size=DEFAULT_BULK_SIZE
+                   ,interval=DEFAULT_FLUSH_INTERVAL, workers=1):
+    return _WriteBehindBuffer(self, max_count, max_size, interval, workers)
+
+  # Store obj under key, converted by serializer, or by the serializer the
+  # client was opened with, JSON by default. serializer is a Serializer or
+  # a name in SERIALIZERS.
+  def set_obj(self, key, obj, db=None, xt=None, serializer=None):
+    d = self.__bulkParams(db, xt)
+    d["key"] = key
+    d["value"] = _serializer(serializer or self.serializer).dumps(obj)
+    return self.set(d)
+
+  # The object stored under key, or default if there is no such record.
+  def get_obj(self, key, default=None, db=None, serializer=None):
+    d = self.__bulkParams(db, None)
+    d["key"] = key
+    try:
+      r = self.get(d)
+    except TycoonRecordNotExistError:
+      return default
+    return _serializer(serializer or self.serializer).loads(r["value"])
+
+  # set_many for objects: records is a dict or an iterable of (key, obj)
+  # pairs, serialized in one pass with Serializer.dumps_many.
+  def set_many_obj(self, records, db=None, xt=None, serializer=None, **kwargs):
+    if hasattr(records, "iteritems"):
+      records = records.iteritems()
+    keys = []
+    objs = []
+    for k, obj in records:
+      keys.append(k)
+      objs.append(obj)
+    values = _serializer(serializer or self.serializer).dumps_many(objs)
+    return self.set_many(itertools.izip(keys, values), db, xt, **kwargs)
+
+  # get_many for objects: {key : obj} for the keys found, deserialized in
+  # one pass with Serializer.loads_many.
+  def get_many_obj(self, keys, db=None, serializer=None, **kwargs):
+    r = self.get_many(keys, db, **kwargs)
+    keys = [k for k in r if k[:1] == "_"]
+    objs = _serializer(serializer or self.serializer).loads_many([r[k] for k in keys])
+    return dict((k[1:], obj) for k, obj in itertools.izip(keys, objs))
+
+  def __bulkParams(self, db, xt):
+    params = {}
+    if db is not None:
+      params["DB"] = db
+    if xt is not None:
+      params["xt"] = xt
+    return params
+
+  def __dispatchBulk(self, funcName, chunks, workers):
+    result = {}
+    errors = []
+    counts = [0]
+    lock = threading.Lock()
+
+    def run(client, index, chunk):
+      try:
+        r = getattr(client, funcName)(chunk)
+      except Exception, e:
+        if client is not self and not isinstance(e, TycoonBaseError):
+          client.close()
+        lock.acquire()
+        try:
+          errors.append((index, chunk, e))
+        finally:
+          lock.release()
+        return
+      if not r: return
+      lock.acquire()
+      try:
+        for k, v in r.iteritems():
+          if k == "num":
+            counts[0] += int(v)
+          elif k[:1] == "_":
+            result[k] = v
+      finally:
+        lock.release()
+
+    if workers <= 1:
+      for index, chunk in enumerate(chunks):
+        run(self, index, chunk)
+    else:
+      queue = Queue.Queue(workers * 2)
+      def work():
+        with self._spawn() as client:
+          while True:
+            item = queue.get()
+            if item is None: return
+            run(client, *item)
+      threads = [threading.Thread(target=work) for i in range(workers)]
+      for t in threads:
+        t.daemon = True
+        t.start()
+      try:
+        for item in enumerate(chunks):
+          queue.put(item)
+      finally:
+        for t in threads:
+          queue.put(None)
+        for t in threads:
+          t.join()
+
+    result["num"] = str(counts[0])
+    if errors:
+      errors.sort(key=lambda error: error[0])
+      raise TycoonBulkError(result, [(chunk, e) for index, chunk, e in errors])
+    return result
+
+# When and how often a call failing with a socket or HTTP protocol error,
+# e.g. after a server restart or on a keep-alive connection the server has
+# closed, is made again on a new connection. A call is made up to attempts
+# times in all if its request was never sent, or if its procedure is in
+# idempotent. After the n-th failed attempt the client sleeps for a random
+# time of up to backoff * 2 ** n seconds, at most max_backoff, so that
+# clients which lost the server together do not come back together.
+#   tycoon = PyTycoon.open(retry=PyTycoon.RetryPolicy(attempts=5))
+class RetryPolicy(object):
+  def __init__(self, attempts=DEFAULT_RETRY_ATTEMPTS, backoff=DEFAULT_RETRY_BACKOFF
+               ,max_backoff=DEFAULT_RETRY_MAX_BACKOFF, idempotent=IDEMPOTENT_PROCEDURES):
+    self.attempts = attempts
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.idempotent = idempotent
+
+  # Seconds to wait before retrying for the attempt-th time, or None when
+  # the call must fail with the error.
+  def delay(self, name, attempt, sent):
+    if attempt >= self.attempts: return None
+    if sent and name not in self.idempotent: return None
+    return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+# Compression of values, for open(..., codec=PyTycoon.Codec()).
+# A value of at least threshold bytes is compressed with one of CODECS and
+# written as CODEC_MAGIC, the tag of the codec and the compressed data, unless
+# that would not make it smaller. Other values are written as they are, or,
+# if they happen to start with CODEC_MAGIC, behind CODEC_MAGIC and
+# CODEC_STORED. Values read back without CODEC_MAGIC are returned unchanged,
+# so records written without a codec, or with another one of CODECS, stay
+# readable. With processes, set_bulk batches holding at least parallel_size
+# bytes to compress are spread over a pool of that many processes, started
+# on first use and stopped by close().
+#   tycoon = PyTycoon.open(codec=PyTycoon.Codec(threshold=4096, processes=4))
+class Codec(object):
+  def __init__(self, threshold=DEFAULT_COMPRESS_THRESHOLD, codec="zlib"
+               ,processes=0, parallel_size=DEFAULT_PARALLEL_COMPRESS_SIZE):
+    if codec not in CODECS: raise TycoonRequiredArgumentError()
+    self.threshold = threshold
+    self.processes = processes
+    self.parallel_size = parallel_size
+    self.__tag, self.__compress, decompress = CODECS[codec]
+    self.__decompressors = dict((tag, f) for tag, c, f in CODECS.itervalues())
+    self.__pool = None
+    self.__lock = threading.Lock()
+
+  def close(self):
+    self.__lock.acquire()
+    try:
+      pool, self.__pool = self.__pool, None
+    finally:
+      self.__lock.release()
+    if pool is not None:
+      pool.terminate()
+      pool.join()
+
+  def encode(self, value):
+    if not isinstance(value, str):
+      return value
+    if len(value) >= self.threshold:
+      return self.__wrap(value, self.__compress(value))
+    return self.__wrap(value, None)
+
+  # encode() over a list of values, in parallel if the batch is big enough.
+  def encode_many(self, values):
+    if not all(isinstance(value, str) for value in values):
+      return [self.encode(value) for value in values]
+    large = [i for i, value in enumerate(values) if len(value) >= self.threshold]
+    if not large:
+      return [self.__wrap(value, None) for value in values]
+    if self.processes > 0 and sum(len(values[i]) for i in large) >= self.parallel_size:
+      compressed = self.__getPool().map(self.__compress, [values[i] for i in large])
+    else:
+      compressed = [self.__compress(values[i]) for i in large]
+    results = [None] * len(values)
+    for i, data in itertools.izip(large, compressed):
+      results[i] = data
+    return [self.__wrap(value, data) for value, data in itertools.izip(values, results)]
+
+  def decode(self, value):
+    if value[:len(CODEC_MAGIC)] != CODEC_MAGIC:
+      return value
+    if isinstance(value, memoryview):
+      value = value.tobytes()
+    tag = value[len(CODEC_MAGIC):len(CODEC_MAGIC) + 1]
+    data = value[len(CODEC_MAGIC) + 1:]
+    if tag == CODEC_STORED:
+      return data
+    if tag not in self.__decompressors:
+      raise TycoonCodecError("unknown codec tag {0!r}".format(tag))
+    try:
+      return self.__decompressors[tag](data)
+    except (zlib.error, IOError), e:
+      raise TycoonCodecError(str(e))
+
+  def __wrap(self, value, data):
+    if data is not None and len(data) + len(CODEC_MAGIC) + 1 < len(value):
+      return CODEC_MAGIC + self.__tag + data
+    if value[:len(CODEC_MAGIC)] == CODEC_MAGIC:
+      return CODEC_MAGIC + CODEC_STORED + value
+    return value
+
+  def __getPool(self):
+    self.__lock.acquire()
+    try:
+      if self.__pool is None:
+        self.__pool = multiprocessing.Pool(self.processes)
+      return self.__pool
+    finally:
+      self.__lock.release()
+
+# Conversion between objects and record values for set_obj, get_obj and
+# the other *_obj methods. dumps(obj) returns a str and loads(value) the
+# object back; dumps_many and loads_many do the same for a list at once and
+# may be overridden by serializers able to handle a batch in one go.
+#   tycoon = PyTycoon.open(serializer=PyTycoon.Serializer(yaml.dump, yaml.load))
+class Serializer(object):
+  def __init__(self, dumps, loads):
+    self.dumps = dumps
+    self.loads = loads
+
+  def dumps_many(self, objs):
+    return map(self.dumps, objs)
+
+  def loads_many(self, values):
+    return map(self.loads, values)
+
+# Serializer of fixed-size records packed with the struct module, e.g.
+# StructSerializer("<qd") for (int, float) pairs. Objects are tuples, or
+# plain values for a format with a single field. Batches are packed and
+# unpacked with a single struct call when the format starts with one of the
+# standard size prefixes "=<>!"; native formats may pad between records, so
+# their batches are packed record by record.
+class StructSerializer(Serializer):
+  def __init__(self, format):
+    self.__struct = struct.Struct(format)
+    self.__order = format[:1] in "@=<>!" and format[:1] or ""
+    self.__fields = format[len(self.__order):]
+    self.__standard = self.__order in ("=", "<", ">", "!")
+    self.__single = len(self.__struct.unpack("\0" * self.__struct.size)) == 1
+
+  def dumps(self, obj):
+    if self.__single:
+      return self.__struct.pack(obj)
+    return self.__struct.pack(*obj)
+
+  def loads(self, value):
+    fields = self.__struct.unpack(value)
+    if self.__single:
+      return fields[0]
+    return fields
+
+  def dumps_many(self, objs):
+    if not objs: return []
+    if not self.__standard:
+      return map(self.dumps, objs)
+    if self.__single:
+      fields = objs
+    else:
+      fields = list(itertools.chain.from_iterable(objs))
+    data = struct.pack(self.__order + self.__fields * len(objs), *fields)
+    size = self.__struct.size
+    return [data[i:i + size] for i in xrange(0, len(data), size)]
+
+  def loads_many(self, values):
+    if not values: return []
+    if not self.__standard:
+      return map(self.loads, values)
+    size = self.__struct.size
+    for value in values:
+      if len(value) != size:
+        raise struct.error("unpack requires a string argument of length {0}".format(size))
+    fields = struct.unpack(self.__order + self.__fields * len(values), "".join(values))
+    if self.__single:
+      return list(fields)
+    n = len(fields) // len(values)
+    return [fields[i:i + n] for i in xrange(0, len(fields), n)]
+
+SERIALIZERS = {"json" : Serializer(json.JSONEncoder(separators=(",", ":")).encode
+                                   ,json.JSONDecoder().decode)
+               ,"marshal" : Serializer(marshal.dumps, marshal.loads)
+               ,"pickle" : Serializer(lambda obj: cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+                                      ,cPickle.loads)}
+
+def _serializer(serializer):
+  if serializer is None:
+    return SERIALIZERS["json"]
+  if isinstance(serializer, basestring):
+    if serializer not in SERIALIZERS: raise TycoonRequiredArgumentError()
+    return SERIALIZERS[serializer]
+  return serializer
+
+# Prebuilt metadata of an RPC procedure: its path, the arguments it
+# requires and the exceptions its status codes map to.
+class _Procedure(object):
+  __slots__ = ("name", "path", "query", "required", "status")
+
+  def __init__(self, name):
+    self.name = name
+    self.path = "/rpc/{0}".format(name)
+    self.query = self.path + "?"
+    self.required = REQUIRED_ARGUMENTS.get(name, ())
+    self.status = RESPONSE_STATUS[name]
+
+_PROCEDURES = dict((name, _Procedure(name)) for name in RESPONSE_STATUS)
+
+# Method calling the procedure name, bound to its metadata once and for all.
+def _rpcMethod(name):
+  procedure = _PROCEDURES[name]
+  def call(self, d=None, views=False, colenc=None):
+    return self._call(procedure, d, views, colenc)
+  call.__name__ = name
+  return call
+
+# Core shared by the HTTP RPC clients, which differ only in how a request is
+# encoded. Every procedure method takes the input records d, views, which
+# returns values as memoryviews of the response (see _decodeTsv), and
+# colenc, which forces the column encoding of a POST request body.
+class _RpcPyTycoon(_PyTycoonHelpers):
+  # the RetryPolicy of the client, if any.
+  retry = None
 
-class __GETPyTycoon(object):
   def __init__(self, connection):
     self.connection = connection
-    
+
   def close(self):
     self.connection.close()
 
-  def __checkStatus(self, funcName, status):
-    if status not in RESPONSE_STATUS[funcName]:
-      raise TycoonUnexpectedStatusError()
-    elif RESPONSE_STATUS[funcName][status]:
-      raise RESPONSE_STATUS[funcName][status]()
-
-  def __getKeyValue(self, contentType, body):
-    if body == "": return None
-    d = {}
-    m = COLENC_MATCH.match(contentType)
-    if m is not None and m.groups()[0] == ENCODE_TYPE["BASE64"]:
-      d = dict([base64.b64decode(line).split("\t") for line in body.split("\n")])
-    elif m is not None and m.groups()[0] == ENCODE_TYPE["QUOTED_PRINTABLE"]:
-      d = dict([quopri.decodestring(line).split("\t") for line in body.split("\n")])
-    elif m is not None and m.groups()[0] == ENCODE_TYPE["URL"]:
-      d = dict([urllib.unquote(line).split("\t") for line in body.split("\n")])
-    else:
-      d = dict([line.split("\t") for line in body.split("\n")])
-    return d
+  # Queue calls and send them back-to-back on this connection.
+  #   p = tycoon.pipeline()
+  #   p.set({"key" : "hoge", "value" : "hage"})
+  #   p.get({"key" : "hoge"})
+  #   results = p.execute()
+  def pipeline(self):
+    return _PyTycoonPipeline(lambda: _borrow(self))
+
+  def _call(self, procedure, d, views=False, colenc=None):
+    for arg in procedure.required:
+      if not d or arg not in d:
+        raise TycoonRequiredArgumentError()
+    method, url, body, headers = self._encodeRequest(procedure, d, colenc)
+    connection = self.connection
+    attempt = 1
+    while True:
+      sent = False
+      try:
+        if connection.sock is None:
+          connection.connect()
+        sent = True
+        connection.request(method, url, body, headers)
+        return self._decodeResponse(procedure, connection.getresponse(), views)
+      except (socket.error, httplib.HTTPException):
+        # the connection is in an unknown state; the next request opens a
+        # new one.
+        connection.close()
+        delay = self.retry and self.retry.delay(procedure.name, attempt, sent)
+        if delay is None: raise
+        time.sleep(delay)
+        attempt += 1
+
+  # The decoded records of a response, or the exception its status maps to,
+  # carrying the ERROR message of the server. The body is always read, so
+  # the connection stays usable.
+  def _decodeResponse(self, procedure, response, views=False):
+    exception = procedure.status.get(response.status, TycoonUnexpectedStatusError)
+    body = response.read()
+    if exception is None:
+      return _decodeTsv(response.getheader("content-type"), body, views)
+    e = exception()
+    args = _decodeTsv(response.getheader("content-type"), body)
+    if args and "ERROR" in args:
+      e.args = (args["ERROR"],)
+    raise e
 
   # /rpc/echo
   # Echo back the input data as the output data, just for testing.
   # input: (optional): arbitrary records.
   # output: (optional): corresponding records to the input data.
   # status code: 200.
-  def echo(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/echo?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/echo"
-    self.connection.request("GET", url)
-    response = None
-    try:
-      response = self.connection.getresponse()
-      self.__checkStatus("echo", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  echo = _rpcMethod("echo")
 
   # /rpc/report
   # Get the report of the server information.
   # output: (optional): arbitrary records.
   # status code: 200.
-  def report(self):
-    url = "/rpc/report"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("report", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-  
+  report = _rpcMethod("report")
+
   # /rpc/play_script
   # Call a procedure of the script language extension.
   # input: name: the name of the procedure to call.
   # input: (optional): arbitrary records whose keys trail the character "_".
   # output: (optional): arbitrary keys which trail the character "_".
   # status code: 200, 450 (arbitrary logical error).
-  def play_script(self, d):
-    if "name" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/play_script?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("play_script", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  play_script = _rpcMethod("play_script")
 
   # /rpc/status
   # Get the miscellaneous status information of a database.
@@ -234,47 +1155,13 @@ class __GETPyTycoon(object):
   # output: size: the size of the database file.
   # output: (optional): arbitrary records for other information.
   # status code: 200.
-  def status(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/status?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/status"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("status", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  status = _rpcMethod("status")
 
   # /rpc/clear
   # Remove all records in a database.
   # input: DB: (optional): the database identifier.
   # status code: 200.
-  def clear(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/clear?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/clear"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("clear", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  clear = _rpcMethod("clear")
 
   # /rpc/synchronize
   # Synchronize updated contents with the file and the device.
@@ -282,24 +1169,7 @@ class __GETPyTycoon(object):
   # input: hard: (optional): for physical synchronization with the device.
   # input: command: (optional): the command name to process the database file.
   # status code: 200, 450 (the postprocessing command failed).
-  def synchronize(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/synchronize?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/synchronize"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("synchronize", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  synchronize = _rpcMethod("synchronize")
 
   # /rpc/set
   # Set the value of a record.
@@ -308,22 +1178,7 @@ class __GETPyTycoon(object):
   # input: value: the value of the record.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # status code: 200.
-  def set(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/set?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("set", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  set = _rpcMethod("set")
 
   # /rpc/add
   # Add a record.
@@ -332,22 +1187,7 @@ class __GETPyTycoon(object):
   # input: value: the value of the record.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # status code: 200, 450 (existing record was detected).
-  def add(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/add?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("add", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  add = _rpcMethod("add")
 
   # /rpc/replace
   # Replace the value of a record.
@@ -356,22 +1196,7 @@ class __GETPyTycoon(object):
   # input: value: the value of the record.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # status code: 200, 450 (no record was corresponding).
-  def replace(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/replace?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("replace", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  replace = _rpcMethod("replace")
 
   # /rpc/append
   # Append the value of a record.
@@ -380,22 +1205,7 @@ class __GETPyTycoon(object):
   # input: value: the value of the record.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # status code: 200.
-  def append(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/append?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("append", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())    
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  append = _rpcMethod("append")
 
   # /rpc/increment
   # Add a number to the numeric integer value of a record.
@@ -405,22 +1215,7 @@ class __GETPyTycoon(object):
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # output: num: the result value.
   # status code: 200, 450 (the existing record was not compatible).
-  def increment(self, d):
-    if "key" not in d or "num" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/increment?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("increment", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  increment = _rpcMethod("increment")
 
   # /rpc/increment_double
   # Add a number to the numeric double value of a record.
@@ -430,23 +1225,8 @@ class __GETPyTycoon(object):
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # output: num: the result value.
   # status code: 200, 450 (the existing record was not compatible).
-  def increment_double(self, d):
-    if "key" not in d or "num" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/increment_double?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("increment_double", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-    
+  increment_double = _rpcMethod("increment_double")
+
   # /rpc/cas
   # Perform compare-and-swap.
   # input: DB: (optional): the database identifier.
@@ -455,44 +1235,14 @@ class __GETPyTycoon(object):
   # input: nval: (optional): the new value. If it is omittted, the record is removed.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # status code: 200, 450 (the old value assumption was failed).
-  def cas(self, d):
-    if "key" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cas?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cas", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cas = _rpcMethod("cas")
 
   # /rpc/remove
   # Remove a record.
   # input: DB: (optional): the database identifier.
   # input: key: the key of the record.
   # status code: 200, 450 (no record was found).
-  def remove(self, d):
-    if "key" not in d: 
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/remove?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("remove", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  remove = _rpcMethod("remove")
 
   # /rpc/get
   # Retrieve the value of a record.
@@ -501,22 +1251,8 @@ class __GETPyTycoon(object):
   # output: value: (optional): the value of the record.
   # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
   # status code: 200, 450 (no record was found).
-  def get(self, d):
-    if "key" not in d: 
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/get?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("get", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  # views: return the value as a memoryview of the response, see _decodeTsv.
+  get = _rpcMethod("get")
 
   # /rpc/set_bulk
   # Store records at once.
@@ -525,24 +1261,7 @@ class __GETPyTycoon(object):
   # input: (optional): arbitrary records whose keys trail the character "_".
   # output: num: the number of stored reocrds.
   # status code: 200.
-  def set_bulk(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/set_bulk?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/set_bulk"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("set_bulk", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  set_bulk = _rpcMethod("set_bulk")
 
   # /rpc/remove_bulk
   # Store records at once.
@@ -550,24 +1269,7 @@ class __GETPyTycoon(object):
   # input: (optional): arbitrary keys which trail the character "_".
   # output: num: the number of removed reocrds.
   # status code: 200.
-  def remove_bulk(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/remove_bulk?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/remove_bulk"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("remove_bulk", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  remove_bulk = _rpcMethod("remove_bulk")
 
   # /rpc/get_bulk
   # Retrieve records at once.
@@ -576,48 +1278,47 @@ class __GETPyTycoon(object):
   # output: num: the number of retrieved reocrds.
   # output: (optional): arbitrary keys which trail the character "_".
   # status code: 200.
-  def get_bulk(self, d):
-    url = None
-    if d:
-      url = "/rpc/get_bulk?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/get_bulk"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("get_bulk", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  # views: return the values as memoryviews of the response, see _decodeTsv.
+  get_bulk = _rpcMethod("get_bulk")
+
+  # /rpc/match_prefix
+  # Get keys matching a prefix string.
+  # input: DB: (optional): the database identifier.
+  # input: prefix: the prefix string.
+  # input: max: (optional): the maximum number to retrieve. If it is omitted or negative, no limit is specified.
+  # output: num: the number of retrieved keys.
+  # output: (optional): arbitrary keys which trail the character "_". Their values are their ordinal numbers.
+  # status code: 200.
+  match_prefix = _rpcMethod("match_prefix")
+
+  # /rpc/match_regex
+  # Get keys matching a ragular expression string.
+  # input: DB: (optional): the database identifier.
+  # input: regex: the regular expression string.
+  # input: max: (optional): the maximum number to retrieve. If it is omitted or negative, no limit is specified.
+  # output: num: the number of retrieved keys.
+  # output: (optional): arbitrary keys which trail the character "_". Their values are their ordinal numbers.
+  # status code: 200, 450 (invalid regular expression).
+  match_regex = _rpcMethod("match_regex")
+
+  # /rpc/match_similar
+  # Get keys similar to a string in terms of the levenshtein distance.
+  # input: DB: (optional): the database identifier.
+  # input: origin: the origin string.
+  # input: range: (optional): the maximum distance of keys to adopt. If it is omitted or negative, 1 is specified.
+  # input: utf: (optional): If it is omitted, the edit distance is calculated by each byte. Otherwise, by each UTF-8 character.
+  # input: max: (optional): the maximum number to retrieve. If it is omitted or negative, no limit is specified.
+  # output: num: the number of retrieved keys.
+  # output: (optional): arbitrary keys which trail the character "_". Their values are their edit distances.
+  # status code: 200.
+  match_similar = _rpcMethod("match_similar")
 
   # /rpc/vacuum
   # Scan the database and eliminate regions of expired records.
   # input: DB: (optional): the database identifier.
   # input: step: (optional): the number of steps. If it is omitted or not more than 0, the whole region is scanned.
   # status code: 200.  
-  def vacuum(self, d=None):
-    url = None
-    if d:
-      url = "/rpc/vacuum?{0}".format(urllib.urlencode(d))
-    else:
-      url = "/rpc/vacuum"
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("vacuum", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  vacuum = _rpcMethod("vacuum")
 
   # /rpc/cur_jump
   # Jump the cursor to the first record for forward scan.
@@ -625,22 +1326,7 @@ class __GETPyTycoon(object):
   # input: CUR: the cursor identifier.
   # input: key: (optional): the key of the destination record. If it is omitted, the first record is specified.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_jump(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_jump?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_jump_back", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_jump = _rpcMethod("cur_jump")
 
   # /rpc/cur_jump_back
   # Jump the cursor to a record for forward scan.
@@ -648,64 +1334,19 @@ class __GETPyTycoon(object):
   # input: CUR: the cursor identifier.
   # input: key: (optional): the key of the destination record. If it is omitted, the last record is specified.
   # status code: 200, 450 (cursor is invalidated), 501 (not implemented).
-  def cur_jump_back(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_jump_back?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_jump_back", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_jump_back = _rpcMethod("cur_jump_back")
 
   # /rpc/cur_step
   # Step the cursor to the next record.
   # input: CUR: the cursor identifier.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_step(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_step?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_step", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_step = _rpcMethod("cur_step")
 
   # /rpc/cur_step_back
   # Step the cursor to the previous record.
   # input: CUR: the cursor identifier.
   # status code: 200, 450 (cursor is invalidated), 501 (not implemented).
-  def cur_step_back(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_step_back?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_step_back", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_step_back = _rpcMethod("cur_step_back")
 
   # /rpc/cur_set_value
   # Set the value of the current record.
@@ -714,87 +1355,27 @@ class __GETPyTycoon(object):
   # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_set_value(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_set_value?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_set_value", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_set_value = _rpcMethod("cur_set_value")
 
   # /rpc/cur_remove
   # Remove the current record.
   # input: CUR: the cursor identifier.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_remove(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_remove?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_remove", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_remove = _rpcMethod("cur_remove")
 
   # /rpc/cur_get_key
   # Get the key of the current record.
   # input: CUR: the cursor identifier.
   # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_get_key(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_get_key?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_get_key", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_get_key = _rpcMethod("cur_get_key")
 
   # /rpc/cur_get_value
   # Get the value of the current record.
   # input: CUR: the cursor identifier.
   # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_get_value(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_get_value?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_get_value", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_get_value = _rpcMethod("cur_get_value")
 
   # /rpc/cur_get
   # Get a pair of the key and the value of the current record.
@@ -802,798 +1383,2253 @@ class __GETPyTycoon(object):
   # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
   # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_get(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_get?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_get", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_get = _rpcMethod("cur_get")
 
   # /rpc/cur_delete
   # Delete a cursor implicitly.
   # input: CUR: the cursor identifier.
   # status code: 200, 450 (cursor is invalidated).
-  def cur_delete(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    url = "/rpc/cur_delete?{0}".format(urllib.urlencode(d))
-    response = None
-    try:
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_delete", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  cur_delete = _rpcMethod("cur_delete")
 
-class __POSTPyTycoon(object):
-  def __init__(self, connection):
-    self.connection = connection
-    
-  def close(self):
-    self.connection.close()
+class __GETPyTycoon(_RpcPyTycoon):
+  def _encodeRequest(self, procedure, d, colenc=None):
+    if d:
+      return ("GET", procedure.query + urllib.urlencode(d), None, {})
+    else:
+      return ("GET", procedure.path, None, {})
+
+# The column encoding of the request body is picked per request, the
+# cheapest one by default, see _chooseColenc, or the one colenc forces.
+class __POSTPyTycoon(_RpcPyTycoon):
+  def _encodeRequest(self, procedure, d, colenc=None):
+    d = _encodeUnicode(d)
+    colenc = _chooseColenc(d, colenc)
+    return ("POST", procedure.path, _encodeTsv(d, colenc), _TSV_HEADERS[colenc])
+
+_BINARY_HEAD = struct.Struct(">BII")
+_BINARY_SCRIPT_HEAD = struct.Struct(">BIII")
+_BINARY_SET_RECORD = struct.Struct(">HIIq")
+_BINARY_KEY_RECORD = struct.Struct(">HI")
+_BINARY_SCRIPT_RECORD = struct.Struct(">II")
+_BINARY_COUNT = struct.Struct(">I")
+
+_REPLICATION_REQUEST = struct.Struct(">BIQH")
+_REPLICATION_RECORD = struct.Struct(">QI")
+_ULOG_HEAD = struct.Struct(">HHB")
+_TS = struct.Struct(">Q")
+
+# One operation of the update log. op is "set", "remove" or "clear"; key,
+# value and xt are None where the operation has none, xt being the absolute
+# expiration time in seconds since the epoch.
+Change = collections.namedtuple("Change", "ts sid db op key value xt")
+
+# Numbers in the variable length format of Kyoto Cabinet: 7 bits per byte,
+# most significant first, the high bit set on all but the last byte.
+def _readVarnum(data, pos):
+  num = 0
+  while True:
+    c = ord(data[pos])
+    pos += 1
+    num = (num << 7) | (c & 0x7F)
+    if c < 0x80:
+      return num, pos
+
+def _decodeUlog(ts, message):
+  sid, db, op = _ULOG_HEAD.unpack_from(message)
+  if op not in ULOG_OPS: return None
+  key = value = xt = None
+  pos = _ULOG_HEAD.size
+  if op != 0xA5:
+    ksiz, pos = _readVarnum(message, pos)
+    if op == 0xA1:
+      vsiz, pos = _readVarnum(message, pos)
+      value = message[pos + ksiz:pos + ksiz + vsiz]
+      # values of a timed database start with a 5 byte expiration time.
+      xt = _TS.unpack("\0\0\0" + value[:5])[0]
+      if xt == ULOG_NO_XT:
+        xt = None
+      value = value[5:]
+    key = message[pos:pos + ksiz]
+  return Change(ts, sid, db, ULOG_OPS[op], key, value, xt)
+
+# See open_changes.
+class _ChangeStream(object):
+  def __init__(self, sock, ts):
+    self.ts = ts
+    self.__sock = sock
+    self.__fp = sock.makefile("rb")
+    self.__closed = False
+    self.__follower = None
+    self.error = None
+
+  def __iter__(self):
+    return self
 
-  def __checkStatus(self, funcName, status):
-    if status not in RESPONSE_STATUS[funcName]:
-      raise TycoonUnexpectedStatusError()
-    elif RESPONSE_STATUS[funcName][status]:
-      raise RESPONSE_STATUS[funcName][status]()
-
-  def __getHttpHeader(self, colenc=None):
-    if colenc == ENCODE_TYPE["BASE64"]:
-      return {"Content-Type" : "text/tab-separated-values; colenc={0}".format(ENCODE_TYPE["BASE64"])}
-    elif colenc == ENCODE_TYPE["QUOTED_PRINTABLE"]:
-      return {"Content-Type" : "text/tab-separated-values; colenc={0}".format(ENCODE_TYPE["QUOTED_PRINTABLE"])}
-    elif colenc == ENCODE_TYPE["URL"]:
-      return {"Content-Type" : "text/tab-separated-values; colenc={0}".format(ENCODE_TYPE["URL"])}
+  def close(self):
+    self.__closed = True
+    try:
+      self.__sock.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+      pass
+    self.__fp.close()
+    self.__sock.close()
+    if self.__follower is not None and self.__follower is not threading.currentThread():
+      self.__follower.join()
+
+  def next(self):
+    while True:
+      magic = ord(self.__read(1))
+      if magic == BINARY_MAGIC["replication"]:
+        ts, size = _REPLICATION_RECORD.unpack(self.__read(_REPLICATION_RECORD.size))
+        change = _decodeUlog(ts, self.__read(size))
+        self.ts = ts
+        if change is not None:
+          return change
+      elif magic == BINARY_MAGIC["nop"]:
+        self.ts = max(self.ts, _TS.unpack(self.__read(_TS.size))[0])
+        self.__sock.sendall(chr(BINARY_MAGIC["replication"]))
+      else:
+        raise TycoonUnexpectedStatusError()
+
+  # Apply every change to target from a background thread until close():
+  # target.invalidate(key) for sets and removes and target.invalidate() for
+  # clears if it has an invalidate method, e.g. a client opened with
+  # cache_size, or else target(change). The exception which ended the
+  # thread, if any, is kept in the error attribute.
+  #   changes.follow(tycoon)
+  def follow(self, target):
+    if hasattr(target, "invalidate"):
+      apply = lambda change: target.invalidate(change.key)
     else:
-      return {"Content-Type" : "text/tab-separated-values"}
+      apply = target
+    def run():
+      try:
+        for change in self:
+          apply(change)
+      except Exception, e:
+        if not self.__closed:
+          self.error = e
+    self.__follower = threading.Thread(target=run)
+    self.__follower.daemon = True
+    self.__follower.start()
+    return self.__follower
+
+  def __read(self, size):
+    data = self.__fp.read(size)
+    if len(data) != size:
+      if self.__closed:
+        raise StopIteration()
+      raise socket.error(errno.ECONNRESET, "connection closed by the server")
+    return data
+
+# Client for the binary protocol of ktserver.
+# set_bulk, get_bulk, remove_bulk and play_script are sent as compact binary
+# frames on a socket of their own, without any text encoding or HTTP
+# headers; every other procedure goes through the POST client. Arguments and
+# results have the same shape as in the other clients, except that DB must
+# be the numeric index of the database. With noreply the server does not
+# answer and the call returns None as soon as the frame is sent.
+class __BINARYPyTycoon(__POSTPyTycoon):
+  __sock = None
+  __fp = None
+  __sent = False
 
-  def __getBody(self, d, colenc=None):
-    if not d: return ""
+  def close(self):
+    self.__disconnect()
+    self.connection.close()
 
-    if colenc == ENCODE_TYPE["BASE64"]:
-      return "\n".join(map(lambda x: "{0}\t{1}".format(base64.b64encode(x[0]), base64.b64encode(x[1])), d.iteritems()))
-    elif colenc == ENCODE_TYPE["QUOTED_PRINTABLE"]:
-      return "\n".join(map(lambda x: "{0}\t{1}".format(quopri.encodestring(x[0]), quopri.encodestring(x[1])), d.iteritems()))
-    elif colenc == ENCODE_TYPE["URL"]:
-      return "\n".join(map(lambda x: "{0}\t{1}".format(urllib.quote(x[0]), urllib.quote(x[1])), d.iteritems()))
-    else:
-      return "\n".join(map(lambda x: "{0}\t{1}".format(x[0], x[1]), d.iteritems()))
-                       
-  def __getKeyValue(self, contentType, body):
-    if body == "": return None
-    d = {}
-    m = COLENC_MATCH.match(contentType)
-    if m is not None and m.groups()[0] == ENCODE_TYPE["BASE64"]:
-      d = dict([base64.b64decode(line).split("\t") for line in body.split("\n")])
-    elif m is not None and m.groups()[0] == ENCODE_TYPE["QUOTED_PRINTABLE"]:
-      d = dict([quopri.decodestring(line).split("\t") for line in body.split("\n")])
-    elif m is not None and m.groups()[0] == ENCODE_TYPE["URL"]:
-      d = dict([urllib.unquote(line).split("\t") for line in body.split("\n")])
-    else:
-      d = dict([line.split("\t") for line in body.split("\n")])
-    return d
+  def __disconnect(self):
+    if self.__sock is not None:
+      self.__fp.close()
+      self.__sock.close()
+      self.__sock = None
+      self.__fp = None
 
-  # /rpc/echo
-  # Echo back the input data as the output data, just for testing.
-  # input: (optional): arbitrary records.
-  # output: (optional): corresponding records to the input data.
-  # status code: 200.
-  def echo(self, d=None):
-    response = None
+  def __dbIndex(self, d):
     try:
-      self.connection.request("POST"
-                              ,"/rpc/echo"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("echo", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      return int(d.get("DB", 0))
+    except ValueError:
+      raise TycoonRequiredArgumentError()
 
-  # /rpc/report
-  # Get the report of the server information.
-  # output: (optional): arbitrary records.
-  # status code: 200.
-  def report(self):
-    response = None
+  def __call(self, funcName, data, noreply, reader):
+    attempt = 1
+    while True:
+      try:
+        return self.__attempt(funcName, data, noreply, reader)
+      except socket.error:
+        delay = self.retry and self.retry.delay(funcName, attempt, self.__sent)
+        if delay is None: raise
+        time.sleep(delay)
+        attempt += 1
+
+  def __attempt(self, funcName, data, noreply, reader):
+    self.__sent = False
     try:
-      self.connection.request("POST"
-                              ,"/rpc/report"
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("report", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-  
-  # /rpc/play_script
-  # Call a procedure of the script language extension.
+      if self.__sock is None:
+        self.__sock = socket.create_connection((self.connection.host, self.connection.port)
+                                               ,self.connection.timeout)
+        self.__fp = self.__sock.makefile("rb")
+      self.__sent = True
+      self.__sock.sendall(data)
+      if noreply: return None
+      magic = ord(self.__read(1))
+      if magic == BINARY_MAGIC["error"]:
+        raise RESPONSE_STATUS[funcName].get(450, TycoonUnexpectedStatusError)()
+      elif magic != BINARY_MAGIC[funcName]:
+        self.__disconnect()
+        raise TycoonUnexpectedStatusError()
+      return reader()
+    except TycoonBaseError:
+      raise
+    except:
+      self.__disconnect()
+      raise
+
+  def __read(self, size):
+    data = self.__fp.read(size)
+    if len(data) != size:
+      raise socket.error(errno.ECONNRESET, "connection closed by the server")
+    return data
+
+  def __readCount(self):
+    return {"num" : str(_BINARY_COUNT.unpack(self.__read(_BINARY_COUNT.size))[0])}
+
+  def __readRecords(self):
+    num = _BINARY_COUNT.unpack(self.__read(_BINARY_COUNT.size))[0]
+    records = {"num" : str(num)}
+    unpack = _BINARY_SET_RECORD.unpack
+    size = _BINARY_SET_RECORD.size
+    for i in xrange(num):
+      db, ksiz, vsiz, xt = unpack(self.__read(size))
+      kv = self.__read(ksiz + vsiz)
+      records["_" + kv[:ksiz]] = kv[ksiz:]
+    return records
+
+  def __readScriptRecords(self):
+    num = _BINARY_COUNT.unpack(self.__read(_BINARY_COUNT.size))[0]
+    if num == 0: return None
+    records = {}
+    unpack = _BINARY_SCRIPT_RECORD.unpack
+    size = _BINARY_SCRIPT_RECORD.size
+    for i in xrange(num):
+      ksiz, vsiz = unpack(self.__read(size))
+      kv = self.__read(ksiz + vsiz)
+      records["_" + kv[:ksiz]] = kv[ksiz:]
+    return records
+
+  def __keys(self, funcName, d, noreply):
+    db = self.__dbIndex(d)
+    pack = _BINARY_KEY_RECORD.pack
+    parts = []
+    for k in d:
+      if k[:1] == "_":
+        parts.append(pack(db, len(k) - 1))
+        parts.append(k[1:])
+    head = _BINARY_HEAD.pack(BINARY_MAGIC[funcName], noreply and BINARY_NOREPLY or 0, len(parts) / 2)
+    return head + "".join(parts)
+
+  # /rpc/set_bulk over the binary protocol.
+  # input: DB: (optional): the database index.
+  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
+  # input: (optional): arbitrary records whose keys trail the character "_".
+  # output: num: the number of stored reocrds.
+  def set_bulk(self, d=None, noreply=False):
+    d = d or {}
+    db = self.__dbIndex(d)
+    xt = int(d.get("xt", BINARY_NO_XT))
+    pack = _BINARY_SET_RECORD.pack
+    parts = []
+    for k, v in d.iteritems():
+      if k[:1] == "_":
+        parts.append(pack(db, len(k) - 1, len(v), xt))
+        parts.append(k[1:])
+        parts.append(v)
+    head = _BINARY_HEAD.pack(BINARY_MAGIC["set_bulk"], noreply and BINARY_NOREPLY or 0, len(parts) / 3)
+    return self.__call("set_bulk", head + "".join(parts), noreply, self.__readCount)
+
+  # /rpc/remove_bulk over the binary protocol.
+  # input: DB: (optional): the database index.
+  # input: (optional): arbitrary keys which trail the character "_".
+  # output: num: the number of removed reocrds.
+  def remove_bulk(self, d=None, noreply=False):
+    d = d or {}
+    return self.__call("remove_bulk", self.__keys("remove_bulk", d, noreply), noreply, self.__readCount)
+
+  # /rpc/get_bulk over the binary protocol.
+  # input: DB: (optional): the database index.
+  # input: (optional): arbitrary keys which trail "_".
+  # output: num: the number of retrieved reocrds.
+  # output: (optional): arbitrary keys which trail the character "_".
+  # views is accepted for compatibility; records are read one by one, so
+  # the values are always strings.
+  def get_bulk(self, d, views=False):
+    d = d or {}
+    return self.__call("get_bulk", self.__keys("get_bulk", d, False), False, self.__readRecords)
+
+  # /rpc/play_script over the binary protocol.
   # input: name: the name of the procedure to call.
   # input: (optional): arbitrary records whose keys trail the character "_".
   # output: (optional): arbitrary keys which trail the character "_".
-  # status code: 200, 450 (arbitrary logical error).
-  def play_script(self, d):
+  def play_script(self, d, noreply=False):
     if "name" not in d:
       raise TycoonRequiredArgumentError()
-    response = None
+    name = d["name"]
+    pack = _BINARY_SCRIPT_RECORD.pack
+    parts = []
+    for k, v in d.iteritems():
+      if k[:1] == "_":
+        parts.append(pack(len(k) - 1, len(v)))
+        parts.append(k[1:])
+        parts.append(v)
+    head = _BINARY_SCRIPT_HEAD.pack(BINARY_MAGIC["play_script"], noreply and BINARY_NOREPLY or 0
+                                    ,len(name), len(parts) / 3)
+    return self.__call("play_script", head + name + "".join(parts), noreply, self.__readScriptRecords)
+
+# Client for the RESTful interface of ktserver.
+# get, check, set, add, replace and remove act on the URL /<key>, or
+# /<DB>/<key>, with the value as the raw request or response body and the
+# expiration time in the X-Kt-Xt header, so values are never TSV encoded;
+# every other procedure goes through the POST client. Arguments and results
+# have the same shape as in the other clients. The value to store may be a
+# string, a buffer or memoryview, or a file object, which is streamed; get
+# streams the value into fp instead of returning it when fp is given.
+class __RESTPyTycoon(__POSTPyTycoon):
+  def __url(self, d):
+    if "key" not in d:
+      raise TycoonRequiredArgumentError()
+    url = "/" + urllib.quote(d["key"], "")
+    if d.get("DB") is not None:
+      url = "/" + urllib.quote(d["DB"], "") + url
+    return url
+
+  # The response of a request, retried as the RPC calls are, see _call. A
+  # file body is rewound for the retry, or not resent if it cannot be.
+  def __request(self, funcName, method, d, body=None, headers={}):
+    url = self.__url(d)
+    position = None
+    if hasattr(body, "read"):
+      try:
+        position = body.tell()
+      except (AttributeError, IOError):
+        pass
+    connection = self.connection
+    attempt = 1
+    while True:
+      sent = False
+      try:
+        if connection.sock is None:
+          connection.connect()
+        sent = True
+        connection.request(method, url, body, headers)
+        response = connection.getresponse()
+        break
+      except (socket.error, httplib.HTTPException):
+        connection.close()
+        delay = self.retry and self.retry.delay(funcName, attempt, sent)
+        if delay is None: raise
+        if sent and hasattr(body, "read"):
+          if position is None: raise
+          body.seek(position)
+        time.sleep(delay)
+        attempt += 1
+    exception = REST_STATUS[funcName].get(response.status, TycoonUnexpectedStatusError)
+    if exception is None:
+      return response
+    response.read()
+    response.close()
+    raise exception(response.reason)
+
+  def __store(self, funcName, d, mode):
+    if "value" not in d:
+      raise TycoonRequiredArgumentError()
+    headers = {"X-Kt-Mode" : mode}
+    if d.get("xt") is not None:
+      xt = int(d["xt"])
+      if xt < 0:
+        headers["X-Kt-Xt"] = email.utils.formatdate(-xt, usegmt=True)
+      else:
+        headers["X-Kt-Xt"] = str(xt)
+    value = d["value"]
+    if hasattr(value, "read"):
+      headers["Content-Length"] = str(self.__remaining(value))
+    self.__request(funcName, "PUT", d, value, headers).read()
+
+  def __remaining(self, fp):
     try:
-      self.connection.request("POST"
-                              ,"/rpc/play_script"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("play_script", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/status
-  # Get the miscellaneous status information of a database.
-  # input: DB: (optional): the database identifier.
-  # output: count: the number of records.
-  # output: size: the size of the database file.
-  # output: (optional): arbitrary records for other information.
-  # status code: 200.
-  def status(self, d=None):
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/status"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("status", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/clear
-  # Remove all records in a database.
-  # input: DB: (optional): the database identifier.
-  # status code: 200.
-  def clear(self, d=None):
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/clear"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("clear", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/synchronize
-  # Synchronize updated contents with the file and the device.
-  # input: DB: (optional): the database identifier.
-  # input: hard: (optional): for physical synchronization with the device.
-  # input: command: (optional): the command name to process the database file.
-  # status code: 200, 450 (the postprocessing command failed).
-  def synchronize(self, d=None):
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/synchronize"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("synchronize", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/set
-  # Set the value of a record.
+      return os.fstat(fp.fileno()).st_size - fp.tell()
+    except (AttributeError, IOError, OSError):
+      position = fp.tell()
+      fp.seek(0, 2)
+      size = fp.tell() - position
+      fp.seek(position)
+      return size
+
+  def __result(self, response):
+    r = {}
+    xt = response.getheader("x-kt-xt")
+    if xt is not None:
+      if not xt.isdigit():
+        xt = str(email.utils.mktime_tz(email.utils.parsedate_tz(xt)))
+      r["xt"] = xt
+    return r
+
+  # /<key> GET
+  # Retrieve the value of a record.
   # input: DB: (optional): the database identifier.
   # input: key: the key of the record.
-  # input: value: the value of the record.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # status code: 200.
-  def set(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/set"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("set", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/add
-  # Add a record.
+  # output: value: (optional): the value of the record, unless fp is given.
+  # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
+  # fp: (optional): a file object the value is written to in chunks.
+  # views is accepted for compatibility; the value is read as a string.
+  def get(self, d, views=False, fp=None, chunk_size=DEFAULT_REST_CHUNK):
+    response = self.__request("get", "GET", d)
+    r = self.__result(response)
+    if fp is None:
+      r["value"] = response.read()
+    else:
+      while True:
+        data = response.read(chunk_size)
+        if not data: break
+        fp.write(data)
+    return r
+
+  # /<key> HEAD
+  # Check the existence of a record without retrieving its value.
   # input: DB: (optional): the database identifier.
   # input: key: the key of the record.
-  # input: value: the value of the record.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # status code: 200, 450 (existing record was detected).
-  def add(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/add"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("add", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/replace
-  # Replace the value of a record.
+  # output: vsiz: the size of the value.
+  # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
+  def check(self, d):
+    response = self.__request("check", "HEAD", d)
+    response.read()
+    r = self.__result(response)
+    r["vsiz"] = response.getheader("content-length", "0")
+    return r
+
+  # /<key> PUT
   # input: DB: (optional): the database identifier.
   # input: key: the key of the record.
   # input: value: the value of the record.
   # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # status code: 200, 450 (no record was corresponding).
-  def replace(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/replace"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("replace", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  def set(self, d, colenc=None):
+    self.__store("set", d, "set")
 
-  # /rpc/append
-  # Append the value of a record.
-  # input: DB: (optional): the database identifier.
-  # input: key: the key of the record.
-  # input: value: the value of the record.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # status code: 200.
-  def append(self, d):
-    if "key" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/append"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("append", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())    
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  def add(self, d, colenc=None):
+    self.__store("add", d, "add")
 
-  # /rpc/increment
-  # Add a number to the numeric integer value of a record.
-  # input: DB: (optional): the database identifier.
-  # input: key: the key of the record.
-  # input: num: the additional number.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # output: num: the result value.
-  # status code: 200, 450 (the existing record was not compatible).
-  def increment(self, d):
-    if "key" not in d or "num" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/increment"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("increment", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  def replace(self, d, colenc=None):
+    self.__store("replace", d, "replace")
 
-  # /rpc/increment_double
-  # Add a number to the numeric double value of a record.
+  # /<key> DELETE
+  # Remove a record.
   # input: DB: (optional): the database identifier.
   # input: key: the key of the record.
-  # input: num: the additional number.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # output: num: the result value.
-  # status code: 200, 450 (the existing record was not compatible).
-  def increment_double(self, d):
-    if "key" not in d or "num" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
+  def remove(self, d, colenc=None):
+    self.__request("remove", "DELETE", d).read()
+
+@contextlib.contextmanager
+def _borrow(client):
+  yield client
+
+def _formatRequest(host, method, url, body, headers):
+  lines = ["{0} {1} HTTP/1.1".format(method, url)
+           ,"Host: {0}".format(host)
+           ,"Accept-Encoding: identity"]
+  if body is not None:
+    lines.append("Content-Length: {0}".format(len(body)))
+  for k, v in headers.iteritems():
+    lines.append("{0}: {1}".format(k, v))
+  lines.append("")
+  lines.append(body or "")
+  return "\r\n".join(lines)
+
+# Stands in for the socket of an httplib.HTTPResponse so that consecutive
+# responses can be parsed from one buffered file object without closing it.
+class _PipelineSocket(object):
+  def __init__(self, fp):
+    self.fp = fp
+
+  def makefile(self, mode, bufsize=None):
+    return self
+
+  def read(self, amt=-1):
+    return self.fp.read(amt)
+
+  def readline(self, limit=-1):
+    return self.fp.readline(limit)
+
+  def close(self):
+    pass
+
+# HTTP/1.1 request pipelining.
+# Calls are queued by name, written back-to-back on one keep-alive connection
+# by execute() and their responses are matched in order. execute() returns
+# the results in call order; a call the server rejected yields the same
+# exception instance the plain method would have raised. The first of them
+# is raised after all responses are read unless raise_on_error is False.
+class _PyTycoonPipeline(object):
+  # requests larger than this are written from a separate thread, so the
+  # server never blocks on a full socket buffer while we are still sending.
+  INLINE_WRITE_SIZE = 65536
+
+  def __init__(self, checkout):
+    self.__checkout = checkout
+    self.__calls = []
+    # functions called as observer(name, d) for every call once execute()
+    # is over, e.g. to invalidate a cache.
+    self.observers = []
+
+  def __len__(self):
+    return len(self.__calls)
+
+  def __getattr__(self, name):
+    if name not in RESPONSE_STATUS:
+      raise AttributeError(name)
+    def call(d=None):
+      for arg in REQUIRED_ARGUMENTS.get(name, ()):
+        if not d or arg not in d:
+          raise TycoonRequiredArgumentError()
+      self.__calls.append((name, d))
+    return call
+
+  def execute(self, raise_on_error=True):
+    calls, self.__calls = self.__calls, []
+    if not calls: return []
+    with self.__checkout() as client:
+      connection = client.connection
+      host = "{0}:{1}".format(connection.host, connection.port)
+      data = "".join([_formatRequest(host, *client._encodeRequest(_PROCEDURES[name], d))
+                      for name, d in calls])
+      try:
+        if connection.sock is None:
+          connection.connect()
+        results = self.__communicate(client, connection.sock, calls, data)
+      except:
+        connection.close()
+        raise
+      finally:
+        for observer in self.observers:
+          for name, d in calls:
+            observer(name, d)
+    if raise_on_error:
+      for result in results:
+        if isinstance(result, TycoonBaseError): raise result
+    return results
+
+  def __communicate(self, client, sock, calls, data):
+    writer = None
+    if len(data) <= self.INLINE_WRITE_SIZE:
+      sock.sendall(data)
+    else:
+      failure = []
+      def write():
+        try:
+          sock.sendall(data)
+        except Exception, e:
+          failure.append(e)
+      writer = threading.Thread(target=write)
+      writer.daemon = True
+      writer.start()
+    fp = _PipelineSocket(sock.makefile("rb"))
+    results = []
     try:
-      self.connection.request("POST"
-                              ,"/rpc/increment_double"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("increment_double", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-    
-  # /rpc/cas
-  # Perform compare-and-swap.
-  # input: DB: (optional): the database identifier.
-  # input: key: the key of the record.
-  # input: oval: (optional): the old value. If it is omittted, no record is meant.
-  # input: nval: (optional): the new value. If it is omittted, the record is removed.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # status code: 200, 450 (the old value assumption was failed).
-  def cas(self, d):
-    if "key" not in d:
+      for name, d in calls:
+        response = httplib.HTTPResponse(fp)
+        response.begin()
+        try:
+          results.append(client._decodeResponse(_PROCEDURES[name], response))
+        except TycoonBaseError, e:
+          results.append(e)
+        if response.will_close and len(results) < len(calls):
+          raise httplib.BadStatusLine("connection closed by the server")
+    finally:
+      if writer is not None:
+        writer.join()
+        if failure: raise failure[0]
+    return results
+
+# Buffer of set and remove calls written to the server in bulk.
+# set and remove take the same arguments as the methods of the client, but
+# only record the operation, keeping the last one for every key, and return
+# at once. A background thread writes the operations with set_many and
+# remove_many, one call per database and xt, whenever max_count keys or
+# max_size bytes are pending and at least every interval seconds; writers
+# block while twice as much is pending. flush() writes the pending
+# operations before returning and close() flushes and stops the thread.
+# Operations which could not be written stay in the buffer to be written by
+# the next flush, and the error is raised by flush(), close() or, for errors
+# of the background thread, by the next set or remove.
+class _WriteBehindBuffer(object):
+  def __init__(self, client, max_count=DEFAULT_BULK_COUNT, max_size=DEFAULT_BULK_SIZE
+               ,interval=DEFAULT_FLUSH_INTERVAL, workers=1):
+    self.__client = client
+    self.__maxCount = max_count
+    self.__maxSize = max_size
+    self.__interval = interval
+    self.__workers = workers
+    self.__cond = threading.Condition(threading.Lock())
+    self.__flushLock = threading.Lock()
+    self.__pending = {}
+    self.__size = 0
+    self.__error = None
+    self.__closed = False
+    self.__thread = threading.Thread(target=self.__run)
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+  def __len__(self):
+    return len(self.__pending)
+
+  def set(self, d):
+    if not d or "key" not in d or "value" not in d:
       raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/cas"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cas", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+    self.__put((d.get("DB"), d["key"]), (d["value"], d.get("xt")))
 
-  # /rpc/remove
-  # Remove a record.
-  # input: DB: (optional): the database identifier.
-  # input: key: the key of the record.
-  # status code: 200, 450 (no record was found).
   def remove(self, d):
-    if "key" not in d: 
+    if not d or "key" not in d:
       raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/remove"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("remove", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+    self.__put((d.get("DB"), d["key"]), (None, None))
 
-  # /rpc/get
-  # Retrieve the value of a record.
-  # input: DB: (optional): the database identifier.
-  # input: key: the key of the record.
-  # output: value: (optional): the value of the record.
-  # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
-  # status code: 200, 450 (no record was found).
-  def get(self, d):
-    if "key" not in d: 
-      raise TycoonRequiredArgumentError()
-    response = None
+  def flush(self):
+    self.__flushLock.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/get"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("get", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      self.__cond.acquire()
+      try:
+        pending, self.__pending = self.__pending, {}
+        self.__size = 0
+        self.__cond.notifyAll()
+      finally:
+        self.__cond.release()
+      self.__write(pending)
+    finally:
+      self.__flushLock.release()
 
-  # /rpc/set_bulk
-  # Store records at once.
-  # input: DB: (optional): the database identifier.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # input: (optional): arbitrary records whose keys trail the character "_".
-  # output: num: the number of stored reocrds.
-  # status code: 200.
-  def set_bulk(self, d=None):
-    response = None
+  def close(self):
+    self.__cond.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/set_bulk"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("set_bulk", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/remove_bulk
-  # Store records at once.
-  # input: DB: (optional): the database identifier.
-  # input: (optional): arbitrary keys which trail the character "_".
-  # output: num: the number of removed reocrds.
-  # status code: 200.
-  def remove_bulk(self, d=None):
-    response = None
+      if self.__closed: return
+      self.__closed = True
+      self.__cond.notifyAll()
+    finally:
+      self.__cond.release()
+    self.__thread.join()
+    self.flush()
+
+  def __put(self, op, record):
+    self.__cond.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/remove_bulk"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("remove_bulk", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      if self.__closed:
+        raise TycoonClosedError()
+      if self.__error is not None:
+        e, self.__error = self.__error, None
+        raise e
+      self.__add(op, record)
+      if self.__isFull(1):
+        self.__cond.notifyAll()
+        while self.__isFull(2) and not self.__closed:
+          self.__cond.wait()
+    finally:
+      self.__cond.release()
+
+  # Called with the condition held.
+  def __add(self, op, record):
+    old = self.__pending.get(op)
+    if old is not None:
+      self.__size -= len(op[1]) + len(old[0] or "")
+    self.__pending[op] = record
+    self.__size += len(op[1]) + len(record[0] or "")
+
+  def __isFull(self, factor):
+    return len(self.__pending) >= self.__maxCount * factor or self.__size >= self.__maxSize * factor
+
+  def __run(self):
+    while True:
+      self.__cond.acquire()
+      try:
+        deadline = time.time() + self.__interval
+        while not self.__closed and not self.__isFull(1):
+          remaining = deadline - time.time()
+          if remaining <= 0: break
+          self.__cond.wait(remaining)
+        if self.__closed: return
+      finally:
+        self.__cond.release()
+      try:
+        self.flush()
+      except Exception, e:
+        self.__cond.acquire()
+        try:
+          self.__error = e
+        finally:
+          self.__cond.release()
+
+  def __write(self, pending):
+    if not pending: return
+    sets = {}
+    removes = {}
+    for (db, key), (value, xt) in pending.iteritems():
+      if value is None:
+        removes.setdefault(db, []).append(key)
+      else:
+        sets.setdefault((db, xt), {})[key] = value
+    error = None
+    failed = []
+    with self.__client._spawn() as client:
+      for (db, xt), records in sets.iteritems():
+        try:
+          client.set_many(records, db, xt, self.__maxCount, self.__maxSize, self.__workers)
+        except TycoonBulkError, e:
+          error = error or e
+          failed.extend(((db, k[1:]), (v, xt)) for chunk, ce in e.errors
+                        for k, v in chunk.iteritems() if k[:1] == "_")
+        except Exception, e:
+          error = error or e
+          failed.extend(((db, k), (v, xt)) for k, v in records.iteritems())
+      for db, keys in removes.iteritems():
+        try:
+          client.remove_many(keys, db, self.__maxCount, self.__maxSize, self.__workers)
+        except TycoonBulkError, e:
+          error = error or e
+          failed.extend(((db, k[1:]), (None, None)) for chunk, ce in e.errors
+                        for k in chunk if k[:1] == "_")
+        except Exception, e:
+          error = error or e
+          failed.extend(((db, k), (None, None)) for k in keys)
+    if error is not None:
+      self.__cond.acquire()
+      try:
+        for op, record in failed:
+          if op not in self.__pending:
+            self.__add(op, record)
+      finally:
+        self.__cond.release()
+      raise error
+
+# Operations run by the server in order within a single play_script call
+# of SCRIPT_BATCH_PROCEDURE, from the procedure library bundled with the
+# package as pytycoon.lua (ktserver -scr pytycoon.lua). The operations of
+# SCRIPT_BATCH_OPERATIONS take the same arguments as the methods of the
+# client, except DB, which is given for the whole batch, and execute()
+# returns their results in the same order and shape: None, or the records
+# the method would have returned. An operation failing does not stop the
+# ones after it; its result is the exception the method would have raised,
+# and with raise_on_error the first one is raised once the call is over.
+# Every operation is atomic, but the batch as a whole is not: use cas to
+# make a write depend on a value read before.
+#   batch = tycoon.batch()
+#   batch.get({"key" : "hoge"})
+#   batch.cas({"key" : "hoge", "oval" : "hage", "nval" : "hige"})
+#   batch.increment({"key" : "count", "num" : "1"})
+#   r, swapped, count = batch.execute()
+# Besides, vget and vcas are run as by the methods of the client.
+class _ScriptBatch(object):
+  RESULTS = ("value", "num", "xt", "version")
+
+  def __init__(self, client, db=None):
+    self.__client = client
+    self.__db = db
+    self.__ops = []
+
+  def __len__(self):
+    return len(self.__ops)
+
+  def __getattr__(self, name):
+    if name not in SCRIPT_BATCH_OPERATIONS:
+      raise AttributeError(name)
+    def call(d):
+      for arg in REQUIRED_ARGUMENTS.get(name, ()):
+        if not d or arg not in d:
+          raise TycoonRequiredArgumentError()
+      self.__ops.append((name, d))
+    return call
+
+  def execute(self, raise_on_error=True):
+    ops, self.__ops = self.__ops, []
+    if not ops: return []
+    d = {"name" : SCRIPT_BATCH_PROCEDURE
+         ,"_n" : str(len(ops))}
+    if self.__db is not None:
+      d["_DB"] = self.__db
+    for i, (name, args) in enumerate(ops):
+      d["_{0}.op".format(i)] = name
+      for k, v in args.iteritems():
+        if k != "DB":
+          d["_{0}.{1}".format(i, k)] = v
+    r = self.__client.play_script(d) or {}
+    results = []
+    for i, (name, args) in enumerate(ops):
+      prefix = "_{0}.".format(i)
+      status = r.get(prefix + "status")
+      if status == "ok":
+        result = dict((field, r[prefix + field]) for field in self.RESULTS if prefix + field in r)
+        results.append(result or None)
+      else:
+        try:
+          error = (SCRIPT_BATCH_STATUS.get(name) or RESPONSE_STATUS[name]).get(int(status)
+                                                                              ,TycoonUnexpectedStatusError)
+        except (TypeError, ValueError):
+          error = TycoonUnexpectedStatusError
+        results.append(error(r.get(prefix + "error", status)))
+    if raise_on_error:
+      for result in results:
+        if isinstance(result, TycoonBaseError): raise result
+    return results
+
+class _PoolEntry(object):
+  __slots__ = ("client", "created", "released", "generation")
+
+  def __init__(self, client, generation):
+    self.client = client
+    self.created = time.time()
+    self.released = self.created
+    self.generation = generation
+
+# Thread-safe client keeping a bounded pool of keep-alive connections.
+# Every RPC method of the underlying client type is available and checks a
+# connection out for the duration of one call. Idle connections are closed
+# after idle_timeout seconds, and any connection older than max_lifetime
+# seconds is recycled when it is returned to the pool.
+class _PooledPyTycoon(_PyTycoonHelpers):
+  def __init__(self, connect, size, timeout=None
+               ,idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT, max_lifetime=DEFAULT_POOL_MAX_LIFETIME):
+    self.__connect = connect
+    self.__size = size
+    self.__timeout = timeout
+    self.__idleTimeout = idle_timeout
+    self.__maxLifetime = max_lifetime
+    self.__cond = threading.Condition(threading.Lock())
+    self.__idle = []
+    self.__active = 0
+    self.__generation = 0
+    self.__local = threading.local()
 
-  # /rpc/get_bulk
-  # Retrieve records at once.
-  # input: DB: (optional): the database identifier.
-  # input: (optional): arbitrary keys which trail "_".
-  # output: num: the number of retrieved reocrds.
-  # output: (optional): arbitrary keys which trail the character "_".
-  # status code: 200.
-  def get_bulk(self, d):
-    response = None
+  def close(self):
+    self.__cond.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/get_bulk"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("get_bulk", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
-
-  # /rpc/vacuum
-  # Scan the database and eliminate regions of expired records.
-  # input: DB: (optional): the database identifier.
-  # input: step: (optional): the number of steps. If it is omitted or not more than 0, the whole region is scanned.
-  # status code: 200.  
-  def vacuum(self, d=None):
-    response = None
+      idle, self.__idle = self.__idle, []
+      self.__active -= len(idle)
+      self.__generation += 1
+      self.__cond.notifyAll()
+    finally:
+      self.__cond.release()
+    for entry in idle:
+      entry.client.close()
+
+  # Pin a connection to the calling thread for the duration of a with block.
+  # Every call made by that thread inside the block, including the cursor
+  # procedures whose CUR identifiers are bound to one server session, goes
+  # through the same connection.
+  #   with tycoon.connection() as t:
+  #     t.cur_jump({"CUR" : "1"})
+  @contextlib.contextmanager
+  def connection(self):
+    entry = getattr(self.__local, "entry", None)
+    if entry is not None:
+      yield entry.client
+      return
+    entry = self.__checkout()
+    self.__local.entry = entry
     try:
-      self.connection.request("POST"
-                              ,"/rpc/vacuum"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("vacuum", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      yield entry.client
+    except TycoonBaseError:
+      self.__local.entry = None
+      self.__checkin(entry)
+      raise
+    except:
+      self.__local.entry = None
+      self.__discard(entry)
+      raise
+    self.__local.entry = None
+    self.__checkin(entry)
+
+  # Queue calls and send them back-to-back on one pooled connection.
+  # See _RpcPyTycoon.pipeline.
+  def pipeline(self):
+    return _PyTycoonPipeline(self.connection)
+
+  def _spawn(self):
+    return _borrow(self)
+
+  def _session(self):
+    return self.connection()
+
+  def __getattr__(self, name):
+    if name not in RESPONSE_STATUS and name not in REST_STATUS:
+      raise AttributeError(name)
+    def call(*args, **kwargs):
+      return self.__invoke(name, args, kwargs)
+    return call
+
+  def __invoke(self, name, args, kwargs):
+    entry = getattr(self.__local, "entry", None)
+    if entry is not None:
+      return getattr(entry.client, name)(*args, **kwargs)
+    entry = self.__checkout()
+    try:
+      result = getattr(entry.client, name)(*args, **kwargs)
+    except TycoonBaseError:
+      # the server answered, so the connection is still in a usable state.
+      self.__checkin(entry)
+      raise
+    except:
+      self.__discard(entry)
+      raise
+    self.__checkin(entry)
+    return result
+
+  def __checkout(self):
+    deadline = None
+    if self.__timeout is not None:
+      deadline = time.time() + self.__timeout
+    expired = []
+    self.__cond.acquire()
+    try:
+      while True:
+        now = time.time()
+        expired.extend(self.__evict(now))
+        if self.__idle:
+          return self.__idle.pop()
+        if self.__active < self.__size:
+          self.__active += 1
+          break
+        if deadline is None:
+          self.__cond.wait()
+        elif now >= deadline:
+          raise TycoonPoolTimeoutError()
+        else:
+          self.__cond.wait(deadline - now)
+    finally:
+      self.__cond.release()
+      for entry in expired:
+        entry.client.close()
+    try:
+      return _PoolEntry(self.__connect(), self.__generation)
+    except:
+      self.__release()
+      raise
+
+  def __checkin(self, entry):
+    now = time.time()
+    expired = []
+    self.__cond.acquire()
+    try:
+      expired.extend(self.__evict(now))
+      if entry.generation == self.__generation and not self.__isExpired(entry, now):
+        entry.released = now
+        self.__idle.append(entry)
+        self.__cond.notify()
+        return
+    finally:
+      self.__cond.release()
+      for expiredEntry in expired:
+        expiredEntry.client.close()
+    self.__discard(entry)
+
+  # Take every expired connection off the idle stack, wherever it sits, and
+  # return them to be closed once the lock is released. Called with the lock
+  # held.
+  def __evict(self, now):
+    expired = [entry for entry in self.__idle if self.__isExpired(entry, now)]
+    if expired:
+      self.__idle = [entry for entry in self.__idle if not self.__isExpired(entry, now)]
+      self.__active -= len(expired)
+      self.__cond.notifyAll()
+    return expired
+
+  def __discard(self, entry):
+    try:
+      entry.client.close()
+    finally:
+      self.__release()
 
-  # /rpc/cur_jump
-  # Jump the cursor to the first record for forward scan.
-  # input: DB: (optional): the database identifier.
-  # input: CUR: the cursor identifier.
-  # input: key: (optional): the key of the destination record. If it is omitted, the first record is specified.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_jump(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
+  def __release(self):
+    self.__cond.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_jump"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_jump_back", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      self.__active -= 1
+      self.__cond.notify()
+    finally:
+      self.__cond.release()
+
+  def __isExpired(self, entry, now):
+    if self.__maxLifetime is not None and now - entry.created > self.__maxLifetime:
+      return True
+    if self.__idleTimeout is not None and now - entry.released > self.__idleTimeout:
+      return True
+    return False
+
+# Result of an asynchronous call.
+class _AsyncResult(object):
+  def __init__(self):
+    self.__event = threading.Event()
+    self.__lock = threading.Lock()
+    self.__callbacks = []
+    self.__result = None
+    self.__exception = None
+
+  def done(self):
+    return self.__event.isSet()
+
+  # Wait for the call and return its records, or raise the exception the
+  # synchronous method would have raised.
+  def result(self, timeout=None):
+    if not self.__event.wait(timeout) and not self.__event.isSet():
+      raise socket.timeout()
+    if self.__exception is not None:
+      raise self.__exception
+    return self.__result
+
+  def exception(self, timeout=None):
+    if not self.__event.wait(timeout) and not self.__event.isSet():
+      raise socket.timeout()
+    return self.__exception
+
+  # fn(future) is called once the call completes, on the loop thread.
+  def add_done_callback(self, fn):
+    self.__lock.acquire()
+    try:
+      if not self.__event.isSet():
+        self.__callbacks.append(fn)
+        return
+    finally:
+      self.__lock.release()
+    fn(self)
+
+  def _set(self, result=None, exception=None):
+    self.__lock.acquire()
+    try:
+      if self.__event.isSet(): return
+      self.__result = result
+      self.__exception = exception
+      self.__event.set()
+      callbacks, self.__callbacks = self.__callbacks, []
+    finally:
+      self.__lock.release()
+    for fn in callbacks:
+      fn(self)
+
+# A complete response held in memory, read through the subset of the
+# httplib.HTTPResponse interface the clients' _decodeResponse relies on.
+class _BufferedResponse(object):
+  def __init__(self, status, headers, body):
+    self.status = status
+    self.headers = headers
+    self.body = body
+
+  def getheader(self, name, default=None):
+    return self.headers.get(name.lower(), default)
+
+  def read(self):
+    body, self.body = self.body, ""
+    return body
 
-  # /rpc/cur_jump_back
-  # Jump the cursor to a record for forward scan.
-  # input: DB: (optional): the database identifier.
-  # input: CUR: the cursor identifier.
-  # input: key: (optional): the key of the destination record. If it is omitted, the last record is specified.
-  # status code: 200, 450 (cursor is invalidated), 501 (not implemented).
-  def cur_jump_back(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
+  def close(self):
+    pass
+
+# Incremental parser for one HTTP/1.1 response.
+class _ResponseParser(object):
+  def __init__(self):
+    self.__buffer = ""
+    self.__length = None
+    self.status = None
+    self.headers = None
+    self.will_close = False
+
+  # Returns the _BufferedResponse once all of it has been fed, else None.
+  def feed(self, data):
+    self.__buffer += data
+    if self.headers is None:
+      end = self.__buffer.find("\r\n\r\n")
+      if end < 0: return None
+      head, self.__buffer = self.__buffer[:end], self.__buffer[end + 4:]
+      lines = head.split("\r\n")
+      version, status = lines[0].split(" ", 2)[:2]
+      self.status = int(status)
+      self.headers = {}
+      for line in lines[1:]:
+        name, value = line.split(":", 1)
+        self.headers[name.strip().lower()] = value.strip()
+      if "chunked" in self.headers.get("transfer-encoding", ""):
+        raise httplib.UnknownTransferEncoding()
+      self.will_close = (self.headers.get("connection", "").lower() == "close"
+                         or version == "HTTP/1.0")
+      if "content-length" in self.headers:
+        self.__length = int(self.headers["content-length"])
+      elif self.status in (204, 304):
+        self.__length = 0
+    if self.__length is not None and len(self.__buffer) >= self.__length:
+      return _BufferedResponse(self.status, self.headers, self.__buffer[:self.__length])
+    return None
+
+  # The server closed the connection; returns the response if its body was
+  # delimited by the close, else None.
+  def finish(self):
+    if self.headers is not None and self.__length is None:
+      self.will_close = True
+      return _BufferedResponse(self.status, self.headers, self.__buffer)
+    return None
+
+class _AsyncCall(object):
+  __slots__ = ("name", "data", "future", "deadline")
+
+  def __init__(self, name, data, future, deadline):
+    self.name = name
+    self.data = data
+    self.future = future
+    self.deadline = deadline
+
+class _AsyncConnection(asyncore.dispatcher):
+  def __init__(self, owner, address, socketMap):
+    asyncore.dispatcher.__init__(self, map=socketMap)
+    self.owner = owner
+    self.call = None
+    self.out = ""
+    self.parser = None
+    self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.connect(address)
+
+  def start(self, call):
+    self.call = call
+    self.out = call.data
+    self.parser = _ResponseParser()
+
+  def readable(self):
+    return True
+
+  def writable(self):
+    return bool(self.out) or not self.connected
+
+  def handle_connect(self):
+    pass
+
+  def handle_write(self):
+    sent = self.send(self.out)
+    self.out = self.out[sent:]
+
+  def handle_read(self):
+    data = self.recv(65536)
+    if self.call is None or not data: return
+    response = self.parser.feed(data)
+    if response is not None:
+      self.owner._complete(self, response)
+
+  def handle_close(self):
     response = None
+    if self.call is not None:
+      response = self.parser.finish()
+    if response is not None:
+      self.owner._complete(self, response)
+    else:
+      self.owner._fail(self, socket.error(errno.ECONNRESET, "connection closed by the server"))
+
+  def handle_error(self):
+    self.owner._fail(self, sys.exc_info()[1])
+
+# See open_async.
+class _AsyncPyTycoon(object):
+  TICK = 0.05
+
+  def __init__(self, codec, host, port, timeout, size):
+    self.__codec = codec
+    self.__address = (host, port)
+    self.__host = "{0}:{1}".format(host, port)
+    self.__timeout = timeout
+    self.__size = size
+    self.__map = {}
+    self.__lock = threading.Lock()
+    self.__pending = collections.deque()
+    self.__idle = []
+    self.__busy = set()
+    self.__closed = False
+    self.__wakeRead, self.__wakeWrite = os.pipe()
+    waker = asyncore.file_dispatcher(self.__wakeRead, map=self.__map)
+    waker.handle_read = lambda: os.read(self.__wakeRead, 4096)
+    waker.writable = lambda: False
+    self.__thread = threading.Thread(target=self.__loop)
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  # Stop the loop; calls still queued or in flight fail with
+  # TycoonClosedError.
+  def close(self):
+    self.__lock.acquire()
+    try:
+      if self.__closed: return
+      self.__closed = True
+    finally:
+      self.__lock.release()
+    os.write(self.__wakeWrite, "x")
+    self.__thread.join()
+    os.close(self.__wakeWrite)
+    os.close(self.__wakeRead)
+
+  def __getattr__(self, name):
+    if name not in RESPONSE_STATUS:
+      raise AttributeError(name)
+    def call(d=None):
+      return self.__submit(name, d)
+    return call
+
+  def __submit(self, name, d):
+    for arg in REQUIRED_ARGUMENTS.get(name, ()):
+      if not d or arg not in d:
+        raise TycoonRequiredArgumentError()
+    data = _formatRequest(self.__host, *self.__codec._encodeRequest(_PROCEDURES[name], d))
+    future = _AsyncResult()
+    deadline = None
+    if self.__timeout is not None:
+      deadline = time.time() + self.__timeout
+    # the wake-up write stays under the lock, as close() closes the pipe once
+    # it has set the flag; a call queued before is failed by __shutdown.
+    self.__lock.acquire()
+    try:
+      if self.__closed: raise TycoonClosedError()
+      self.__pending.append(_AsyncCall(name, data, future, deadline))
+      os.write(self.__wakeWrite, "x")
+    finally:
+      self.__lock.release()
+    return future
+
+  def __loop(self):
+    try:
+      while not self.__closed:
+        self.__dispatch()
+        asyncore.loop(timeout=self.TICK, map=self.__map, count=1)
+        self.__expire()
+    finally:
+      self.__shutdown()
+
+  def __dispatch(self):
+    while True:
+      self.__lock.acquire()
+      try:
+        if not self.__pending: return
+        if not self.__idle and len(self.__busy) >= self.__size: return
+        call = self.__pending.popleft()
+      finally:
+        self.__lock.release()
+      if self.__idle:
+        connection = self.__idle.pop()
+      else:
+        try:
+          connection = _AsyncConnection(self, self.__address, self.__map)
+        except Exception, e:
+          call.future._set(exception=e)
+          continue
+      self.__busy.add(connection)
+      connection.start(call)
+
+  def __expire(self):
+    now = time.time()
+    for connection in list(self.__busy):
+      if connection.call.deadline is not None and connection.call.deadline < now:
+        self._fail(connection, socket.timeout())
+    self.__lock.acquire()
+    try:
+      while self.__pending and self.__pending[0].deadline is not None and self.__pending[0].deadline < now:
+        self.__pending.popleft().future._set(exception=socket.timeout())
+    finally:
+      self.__lock.release()
+
+  def _complete(self, connection, response):
+    call = connection.call
+    connection.call = None
+    self.__busy.discard(connection)
+    if connection.parser.will_close:
+      connection.close()
+    else:
+      self.__idle.append(connection)
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_jump_back"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_jump_back", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
+      call.future._set(result=self.__codec._decodeResponse(_PROCEDURES[call.name], response))
     except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      call.future._set(exception=e)
+    self.__dispatch()
+
+  def _fail(self, connection, exception):
+    call = connection.call
+    connection.call = None
+    connection.close()
+    self.__busy.discard(connection)
+    if connection in self.__idle:
+      self.__idle.remove(connection)
+    if call is not None:
+      call.future._set(exception=exception)
+
+  def __shutdown(self):
+    for connection in list(self.__busy):
+      self._fail(connection, TycoonClosedError())
+    for connection in self.__idle:
+      connection.close()
+    self.__idle = []
+    self.__lock.acquire()
+    try:
+      pending, self.__pending = self.__pending, collections.deque()
+    finally:
+      self.__lock.release()
+    for call in pending:
+      call.future._set(exception=TycoonClosedError())
+    for dispatcher in self.__map.values():
+      dispatcher.close()
+
+# Byte-bounded LRU store of get results, shared by a cached client and the
+# clients it spawns for other threads. Entries are indexed by record key
+# alone: a database may be named by its name or index, so a write through
+# either spelling must drop the record whichever spelling it was read with.
+class _RecordCache(object):
+  PREV, NEXT, KEY, DB, VALUE, EXPIRES, SIZE = range(7)
+
+  def __init__(self, max_size, max_age=None):
+    self.max_size = max_size
+    self.max_age = max_age
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.version = 0
+    self.__lock = threading.Lock()
+    self.__entries = {}
+    self.__root = []
+    self.__clear()
+
+  def stats(self):
+    return {"hits" : self.hits
+            ,"misses" : self.misses
+            ,"evictions" : self.evictions
+            ,"count" : len(self.__entries)
+            ,"size" : self.size}
+
+  def lookup(self, db, key, now):
+    self.__lock.acquire()
+    try:
+      entry = self.__entries.get(key)
+      if entry is not None and entry[self.EXPIRES] is not None and entry[self.EXPIRES] <= now:
+        self.__unlink(entry)
+        entry = None
+      if entry is None or entry[self.DB] != db:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self.__unlink(entry)
+      self.__link(entry)
+      return entry[self.VALUE]
+    finally:
+      self.__lock.release()
+
+  # Records fetched before an invalidation, i.e. under an older version, are
+  # not stored since they might be stale already.
+  def store(self, db, key, value, expires, version):
+    size = len(key) + len(value.get("value", "")) + CACHE_ENTRY_OVERHEAD
+    if size > self.max_size: return
+    self.__lock.acquire()
+    try:
+      if version != self.version: return
+      entry = self.__entries.get(key)
+      if entry is not None:
+        self.__unlink(entry)
+      self.__link([None, None, key, db, value, expires, size])
+      while self.size > self.max_size:
+        self.__unlink(self.__root[self.PREV])
+        self.evictions += 1
+    finally:
+      self.__lock.release()
+
+  def invalidate(self, key=None):
+    self.__lock.acquire()
+    try:
+      self.version += 1
+      if key is None:
+        self.__clear()
+      else:
+        entry = self.__entries.get(key)
+        if entry is not None:
+          self.__unlink(entry)
+    finally:
+      self.__lock.release()
+
+  def __clear(self):
+    self.__entries.clear()
+    self.__root[:] = [self.__root, self.__root, None, None, None, None, 0]
+    self.size = 0
+
+  def __link(self, entry):
+    root = self.__root
+    first = root[self.NEXT]
+    entry[self.PREV] = root
+    entry[self.NEXT] = first
+    first[self.PREV] = entry
+    root[self.NEXT] = entry
+    self.__entries[entry[self.KEY]] = entry
+    self.size += entry[self.SIZE]
+
+  def __unlink(self, entry):
+    entry[self.PREV][self.NEXT] = entry[self.NEXT]
+    entry[self.NEXT][self.PREV] = entry[self.PREV]
+    del self.__entries[entry[self.KEY]]
+    self.size -= entry[self.SIZE]
+
+# Client-side read-through cache in front of get and get_bulk.
+# A record read with get is kept until its xt expiration time, at most
+# max_age seconds if that is given, or until this client writes the record
+# with set, add, replace, append, increment, increment_double, cas, remove,
+# set_bulk or remove_bulk. Calls whose affected keys are unknown (clear,
+# play_script, cur_set_value, cur_remove) drop the whole cache. Records
+# fetched with get_bulk carry no expiration time, so they are only cached
+# when max_age bounds their staleness. Writes by other clients are not seen.
+# Calls asking for views bypass the cache.
+class _CachedPyTycoon(_PyTycoonHelpers):
+  KEY_WRITES = ("set", "add", "replace", "append", "increment", "increment_double", "cas", "remove")
+  BULK_WRITES = ("set_bulk", "remove_bulk")
+  OPAQUE_WRITES = ("clear", "play_script", "cur_set_value", "cur_remove")
+
+  def __init__(self, client, cache):
+    self.__client = client
+    self.__cache = cache
 
-  # /rpc/cur_step
-  # Step the cursor to the next record.
-  # input: CUR: the cursor identifier.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_step(self, d):
-    if "CUR" not in d:
+  def close(self):
+    self.__client.close()
+
+  # hits, misses, evictions, count and size in bytes of the cache.
+  def cache_stats(self):
+    return self.__cache.stats()
+
+  # Drop the cached record of key in every database, or every record, e.g.
+  # on a change made by another client; see _ChangeStream.follow.
+  def invalidate(self, key=None):
+    self.__cache.invalidate(key)
+
+  @contextlib.contextmanager
+  def _spawn(self):
+    with self.__client._spawn() as client:
+      yield _CachedPyTycoon(client, self.__cache)
+
+  @contextlib.contextmanager
+  def _session(self):
+    with self.__client._session() as client:
+      yield _CachedPyTycoon(client, self.__cache)
+
+  def pipeline(self):
+    pipeline = self.__client.pipeline()
+    pipeline.observers.append(self.__observe)
+    return pipeline
+
+  def __getattr__(self, name):
+    attr = getattr(self.__client, name)
+    if name in self.KEY_WRITES or name in self.BULK_WRITES or name in self.OPAQUE_WRITES:
+      def call(d=None, *args, **kwargs):
+        try:
+          return attr(d, *args, **kwargs)
+        finally:
+          self.__observe(name, d)
+      return call
+    return attr
+
+  def __observe(self, name, d):
+    if name in self.KEY_WRITES:
+      if d and "key" in d:
+        self.__cache.invalidate(d["key"])
+    elif name in self.BULK_WRITES:
+      if d:
+        for k in d:
+          if k[:1] == "_":
+            self.__cache.invalidate(k[1:])
+    elif name in self.OPAQUE_WRITES:
+      self.__cache.invalidate()
+
+  def get(self, d=None, views=False, **kwargs):
+    if not d or "key" not in d:
       raise TycoonRequiredArgumentError()
-    response = None
+    # views and the arguments of other client types, such as the fp of a
+    # REST get, ask for something other than a plain record.
+    if views or kwargs:
+      return self.__client.get(d, views, **kwargs)
+    db = d.get("DB")
+    key = d["key"]
+    now = time.time()
+    r = self.__cache.lookup(db, key, now)
+    if r is not None:
+      return dict(r)
+    version = self.__cache.version
+    r = self.__client.get(d, **kwargs)
+    expires = None
+    if self.__cache.max_age is not None:
+      expires = now + self.__cache.max_age
+    if r.get("xt") is not None:
+      expires = min(expires or float(r["xt"]), float(r["xt"]))
+    self.__cache.store(db, key, r, expires, version)
+    return dict(r)
+
+  def get_bulk(self, d, views=False, **kwargs):
+    if not d or views:
+      return self.__client.get_bulk(d, views, **kwargs)
+    db = d.get("DB")
+    now = time.time()
+    result = {}
+    missing = {}
+    wanted = 0
+    for k, v in d.iteritems():
+      if k[:1] == "_":
+        r = self.__cache.lookup(db, k[1:], now)
+        if r is not None:
+          result[k] = r["value"]
+          continue
+        wanted += 1
+      missing[k] = v
+    if wanted or not result:
+      version = self.__cache.version
+      r = self.__client.get_bulk(missing, **kwargs)
+      expires = None
+      if self.__cache.max_age is not None:
+        expires = now + self.__cache.max_age
+      for k, v in r.iteritems():
+        if k[:1] == "_":
+          result[k] = v
+          if expires is not None:
+            self.__cache.store(db, k[1:], {"value" : v}, expires, version)
+    result["num"] = str(len(result))
+    return result
+
+# Client compressing values through a Codec, see open(..., codec=...).
+# Values are encoded for set, add, replace, cas, cur_set_value and set_bulk
+# and decoded from get, get_bulk, cur_get and cur_get_value, pipelined and
+# batched calls included. append, increment and increment_double raise
+# TycoonCodecError, as the server would apply them to the compressed bytes.
+# So do the streams of the REST client, a get into fp and a file value, as
+# they would bypass the codec.
+class _CodecPyTycoon(_PyTycoonHelpers):
+  def __init__(self, client, codec):
+    self.__client = client
+    self.__codec = codec
+
+  def close(self):
+    self.__client.close()
+
+  @contextlib.contextmanager
+  def _spawn(self):
+    with self.__client._spawn() as client:
+      yield _CodecPyTycoon(client, self.__codec)
+
+  @contextlib.contextmanager
+  def _session(self):
+    with self.__client._session() as client:
+      yield _CodecPyTycoon(client, self.__codec)
+
+  def pipeline(self):
+    return _CodecPipeline(self.__client.pipeline(), self.__codec)
+
+  def __getattr__(self, name):
+    attr = getattr(self.__client, name)
+    if (name not in _CODEC_ENCODED and name not in _CODEC_DECODED and name not in _CODEC_REFUSED
+        and name != "play_script"):
+      return attr
+    codec = self.__codec
+    def call(d=None, *args, **kwargs):
+      if name == "get" and (len(args) > 1 or kwargs.get("fp") is not None):
+        _codecRefuse("get into fp")
+      return _codecDecode(codec, name, attr(_codecEncode(codec, name, d), *args, **kwargs), d)
+    return call
+
+_CODEC_ENCODED = {"set" : ("value",)
+                  ,"add" : ("value",)
+                  ,"replace" : ("value",)
+                  ,"cas" : ("oval", "nval")
+                  ,"cur_set_value" : ("value",)
+                  ,"set_bulk" : None
+                  ,"vcas" : ("nval",)}
+_CODEC_DECODED = {"get" : ("value",)
+                  ,"cur_get" : ("value",)
+                  ,"cur_get_value" : ("value",)
+                  ,"get_bulk" : None
+                  ,"vget" : ("value",)}
+_CODEC_REFUSED = ("append", "increment", "increment_double")
+
+def _codecRefuse(name):
+  raise TycoonCodecError("{0} is not supported on values compressed by a codec".format(name))
+
+# The "_<i>.<field>" records of a pytycoon_batch call, see batch(), that
+# hold values of its operations, as table lists them for the method of the
+# same name; none for any other script.
+def _codecBatchFields(d, table):
+  fields = []
+  if d.get("name") == SCRIPT_BATCH_PROCEDURE:
+    for k, op in d.iteritems():
+      if k[:1] == "_" and k.endswith(".op"):
+        if op in _CODEC_REFUSED: _codecRefuse(op)
+        fields.extend(k[:-2] + field for field in table.get(op) or ())
+  return fields
+
+# A copy of d with the values of a call of name encoded; None stands for
+# the "_"-prefixed records of a bulk call.
+def _codecEncode(codec, name, d):
+  if name in _CODEC_REFUSED: _codecRefuse(name)
+  if not d:
+    return d
+  if name == "play_script":
+    fields = _codecBatchFields(d, _CODEC_ENCODED)
+  elif name in _CODEC_ENCODED:
+    fields = _CODEC_ENCODED[name]
+  else:
+    return d
+  d = dict(d)
+  if fields is None:
+    keys = [k for k in d if k[:1] == "_"]
+    for k, v in itertools.izip(keys, codec.encode_many([d[k] for k in keys])):
+      d[k] = v
+  else:
+    for field in fields:
+      if hasattr(d.get(field), "read"):
+        _codecRefuse("a file value")
+      if d.get(field) is not None:
+        d[field] = codec.encode(d[field])
+  return d
+
+# r with the values of a call of name with the input records d decoded.
+def _codecDecode(codec, name, r, d=None):
+  if not r:
+    return r
+  if name == "play_script":
+    fields = d and _codecBatchFields(d, _CODEC_DECODED) or ()
+  elif name in _CODEC_DECODED:
+    fields = _CODEC_DECODED[name]
+  else:
+    return r
+  if fields is None:
+    fields = [k for k in r if k[:1] == "_"]
+  for field in fields:
+    if r.get(field) is not None:
+      r[field] = codec.decode(r[field])
+  return r
+
+class _CodecPipeline(object):
+  def __init__(self, pipeline, codec):
+    self.__pipeline = pipeline
+    self.__codec = codec
+    self.__calls = []
+
+  def __len__(self):
+    return len(self.__pipeline)
+
+  def __getattr__(self, name):
+    attr = getattr(self.__pipeline, name)
+    if name not in RESPONSE_STATUS:
+      return attr
+    def call(d=None):
+      attr(_codecEncode(self.__codec, name, d))
+      self.__calls.append((name, d))
+    return call
+
+  def execute(self, raise_on_error=True):
+    calls, self.__calls = self.__calls, []
+    results = self.__pipeline.execute(raise_on_error)
+    return [isinstance(r, TycoonBaseError) and r or _codecDecode(self.__codec, name, r, d)
+            for (name, d), r in itertools.izip(calls, results)]
+
+class _Flight(object):
+  __slots__ = ("event", "result", "error")
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+    self.error = None
+
+class _Batch(object):
+  __slots__ = ("flights", "full")
+
+  def __init__(self):
+    self.flights = {}
+    self.full = threading.Event()
+
+# Client sharing calls between threads, see open(..., coalesce=True).
+# Concurrent get or get_bulk calls with the same arguments share one call to
+# the server: the first thread makes it and the others wait for its result,
+# or its exception. With batch_window, the single-key gets arriving within
+# batch_window seconds of each other, up to batch_size keys, are merged into
+# one get_bulk, at the cost of up to batch_window seconds of latency for the
+# first of them; their results carry no xt, and any error of the get_bulk is
+# raised in every thread of the batch. The underlying client must be thread
+# safe, i.e. pooled.
+class _CoalescedPyTycoon(_PyTycoonHelpers):
+  def __init__(self, client, batch_window=None, batch_size=DEFAULT_BATCH_SIZE):
+    self.__client = client
+    self.__window = batch_window
+    self.__size = batch_size
+    self.__lock = threading.Lock()
+    self.__flights = {}
+    self.__batches = {}
+
+  def close(self):
+    self.__client.close()
+
+  def _spawn(self):
+    return self.__client._spawn()
+
+  def _session(self):
+    return self.__client._session()
+
+  def __getattr__(self, name):
+    return getattr(self.__client, name)
+
+  def get(self, d=None, views=False, **kwargs):
+    if kwargs or not d or "key" not in d:
+      return self.__client.get(d, views, **kwargs)
+    if self.__window and not views and set(d) <= set(("key", "DB")):
+      call = lambda: self.__batched(d)
+    else:
+      call = lambda: self.__client.get(d, views)
+    return self.__share(("get", views, tuple(sorted(d.iteritems()))), call)
+
+  def get_bulk(self, d, views=False, **kwargs):
+    if kwargs or not d:
+      return self.__client.get_bulk(d, views, **kwargs)
+    return self.__share(("get_bulk", views, tuple(sorted(d.iteritems())))
+                        ,lambda: self.__client.get_bulk(d, views))
+
+  def __share(self, key, call):
+    self.__lock.acquire()
+    try:
+      flight = self.__flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self.__flights[key] = _Flight()
+    finally:
+      self.__lock.release()
+    if leader:
+      try:
+        flight.result = call()
+      except Exception, e:
+        flight.error = e
+      finally:
+        self.__lock.acquire()
+        try:
+          del self.__flights[key]
+        finally:
+          self.__lock.release()
+        flight.event.set()
+    else:
+      flight.event.wait()
+    if flight.error is not None:
+      raise flight.error
+    return flight.result is not None and dict(flight.result) or None
+
+  # The first get of a batch waits for the window to close, or the batch to
+  # fill up, and makes the call for all of them. A full batch takes no more
+  # gets: the next one starts a batch of its own.
+  def __batched(self, d):
+    db = d.get("DB")
+    flight = _Flight()
+    self.__lock.acquire()
+    try:
+      batch = self.__batches.get(db)
+      leader = batch is None
+      if leader:
+        batch = self.__batches[db] = _Batch()
+      batch.flights.setdefault(d["key"], []).append(flight)
+      if len(batch.flights) >= self.__size:
+        del self.__batches[db]
+        batch.full.set()
+    finally:
+      self.__lock.release()
+    if leader:
+      batch.full.wait(self.__window)
+      self.__lock.acquire()
+      try:
+        if self.__batches.get(db) is batch:
+          del self.__batches[db]
+      finally:
+        self.__lock.release()
+      self.__runBatch(db, batch.flights)
+    flight.event.wait()
+    if flight.error is not None:
+      raise flight.error
+    return flight.result
+
+  def __runBatch(self, db, flights):
+    params = {}
+    if db is not None:
+      params["DB"] = db
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_step"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      self.connection.request("GET", url)
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_step", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
+      if len(flights) == 1:
+        key = flights.keys()[0]
+        params["key"] = key
+        try:
+          results = {key : self.__client.get(params)}
+        except TycoonRecordNotExistError:
+          results = {}
+      else:
+        for key in flights:
+          params["_" + key] = ""
+        r = self.__client.get_bulk(params)
+        results = dict((key, {"value" : r["_" + key]}) for key in flights if "_" + key in r)
     except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      for waiting in flights.itervalues():
+        for flight in waiting:
+          flight.error = e
+          flight.event.set()
+      return
+    for key, waiting in flights.iteritems():
+      for flight in waiting:
+        if key in results:
+          flight.result = dict(results[key])
+        else:
+          flight.error = TycoonRecordNotExistError()
+        flight.event.set()
+
+# Receives one record() call per RPC call made through a client opened with
+# open(..., instrument=...). Subclass it, or pass any object with the same
+# method; the base class does nothing.
+#   name: the procedure name, e.g. "get".
+#   status: the HTTP status code, None when no HTTP response was read.
+#   outcome: "ok", or the class name of the exception the call raised; for
+#            HTTP calls this is the status mapped through RESPONSE_STATUS.
+#   seconds: the wall time of the whole call.
+#   network: the part of seconds spent sending the request and reading the
+#            response, None for calls not made over HTTP (binary protocol).
+#   sent, received: request and response sizes in bytes, headers included,
+#                   None for calls not made over HTTP.
+# Without an instrument the clients are not wrapped at all, so there is no
+# overhead. Pipelined and asynchronous calls are not instrumented.
+class Instrument(object):
+  def record(self, name, status, outcome, seconds, network, sent, received):
+    pass
+
+# Instrument aggregating per procedure call counts, bytes, network time and
+# the time left to encoding and decoding, and a histogram of (status,
+# outcome) pairs. Thread safe, so one instance can serve a pool.
+#   metrics = PyTycoon.Metrics()
+#   tycoon = PyTycoon.open(instrument=metrics)
+#   print metrics.prometheus()
+class Metrics(Instrument):
+  def __init__(self):
+    self.__lock = threading.Lock()
+    self.__procedures = {}
+
+  def record(self, name, status, outcome, seconds, network, sent, received):
+    self.__lock.acquire()
+    try:
+      p = self.__procedures.get(name)
+      if p is None:
+        p = self.__procedures[name] = {"calls" : 0
+                                       ,"seconds" : 0.0
+                                       ,"network_seconds" : 0.0
+                                       ,"codec_seconds" : 0.0
+                                       ,"sent_bytes" : 0
+                                       ,"received_bytes" : 0
+                                       ,"responses" : {}}
+      p["calls"] += 1
+      p["seconds"] += seconds
+      if network is not None:
+        p["network_seconds"] += network
+        p["codec_seconds"] += max(seconds - network, 0.0)
+        p["sent_bytes"] += sent
+        p["received_bytes"] += received
+      key = (status, outcome)
+      p["responses"][key] = p["responses"].get(key, 0) + 1
+    finally:
+      self.__lock.release()
+
+  # A copy of the counters: {name : {"calls" : ..., "responses" : {(status, outcome) : count}}}.
+  def snapshot(self):
+    self.__lock.acquire()
+    try:
+      return dict((name, dict(p, responses=dict(p["responses"])))
+                  for name, p in self.__procedures.iteritems())
+    finally:
+      self.__lock.release()
 
-  # /rpc/cur_step_back
-  # Step the cursor to the previous record.
-  # input: CUR: the cursor identifier.
-  # status code: 200, 450 (cursor is invalidated), 501 (not implemented).
-  def cur_step_back(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
+  def reset(self):
+    self.__lock.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_step_back"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_step_back", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      self.__procedures.clear()
+    finally:
+      self.__lock.release()
+
+  # The counters in the Prometheus text exposition format.
+  def prometheus(self, prefix="pytycoon"):
+    procedures = sorted(self.snapshot().iteritems())
+    lines = []
+    for metric, kind in (("calls", "total")
+                         ,("seconds", "total")
+                         ,("network_seconds", "total")
+                         ,("codec_seconds", "total")
+                         ,("sent_bytes", "total")
+                         ,("received_bytes", "total")):
+      full = "{0}_{1}_{2}".format(prefix, metric, kind)
+      lines.append("# TYPE {0} counter".format(full))
+      for name, p in procedures:
+        lines.append('{0}{{procedure="{1}"}} {2}'.format(full, name, p[metric]))
+    full = "{0}_responses_total".format(prefix)
+    lines.append("# TYPE {0} counter".format(full))
+    for name, p in procedures:
+      for (status, outcome), count in sorted(p["responses"].iteritems()):
+        lines.append('{0}{{procedure="{1}",status="{2}",outcome="{3}"}} {4}'.format(
+          full, name, status or "", outcome, count))
+    return "\n".join(lines) + "\n"
+
+# Response of an _InstrumentedConnection, counting the time spent and the
+# bytes read in read().
+class _InstrumentedResponse(object):
+  def __init__(self, response, connection):
+    self.__response = response
+    self.__connection = connection
+
+  def __getattr__(self, name):
+    return getattr(self.__response, name)
+
+  def read(self, amt=None):
+    start = time.time()
+    try:
+      data = self.__response.read(amt)
+    finally:
+      self.__connection.network += time.time() - start
+    self.__connection.received += len(data)
+    return data
+
+# HTTP connection proxy adding up the network time and the bytes of the
+# requests and responses since the last reset().
+class _InstrumentedConnection(object):
+  def __init__(self, connection):
+    self.__connection = connection
+    self.reset()
+
+  def __getattr__(self, name):
+    return getattr(self.__connection, name)
+
+  def reset(self):
+    self.used = False
+    self.status = None
+    self.network = 0.0
+    self.sent = 0
+    self.received = 0
+
+  def request(self, method, url, body=None, headers={}):
+    self.used = True
+    start = time.time()
+    try:
+      self.__connection.request(method, url, body, headers)
+    finally:
+      self.network += time.time() - start
+    self.sent += len(method) + len(url) + sum(len(k) + len(v) + 4 for k, v in headers.iteritems()) + 13
+    if body is not None:
+      try:
+        self.sent += len(body)
+      except TypeError:
+        self.sent += int(headers.get("Content-Length", 0))
 
-  # /rpc/cur_set_value
-  # Set the value of the current record.
-  # input: CUR: the cursor identifier.
-  # input: value: the value of the record.
-  # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
-  # input: xt: (optional): the expiration time from now in seconds. If it is negative, the absolute value is treated as the epoch time. If it is omitted, no expiration time is specified.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_set_value(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
+  def getresponse(self):
+    start = time.time()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_set_value"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_set_value", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      response = self.__connection.getresponse()
+    finally:
+      self.network += time.time() - start
+    self.status = response.status
+    self.received += sum(len(line) for line in response.msg.headers) + 17
+    return _InstrumentedResponse(response, self)
+
+# Client reporting every call to an instrument, see Instrument.
+class _InstrumentedPyTycoon(_PyTycoonHelpers):
+  def __init__(self, client, instrument):
+    self.__client = client
+    self.__instrument = instrument
+    self.__connection = _InstrumentedConnection(client.connection)
+    client.connection = self.__connection
 
-  # /rpc/cur_remove
-  # Remove the current record.
-  # input: CUR: the cursor identifier.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_remove(self, d):
-    if "CUR" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_remove"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_remove", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  def close(self):
+    self.__client.close()
+
+  @contextlib.contextmanager
+  def _spawn(self):
+    with self.__client._spawn() as client:
+      yield _InstrumentedPyTycoon(client, self.__instrument)
+
+  @contextlib.contextmanager
+  def _session(self):
+    with self.__client._session() as client:
+      yield _InstrumentedPyTycoon(client, self.__instrument)
+
+  def __getattr__(self, name):
+    attr = getattr(self.__client, name)
+    if name not in RESPONSE_STATUS and name not in REST_STATUS:
+      return attr
+    def call(*args, **kwargs):
+      connection = self.__connection
+      connection.reset()
+      outcome = "ok"
+      start = time.time()
+      try:
+        return attr(*args, **kwargs)
+      except Exception, e:
+        outcome = e.__class__.__name__
+        raise
+      finally:
+        seconds = time.time() - start
+        if connection.used:
+          self.__instrument.record(name, connection.status, outcome, seconds
+                                   ,connection.network, connection.sent, connection.received)
+        else:
+          self.__instrument.record(name, None, outcome, seconds, None, None, None)
+    return call
+
+# Ketama continuum: every 16 byte md5 digest of "name-i" gives four 32 bit
+# points, and a key belongs to the node owning the first point at or after
+# the hash of the key.
+class _HashRing(object):
+  def __init__(self, names, points):
+    ring = []
+    for index, name in enumerate(names):
+      for i in xrange((points + 3) // 4):
+        digest = hashlib.md5("{0}-{1}".format(name, i)).digest()
+        for j in range(4):
+          ring.append((_POINT.unpack_from(digest, j * 4)[0], index))
+    ring.sort()
+    self.points = [point for point, index in ring]
+    self.nodes = [index for point, index in ring]
+
+  def lookup(self, key):
+    point = _POINT.unpack_from(hashlib.md5(key).digest())[0]
+    i = bisect.bisect_left(self.points, point)
+    if i == len(self.points):
+      i = 0
+    return self.nodes[i]
+
+_POINT = struct.Struct("<I")
+
+# Client over several servers, see open_sharded.
+# Calls on a single key go to the node owning the key. Bulk calls are split
+# by node and the parts sent in parallel, one thread per node, and their
+# results merged; if any part fails, TycoonBulkError holds the merged
+# result of the parts that succeeded and a (part, exception) pair for each
+# one that failed. clear, synchronize and vacuum go to every node, and
+# status sums count and size over them. The match procedures go to every
+# node too, and their keys are merged. scan merges the scans of all nodes
+# in key order. Like the clients it is built from, it is not thread safe
+# unless they are pooled.
+class _ShardedPyTycoon(_PyTycoonHelpers):
+  KEY_CALLS = ("set", "add", "replace", "append", "increment", "increment_double", "cas", "remove", "get"
+               ,"check")
+  BULK_CALLS = ("set_bulk", "remove_bulk", "get_bulk")
+  BROADCAST_CALLS = ("clear", "synchronize", "vacuum")
+  MATCH_CALLS = ("match_prefix", "match_regex", "match_similar")
+
+  def __init__(self, clients, ring):
+    self.clients = clients
+    self.__ring = ring
 
-  # /rpc/cur_get_key
-  # Get the key of the current record.
-  # input: CUR: the cursor identifier.
-  # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_get_key(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_get_key"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_get_key", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  def close(self):
+    for client in self.clients:
+      client.close()
 
-  # /rpc/cur_get_value
-  # Get the value of the current record.
-  # input: CUR: the cursor identifier.
-  # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_get_value(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
-    try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_get_value"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_get_value", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+  # The client of the node owning key.
+  def client_for(self, key):
+    return self.clients[self.__ring.lookup(key)]
 
-  # /rpc/cur_get
-  # Get a pair of the key and the value of the current record.
-  # input: CUR: the cursor identifier.
-  # input: step: (optional): to move the cursor to the next record. If it is omitted, the cursor stays at the current record.
-  # output: xt: (optional): the absolute expiration time. If it is omitted, there is no expiration time.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_get(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
+  @contextlib.contextmanager
+  def _spawn(self):
+    with contextlib.nested(*[client._spawn() for client in self.clients]) as clients:
+      yield _ShardedPyTycoon(list(clients), self.__ring)
+
+  def scan(self, prefix=None, db=None, batch=DEFAULT_SCAN_BATCH, prefetch=DEFAULT_SCAN_PREFETCH
+           ,start=None, end=None):
+    scans = [client.scan(prefix, db, batch, prefetch, start, end) for client in self.clients]
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_get"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_get", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      for record in heapq.merge(*scans):
+        yield record
+    finally:
+      for records in scans:
+        records.close()
+
+  def __getattr__(self, name):
+    if name in self.KEY_CALLS:
+      def call(d, *args, **kwargs):
+        if "key" not in d:
+          raise TycoonRequiredArgumentError()
+        return getattr(self.client_for(d["key"]), name)(d, *args, **kwargs)
+      return call
+    elif name in self.BULK_CALLS:
+      return lambda d=None, *args, **kwargs: self.__bulk(name, d, *args, **kwargs)
+    elif name in self.BROADCAST_CALLS:
+      def call(d=None):
+        for client in self.clients:
+          getattr(client, name)(d)
+      return call
+    elif name in self.MATCH_CALLS:
+      return lambda d: self.__match(name, d)
+    raise AttributeError(name)
+
+  # The keys matched on every node, in key order, or by distance for
+  # match_similar, renumbered and cut to max.
+  def __match(self, funcName, d):
+    keys = []
+    for client in self.clients:
+      r = getattr(client, funcName)(d)
+      keys.extend((funcName == "match_similar" and int(v) or 0, k) for k, v in r.iteritems() if k[:1] == "_")
+    keys.sort()
+    limit = int(d.get("max", -1))
+    if limit >= 0:
+      keys = keys[:limit]
+    result = {"num" : str(len(keys))}
+    for i, (distance, k) in enumerate(keys):
+      result[k] = funcName == "match_similar" and str(distance) or str(i)
+    return result
 
-  # /rpc/cur_delete
-  # Delete a cursor implicitly.
-  # input: CUR: the cursor identifier.
-  # status code: 200, 450 (cursor is invalidated).
-  def cur_delete(self, d):
-    if "CUR" not in d or "value" not in d:
-      raise TycoonRequiredArgumentError()
-    response = None
+  def status(self, d=None):
+    result = {"count" : 0
+              ,"size" : 0}
+    for client in self.clients:
+      r = client.status(d)
+      result["count"] += int(r["count"])
+      result["size"] += int(r["size"])
+    return dict((k, str(v)) for k, v in result.iteritems())
+
+  def __bulk(self, funcName, d, *args, **kwargs):
+    parts = {}
+    params = {}
+    for k, v in (d or {}).iteritems():
+      if k[:1] == "_":
+        parts.setdefault(self.__ring.lookup(k[1:]), {})[k] = v
+      else:
+        params[k] = v
+    if len(parts) <= 1:
+      index = parts and parts.keys()[0] or 0
+      return getattr(self.clients[index], funcName)(d, *args, **kwargs)
+
+    results = {}
+    errors = []
+    def run(index, part):
+      part.update(params)
+      try:
+        results[index] = getattr(self.clients[index], funcName)(part, *args, **kwargs)
+      except Exception, e:
+        errors.append((index, part, e))
+    threads = [threading.Thread(target=run, args=item) for item in parts.iteritems()]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+
+    result = None
+    for r in results.itervalues():
+      if r is None: continue
+      if result is None:
+        result = {"num" : 0}
+      for k, v in r.iteritems():
+        if k == "num":
+          result["num"] += int(v)
+        else:
+          result[k] = v
+    if result is not None:
+      result["num"] = str(result["num"])
+    if errors:
+      errors.sort(key=lambda error: error[0])
+      raise TycoonBulkError(result, [(part, e) for index, part, e in errors])
+    return result
+
+class _ReplicaNode(object):
+  __slots__ = ("name", "client", "healthy", "outstanding")
+
+  def __init__(self, name, client):
+    self.name = name
+    self.client = client
+    self.healthy = True
+    self.outstanding = 0
+
+# Client over a primary and its replicas, see open_replicated.
+class _ReplicatedPyTycoon(_PyTycoonHelpers):
+  READ_CALLS = ("get", "check", "get_bulk", "status", "report", "echo"
+                ,"match_prefix", "match_regex", "match_similar")
+
+  def __init__(self, primary, replicas, failover=False, check_interval=DEFAULT_HEALTH_INTERVAL):
+    self.primary = primary
+    self.replicas = replicas
+    self.__failover = failover
+    self.__lock = threading.Lock()
+    self.__closed = threading.Event()
+    self.__checker = None
+    if check_interval:
+      self.__checker = threading.Thread(target=self.__check, args=(check_interval,))
+      self.__checker.setDaemon(True)
+      self.__checker.start()
+
+  def close(self):
+    self.__closed.set()
+    if self.__checker is not None:
+      self.__checker.join()
+    for node in [self.primary] + self.replicas:
+      node.client.close()
+
+  # {name : True if the node is up}
+  def health(self):
+    return dict((node.name, node.healthy) for node in [self.primary] + self.replicas)
+
+  # Queue calls and send them back-to-back to the node taking writes.
+  # See _RpcPyTycoon.pipeline.
+  def pipeline(self):
+    return self.__writeNodes()[0].client.pipeline()
+
+  def _spawn(self):
+    return _borrow(self)
+
+  @contextlib.contextmanager
+  def _session(self):
+    with self.__readNodes()[0].client._session() as client:
+      yield client
+
+  def __getattr__(self, name):
+    if name not in RESPONSE_STATUS and name not in REST_STATUS:
+      raise AttributeError(name)
+    if name in self.READ_CALLS:
+      return lambda *args, **kwargs: self.__route(name, self.__readNodes(), True, args, kwargs)
+    retry = self.__failover and name in IDEMPOTENT_PROCEDURES
+    return lambda *args, **kwargs: self.__route(name, self.__writeNodes(), retry, args, kwargs)
+
+  # Healthy replicas by calls in flight, ties broken at random, then the
+  # primary, then the nodes marked down.
+  def __readNodes(self):
+    nodes = [self.primary] + self.replicas
+    self.__lock.acquire()
     try:
-      self.connection.request("POST"
-                              ,"/rpc/cur_delete"
-                              ,body=self.__getBody(d, colenc=ENCODE_TYPE["URL"])
-                              ,headers=self.__getHttpHeader(colenc=ENCODE_TYPE["URL"]))
-      response = self.connection.getresponse()
-      self.__checkStatus("cur_delete", response.status)
-      return self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-    except Exception, e:
-      if response:
-        args = self.__getKeyValue(response.getheader("content-type"), response.read().rstrip())
-        response.close()
-        e.args = e.args + (args["ERROR"],)
-      raise e
+      order = dict((node.name, (not node.healthy, node is self.primary, node.outstanding, random.random()))
+                   for node in nodes)
+    finally:
+      self.__lock.release()
+    nodes.sort(key=lambda node: order[node.name])
+    return nodes
+
+  def __writeNodes(self):
+    if not self.__failover:
+      return [self.primary]
+    nodes = [self.primary] + self.replicas
+    nodes.sort(key=lambda node: not node.healthy)
+    return nodes
+
+  def __route(self, name, nodes, retry, args, kwargs):
+    for i, node in enumerate(nodes):
+      self.__lock.acquire()
+      node.outstanding += 1
+      self.__lock.release()
+      try:
+        return getattr(node.client, name)(*args, **kwargs)
+      except (socket.error, httplib.HTTPException):
+        node.healthy = False
+        if not retry or i == len(nodes) - 1:
+          raise
+      finally:
+        self.__lock.acquire()
+        node.outstanding -= 1
+        self.__lock.release()
+
+  def __check(self, interval):
+    while not self.__closed.isSet():
+      for node in [self.primary] + self.replicas:
+        try:
+          node.client.echo()
+          node.healthy = True
+        except Exception:
+          node.healthy = False
+      self.__closed.wait(interval)
 
 def main():
   import unittest
@@ -1607,669 +3643,1886 @@ def main():
     def tearDown(self):
       self.tycoon.close()
 
-    def test_echo(self):
+    def test_echo(self):
+      try:
+        r = self.tycoon.echo()
+        self.assertEqual(r, None)
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        r = self.tycoon.echo({"key" : "hoge"
+                              ,"value" : "hage"})
+        self.assertEqual("hoge", r["key"])
+        self.assertEqual("hage", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_report(self):
+      try:
+        r = self.tycoon.report()
+        self.assertFalse("ERROR" in r)
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_play_script(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.play_script
+                        ,{})
+
+      try:
+        self.tycoon.play_script({"name" : "hoge"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_status(self):
+      try:
+        r = self.tycoon.status()
+        self.assertTrue("count" in r)
+        self.assertTrue("size" in r)
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        r = self.tycoon.status({"DB" : "0"})
+        self.assertTrue("count" in r)
+        self.assertTrue("size" in r)
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.status
+                        ,{"DB" : "not_exist_db"})
+
+    def test_clear(self):
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.status
+                        ,{"DB" : "not_exist_db"})
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        r = self.tycoon.status()
+        self.assertEqual(1, int(r["count"]))
+        
+        self.tycoon.clear()
+        r = self.tycoon.status()
+        self.assertEqual(0, int(r["count"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        r = self.tycoon.status()
+        self.assertEqual(1, int(r["count"]))
+        
+        self.tycoon.clear({"DB" : "0"})
+        r = self.tycoon.status()
+        self.assertEqual(0, int(r["count"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+    
+#     def test_synchronize(self):
+#       pass
+
+    def test_set_and_get(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.set
+                        ,{"key" : "hoge"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.set
+                        ,{"value" : "hoge"})
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.set
+                        ,{"key" : "hoge"
+                          ,"value" : "hage"
+                          ,"DB" : "not_exist_db"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.get
+                        ,{})
+
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.get
+                        ,{"key" : "not_exist_key"})
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hage", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hagehage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hagehage", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "foo"
+                         ,"DB" : "0"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("foo", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "foobar"
+                         ,"DB" : "0"
+                         ,"xt" : "1"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("foobar", r["value"])
+
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"
+                            ,"DB" : "0"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      
+    def test_add(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.add
+                        ,{"key" : "hoge"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.add
+                        ,{"value" : "hoge"})
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.add
+                        ,{"key" : "hoge"
+                          ,"value" : "hage"
+                          ,"DB" : "not_exist_db"})
+
+      try:
+        self.tycoon.add({"key" : "hoge"
+                         ,"value" : "hage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hage", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+
+      self.assertRaises(TycoonRecordExistError
+                        ,self.tycoon.add
+                        ,{"key" : "hoge", "value" : "hagehage"})
+      try:
+        self.tycoon.add({"key" : "foo"
+                         ,"value" : "bar"
+                         ,"DB" : "0"})
+        r =  self.tycoon.get({"key" : "foo"
+                              ,"DB" : "0"})
+        self.assertEqual("bar", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.add({"key" : "hello"
+                         ,"value" : "world"
+                         ,"DB" : "0"
+                         ,"xt" : "1"})
+        r =  self.tycoon.get({"key" : "hello"
+                              ,"DB" : "0"})
+        self.assertEqual("world", r["value"])
+
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hello"
+                            ,"DB" : "0"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_replace(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.replace
+                        ,{"key" : "hoge"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.replace
+                        ,{"value" : "hoge"})
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.replace
+                        ,{"key" : "hoge"
+                          ,"value" : "hage"
+                          ,"DB" : "not_exist_db"})
+
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.replace
+                        ,{"key" : "hoge", "value" : "hagehage"})
+
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hage", r["value"])
+
+        self.tycoon.replace({"key" : "hoge"
+                             ,"value" : "foo"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("foo", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.replace({"key" : "hoge"
+                             ,"value" : "bar"
+                             ,"DB" : "0"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("bar", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.replace({"key" : "hoge"
+                             ,"value" : "hello"
+                             ,"DB" : "0"
+                             ,"xt" : "1"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("hello", r["value"])
+
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"
+                            ,"DB" : "0"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_append(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.append
+                        ,{"key" : "hoge"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.append
+                        ,{"value" : "hoge"})
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.append
+                        ,{"key" : "hoge"
+                          ,"value" : "hage"
+                          ,"DB" : "not_exist_db"})
+
+      try:
+        self.tycoon.append({"key" : "hoge"
+                            ,"value" : "hage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hage", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.append({"key" : "hoge"
+                            ,"value" : "bar"
+                            ,"DB" : "0"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("hagebar", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.append({"key" : "hoge"
+                            ,"value" : "hello"
+                            ,"DB" : "0"
+                            ,"xt" : "1"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("hagebarhello", r["value"])
+        
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"
+                            ,"DB" : "0"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_increment(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.increment
+                        ,{"key" : "hoge"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.increment
+                        ,{"num" : "1"})
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.increment
+                        ,{"key" : "hoge"
+                          ,"num" : "1"
+                          ,"DB" : "not_exist_db"})
+      try:
+        r = self.tycoon.increment({"key" : "hoge", "num" : "1"})
+        self.assertEqual(1, int(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        r = self.tycoon.increment({"key" : "hoge"
+                                   ,"num" : "10"
+                                   ,"DB" : "0"})
+        self.assertEqual(11, int(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        r = self.tycoon.increment({"key" : "hoge"
+                                   ,"num" : "100"
+                                   ,"DB" : "0"
+                                   ,"xt" : "1"})
+        self.assertEqual(111, int(r["num"]))
+        
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual(111, int(r["value"]))
+      
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"
+                            ,"DB" : "0"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_increment_double(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.increment_double
+                        ,{"key" : "hoge"})
+
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.increment_double
+                        ,{"num" : "0.1"})
+
+      self.assertRaises(TycoonUnexpectedStatusError
+                        ,self.tycoon.increment_double
+                        ,{"key" : "hoge"
+                          ,"num" : "0.1"
+                          ,"DB" : "not_exist_db"})
+      try:
+        r = self.tycoon.increment_double({"key" : "hoge", "num" : "0.1"})
+        self.assertEqual(0.1, float(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        r = self.tycoon.increment_double({"key" : "hoge"
+                                          ,"num" : "1.1"
+                                          ,"DB" : "0"})
+        self.assertEqual(1.2, float(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        r = self.tycoon.increment_double({"key" : "hoge"
+                                          ,"num" : "11.1"
+                                          ,"DB" : "0"
+                                          ,"xt" : "1"})
+        self.assertEqual(12.3, float(r["num"]))
+        
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual(12.3, float(r["value"]))
+        
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"
+                            ,"DB" : "0"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+    def test_cas(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.cas
+                        ,{})
+      
+      try:
+        self.tycoon.cas({"key" : "hoge"})
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      try:
+        self.tycoon.cas({"key" : "hoge"
+                         ,"nval" : "hage"
+                         ,"DB" : "0"})
+        r =  self.tycoon.get({"key" : "hoge"
+                              ,"DB" : "0"})
+        self.assertEqual("hage", r["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+
+      self.assertRaises(TycoonAssumptionFaildError
+                        ,self.tycoon.cas
+                        ,{"key" : "hoge"
+                          ,"nval" : "hage"})
+        
       try:
-        r = self.tycoon.echo()
-        self.assertEqual(r, None)
+        self.tycoon.cas({"key" : "hoge"
+                         ,"oval" : "hage"
+                         ,"nval" : "foo"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("foo", r["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        r = self.tycoon.echo({"key" : "hoge"
-                              ,"value" : "hage"})
-        self.assertEqual("hoge", r["key"])
-        self.assertEqual("hage", r["value"])
+        self.tycoon.cas({"key" : "hoge"
+                         ,"oval" : "foo"})
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_report(self):
       try:
-        r = self.tycoon.report()
-        self.assertFalse("ERROR" in r)
+        self.tycoon.cas({"key" : "hoge"
+                         ,"nval" : "hello"
+                         ,"xt" : "1"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hello", r["value"])
+        
+        time.sleep(2)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"
+                            ,"DB" : "0"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_play_script(self):
+    def test_remove(self):
       self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.play_script
+                        ,self.tycoon.remove
                         ,{})
+      
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.remove
+                        ,{"key" : "not_exist_key"})
 
       try:
-        self.tycoon.play_script({"name" : "hoge"})
-      except Exception, e:
-        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+        self.tycoon.set({"key" : "hoge", "value" : "hage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hage", r["value"])
 
-    def test_status(self):
-      try:
-        r = self.tycoon.status()
-        self.assertTrue("count" in r)
-        self.assertTrue("size" in r)
+        self.tycoon.remove({"key" : "hoge"})
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        r = self.tycoon.status({"DB" : "0"})
-        self.assertTrue("count" in r)
-        self.assertTrue("size" in r)
+        self.tycoon.set({"key" : "hoge", "value" : "hage"})
+        r =  self.tycoon.get({"key" : "hoge"})
+        self.assertEqual("hage", r["value"])
+
+        self.tycoon.remove({"key" : "hoge"
+                            ,"DB" : "0"})
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.status
-                        ,{"DB" : "not_exist_db"})
-
-    def test_clear(self):
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.status
-                        ,{"DB" : "not_exist_db"})
+    def test_set_bulk_and_get_bulk(self):
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "hage"})
-        r = self.tycoon.status()
-        self.assertEqual(1, int(r["count"]))
-        
-        self.tycoon.clear()
-        r = self.tycoon.status()
-        self.assertEqual(0, int(r["count"]))
+        r = self.tycoon.set_bulk()
+        self.assertEqual(0, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "hage"})
-        r = self.tycoon.status()
-        self.assertEqual(1, int(r["count"]))
-        
-        self.tycoon.clear({"DB" : "0"})
-        r = self.tycoon.status()
-        self.assertEqual(0, int(r["count"]))
+        r = self.tycoon.set_bulk({"prefix_not_underline" : "hage"})
+        self.assertEqual(0, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
-    
-#     def test_synchronize(self):
-#       pass
-
-    def test_set_and_get(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.set
-                        ,{"key" : "hoge"})
-
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.set
-                        ,{"value" : "hoge"})
 
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.set
-                        ,{"key" : "hoge"
-                          ,"value" : "hage"
-                          ,"DB" : "not_exist_db"})
-
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.get
-                        ,{})
-
-      self.assertRaises(TycoonRecordNotExistError
-                        ,self.tycoon.get
-                        ,{"key" : "not_exist_key"})
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "hage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hage", r["value"])
+        r = self.tycoon.set_bulk({"_hoge" : "hage"
+                                  ,"_foo" : "bar"
+                                  ,"_hello" : "world"
+                                  ,"DB" : "0"})
+        self.assertEqual(3, int(r["num"]))
+
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""
+                                  ,"_hello" : ""})
+        self.assertEqual(3, int(r["num"]))
+        self.assertEqual("hage", r["_hoge"])
+        self.assertEqual("bar", r["_foo"])
+        self.assertEqual("world", r["_hello"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "hagehage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hagehage", r["value"])
+        r = self.tycoon.get_bulk({"prefix_not_underline" : ""})
+        self.assertEqual(0, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "foo"
-                         ,"DB" : "0"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("foo", r["value"])
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""
+                                  ,"_not_exist_key" : ""
+                                  ,"DB" : "0"})
+        self.assertEqual(2, int(r["num"]))
+        self.assertEqual("hage", r["_hoge"])
+        self.assertEqual("bar", r["_foo"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "foobar"
-                         ,"DB" : "0"
-                         ,"xt" : "1"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("foobar", r["value"])
+        r = self.tycoon.set_bulk({"_hoge" : "hage"
+                                  ,"_foo" : "bar"
+                                  ,"_hello" : "world"
+                                  ,"DB" : "0"
+                                  ,"xt" : "1"})
+        self.assertEqual(3, int(r["num"]))
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""
+                                  ,"_hello" : ""
+                                  ,"DB" : "0"})
+        self.assertEqual(3, int(r["num"]))
+        self.assertEqual("hage", r["_hoge"])
+        self.assertEqual("bar", r["_foo"])
+        self.assertEqual("world", r["_hello"])
 
         time.sleep(2)
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"
-                            ,"DB" : "0"})
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""
+                                  ,"_hello" : ""
+                                  ,"DB" : "0"})
+        self.assertEqual(0, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
-      
-    def test_add(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.add
-                        ,{"key" : "hoge"})
 
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.add
-                        ,{"value" : "hoge"})
+    def test_remove_bulk(self):
+      try:
+        r = self.tycoon.remove_bulk()
+        self.assertEqual(0, int(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.add
-                        ,{"key" : "hoge"
-                          ,"value" : "hage"
-                          ,"DB" : "not_exist_db"})
+      try:
+        r = self.tycoon.remove_bulk({"prefix_not_underline" : "hage"})
+        self.assertEqual(0, int(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
       try:
-        self.tycoon.add({"key" : "hoge"
-                         ,"value" : "hage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hage", r["value"])
+        r = self.tycoon.set_bulk({"_hoge" : "hage"
+                                  ,"_foo" : "bar"
+                                  ,"_hello" : "world"
+                                  ,"DB" : "0"})
+        r = self.tycoon.remove_bulk({"_hoge" : ""
+                                     ,"_foo" : ""
+                                     ,"_hello" : ""})
+        self.assertEqual(3, int(r["num"]))
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""
+                                  ,"_hello" : ""
+                                  ,"DB" : "0"})
+        self.assertEqual(0, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+      try:
+        r = self.tycoon.set_bulk({"_hoge" : "hage"
+                                  ,"_foo" : "bar"
+                                  ,"_hello" : "world"
+                                  ,"DB" : "0"})
+        r = self.tycoon.remove_bulk({"_hoge" : ""
+                                     ,"_foo" : ""
+                                     ,"_not_exist_key" : ""})
+        self.assertEqual(2, int(r["num"]))
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""
+                                  ,"_hello" : ""})
+        self.assertEqual(1, int(r["num"]))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-      self.assertRaises(TycoonRecordExistError
-                        ,self.tycoon.add
-                        ,{"key" : "hoge", "value" : "hagehage"})
+    def test_get_views(self):
       try:
-        self.tycoon.add({"key" : "foo"
-                         ,"value" : "bar"
-                         ,"DB" : "0"})
-        r =  self.tycoon.get({"key" : "foo"
-                              ,"DB" : "0"})
-        self.assertEqual("bar", r["value"])
+        self.tycoon.set_bulk({"_hoge\tfoo" : "hage\t\nbar"
+                              ,"_foo" : "bar "})
+        r = self.tycoon.get_bulk({"_hoge\tfoo" : ""
+                                  ,"_foo" : ""})
+        self.assertEqual("hage\t\nbar", r["_hoge\tfoo"])
+        self.assertEqual("bar ", r["_foo"])
+        r = self.tycoon.get({"key" : "foo"}
+                            ,views=True)
+        self.assertEqual("bar ", memoryview(r["value"]).tobytes())
+        r = self.tycoon.get_bulk({"_foo" : ""}
+                                 ,views=True)
+        self.assertEqual("bar ", memoryview(r["_foo"]).tobytes())
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+    def test_set_many_and_get_many(self):
       try:
-        self.tycoon.add({"key" : "hello"
-                         ,"value" : "world"
-                         ,"DB" : "0"
-                         ,"xt" : "1"})
-        r =  self.tycoon.get({"key" : "hello"
-                              ,"DB" : "0"})
-        self.assertEqual("world", r["value"])
-
-        time.sleep(2)
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hello"
-                            ,"DB" : "0"})
+        r = self.tycoon.set_many((("hoge{0}".format(i), "hage{0}".format(i)) for i in range(1000))
+                                 ,max_count=64)
+        self.assertEqual(1000, int(r["num"]))
+        r = self.tycoon.get_many(["hoge{0}".format(i) for i in range(0, 1000, 3)] + ["not_exist_key"]
+                                 ,max_size=256)
+        self.assertEqual(334, int(r["num"]))
+        self.assertEqual("hage999", r["_hoge999"])
+        r = self.tycoon.remove_many(["hoge0", "hoge1", "not_exist_key"]
+                                    ,workers=1)
+        self.assertEqual(2, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_replace(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.replace
-                        ,{"key" : "hoge"})
+      try:
+        self.tycoon.set_many({"hoge" : "hage"
+                              ,"foo" : "bar"}
+                             ,db="not_exist_db"
+                             ,max_count=1)
+        self.fail("TycoonBulkError was not raised")
+      except TycoonBulkError, e:
+        self.assertEqual(0, int(e.result["num"]))
+        self.assertEqual(2, len(e.errors))
+
+    def test_obj(self):
+      try:
+        self.tycoon.set_obj("hoge", {"hage" : [1, 2.5, None]})
+        self.assertEqual({"hage" : [1, 2.5, None]}, self.tycoon.get_obj("hoge"))
+        self.assertEqual("{\"hage\":[1,2.5,null]}", self.tycoon.get({"key" : "hoge"})["value"])
+        self.assertEqual("none", self.tycoon.get_obj("not_exist_key", "none"))
+        self.tycoon.set_obj("foo", set([1, 2]), serializer="pickle")
+        self.assertEqual(set([1, 2]), self.tycoon.get_obj("foo", serializer="pickle"))
+
+        points = StructSerializer("<qd")
+        r = self.tycoon.set_many_obj((("point{0}".format(i), (i, i / 2.0)) for i in range(100))
+                                     ,serializer=points
+                                     ,max_count=16)
+        self.assertEqual(100, int(r["num"]))
+        r = self.tycoon.get_many_obj(["point{0}".format(i) for i in range(0, 100, 7)] + ["not_exist_key"]
+                                     ,serializer=points)
+        self.assertEqual(15, len(r))
+        self.assertEqual((98, 49.0), r["point98"])
+        self.assertEqual((7, 3.5), self.tycoon.get_obj("point7", serializer=points))
+        counts = StructSerializer(">I")
+        self.tycoon.set_many_obj({"a" : 1, "b" : 2}, serializer=counts)
+        self.assertEqual({"a" : 1, "b" : 2}, self.tycoon.get_many_obj(["a", "b"], serializer=counts))
+        # native alignment pads "qc" records to 16 bytes when packed in a row.
+        tagged = StructSerializer("qc")
+        self.assertEqual([(1, "a"), (2, "b")], tagged.loads_many(tagged.dumps_many([(1, "a"), (2, "b")])))
+        self.assertEqual([tagged.dumps((1, "a"))], tagged.dumps_many([(1, "a")]))
+        self.tycoon.set_many_obj({"c" : (3, "c"), "d" : (4, "d")}, serializer=tagged)
+        self.assertEqual((3, "c"), self.tycoon.get_obj("c", serializer=tagged))
+        self.assertEqual({"c" : (3, "c"), "d" : (4, "d")}
+                         ,self.tycoon.get_many_obj(["c", "d"], serializer=tagged))
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+    def test_match(self):
       self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.replace
-                        ,{"value" : "hoge"})
-
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.replace
-                        ,{"key" : "hoge"
-                          ,"value" : "hage"
-                          ,"DB" : "not_exist_db"})
-
-      self.assertRaises(TycoonRecordNotExistError
-                        ,self.tycoon.replace
-                        ,{"key" : "hoge", "value" : "hagehage"})
-
+                        ,self.tycoon.match_prefix
+                        ,{})
       try:
-        self.tycoon.set({"key" : "hoge"
-                         ,"value" : "hage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hage", r["value"])
-
-        self.tycoon.replace({"key" : "hoge"
-                             ,"value" : "foo"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("foo", r["value"])
+        self.tycoon.set_bulk(dict(("_{0}{1}".format(p, i), "{0}{1}".format(p, i))
+                                  for p in ("hoge", "hage", "foo") for i in range(10)))
+        r = self.tycoon.match_prefix({"prefix" : "hoge"})
+        self.assertEqual(10, int(r["num"]))
+        self.assertTrue("_hoge3" in r)
+        r = self.tycoon.match_prefix({"prefix" : "hoge"
+                                      ,"max" : "3"})
+        self.assertEqual(3, int(r["num"]))
+        r = self.tycoon.match_regex({"regex" : "^h.ge[12]$"})
+        self.assertEqual(set(["_hoge1", "_hoge2", "_hage1", "_hage2"]), set(k for k in r if k[:1] == "_"))
+        r = self.tycoon.match_similar({"origin" : "fo3"})
+        self.assertEqual(["_foo3"], [k for k in r if k[:1] == "_"])
+        self.assertEqual("1", r["_foo3"])
+
+        records = list(self.tycoon.match(prefix="hage", batch=3))
+        self.assertEqual([("hage{0}".format(i), "hage{0}".format(i)) for i in range(10)], records)
+        records = list(self.tycoon.match(regex="[05]$", limit=4))
+        self.assertEqual(4, len(records))
+        records = list(self.tycoon.match(origin="hoge1", distance=1))
+        self.assertEqual(("hoge1", "hoge1"), records[0])
+        self.assertEqual(11, len(records))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+    def test_batch(self):
+      batch = self.tycoon.batch()
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,batch.set
+                        ,{"key" : "hoge"})
+      self.assertRaises(AttributeError
+                        ,getattr
+                        ,batch
+                        ,"clear")
       try:
-        self.tycoon.replace({"key" : "hoge"
-                             ,"value" : "bar"
-                             ,"DB" : "0"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("bar", r["value"])
+        self.assertEqual([], batch.execute())
+        batch.set({"key" : "hoge"
+                   ,"value" : "hage"})
+        batch.get({"key" : "hoge"})
+        batch.cas({"key" : "hoge"
+                   ,"oval" : "hage"
+                   ,"nval" : "hige"})
+        batch.increment({"key" : "count"
+                         ,"num" : "3"})
+        batch.add({"key" : "hoge"
+                   ,"value" : "hage"})
+        batch.remove({"key" : "not_exist_key"})
+        batch.get({"key" : "hoge"})
+        self.assertEqual(7, len(batch))
+        results = batch.execute(raise_on_error=False)
+        self.assertEqual(0, len(batch))
+        self.assertEqual(None, results[0])
+        self.assertEqual("hage", results[1]["value"])
+        self.assertEqual(None, results[2])
+        self.assertEqual(3, int(results[3]["num"]))
+        self.assertTrue(isinstance(results[4], TycoonRecordExistError))
+        self.assertTrue(isinstance(results[5], TycoonRecordNotExistError))
+        self.assertEqual("hige", results[6]["value"])
+        batch.cas({"key" : "hoge"
+                   ,"oval" : "hage"
+                   ,"nval" : "hoge"})
+        self.assertRaises(TycoonAssumptionFaildError
+                          ,batch.execute)
+        batch = self.tycoon.batch(db="0")
+        batch.get({"key" : "hoge"})
+        self.assertEqual("hige", batch.execute()[0]["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      batch = self.tycoon.batch(db="not_exist_db")
+      batch.get({"key" : "hoge"})
+      self.assertRaises((TycoonUnexpectedStatusError, TycoonLogicalError)
+                        ,batch.execute)
 
+    def test_vcas(self):
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.vget
+                        ,{"key" : "hoge"})
       try:
-        self.tycoon.replace({"key" : "hoge"
-                             ,"value" : "hello"
-                             ,"DB" : "0"
-                             ,"xt" : "1"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("hello", r["value"])
-
-        time.sleep(2)
+        r = self.tycoon.vcas({"key" : "hoge"
+                              ,"nval" : "hage" * 100})
+        version = r["version"]
+        r = self.tycoon.vget({"key" : "hoge"})
+        self.assertEqual("hage" * 100, r["value"])
+        self.assertEqual(version, r["version"])
+        r = self.tycoon.vcas({"key" : "hoge"
+                              ,"version" : version
+                              ,"nval" : "hige"})
+        self.assertNotEqual(version, r["version"])
+        self.assertEqual("hige", self.tycoon.get({"key" : "hoge"})["value"])
+        self.assertRaises(TycoonAssumptionFaildError
+                          ,self.tycoon.vcas
+                          ,{"key" : "hoge"
+                            ,"version" : version
+                            ,"nval" : "hoge"})
+        self.assertRaises(TycoonAssumptionFaildError
+                          ,self.tycoon.vcas
+                          ,{"key" : "hoge"
+                            ,"nval" : "hoge"})
+        self.assertEqual(None, self.tycoon.vcas({"key" : "hoge"
+                                                 ,"version" : r["version"]}))
         self.assertRaises(TycoonRecordNotExistError
                           ,self.tycoon.get
-                          ,{"key" : "hoge"
-                            ,"DB" : "0"})
+                          ,{"key" : "hoge"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_append(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.append
-                        ,{"key" : "hoge"})
-
+    def test_pipeline(self):
+      p = self.tycoon.pipeline()
       self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.append
-                        ,{"value" : "hoge"})
-
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.append
-                        ,{"key" : "hoge"
-                          ,"value" : "hage"
-                          ,"DB" : "not_exist_db"})
-
+                        ,p.get
+                        ,{})
       try:
-        self.tycoon.append({"key" : "hoge"
-                            ,"value" : "hage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hage", r["value"])
+        for i in range(100):
+          p.set({"key" : "hoge{0}".format(i)
+                 ,"value" : "hage{0}".format(i)})
+        p.increment({"key" : "foo"
+                     ,"num" : "3"})
+        p.get({"key" : "hoge99"})
+        r = p.execute()
+        self.assertEqual(102, len(r))
+        self.assertEqual("3", r[100]["num"])
+        self.assertEqual("hage99", r[101]["value"])
+        self.assertEqual(0, len(p))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-      try:
-        self.tycoon.append({"key" : "hoge"
-                            ,"value" : "bar"
-                            ,"DB" : "0"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("hagebar", r["value"])
-      except Exception, e:
-        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      p.get({"key" : "not_exist_key"})
+      p.get({"key" : "hoge0"})
+      self.assertRaises(TycoonRecordNotExistError, p.execute)
 
       try:
-        self.tycoon.append({"key" : "hoge"
-                            ,"value" : "hello"
-                            ,"DB" : "0"
-                            ,"xt" : "1"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("hagebarhello", r["value"])
-        
-        time.sleep(2)
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"
-                            ,"DB" : "0"})
+        p.get({"key" : "not_exist_key"})
+        p.get({"key" : "hoge0"})
+        r = p.execute(raise_on_error=False)
+        self.assertTrue(isinstance(r[0], TycoonRecordNotExistError))
+        self.assertEqual("hage0", r[1]["value"])
+        r = self.tycoon.get({"key" : "hoge1"})
+        self.assertEqual("hage1", r["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_increment(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.increment
-                        ,{"key" : "hoge"})
+#     def test_vacuum(self):
+#       pass
 
+    def test_cur_jump(self):
       self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.increment
-                        ,{"num" : "1"})
+                        ,self.tycoon.cur_jump
+                        ,{})
 
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.increment
-                        ,{"key" : "hoge"
-                          ,"num" : "1"
-                          ,"DB" : "not_exist_db"})
+      self.assertRaises(TycoonInvalidCursorError
+                        ,self.tycoon.cur_jump
+                        ,{"CUR" : "1"})
       try:
-        r = self.tycoon.increment({"key" : "hoge", "num" : "1"})
-        self.assertEqual(1, int(r["num"]))
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.tycoon.cur_jump({"CUR" : "1"})
+        r = self.tycoon.cur_get({"CUR" : "1"})
+        self.assertEqual("hoge", r["key"])
+        self.tycoon.cur_delete({"CUR" : "1"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+#     def test_cur_jump_back(self):
+#       pass
+
+    def test_cur_step(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.cur_step
+                        ,{})
       try:
-        r = self.tycoon.increment({"key" : "hoge"
-                                   ,"num" : "10"
-                                   ,"DB" : "0"})
-        self.assertEqual(11, int(r["num"]))
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.tycoon.set({"key" : "foo"
+                         ,"value" : "bar"})
+        self.tycoon.cur_jump({"CUR" : "1"})
+        self.tycoon.cur_step({"CUR" : "1"})
+        self.tycoon.cur_step({"CUR" : "1"})
+        self.assertRaises(TycoonInvalidCursorError
+                          ,self.tycoon.cur_get
+                          ,{"CUR" : "1"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+#     def test_cur_back(self):
+#       pass
+
+#     def test_cur_back(self):
+#       pass
+
+#     def test_set_value(self):
+#       pass
+
+#     def test_cur_remove(self):
+#       pass
+
+    def test_cur_get_key(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.cur_get_key
+                        ,{})
       try:
-        r = self.tycoon.increment({"key" : "hoge"
-                                   ,"num" : "100"
-                                   ,"DB" : "0"
-                                   ,"xt" : "1"})
-        self.assertEqual(111, int(r["num"]))
-        
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual(111, int(r["value"]))
-      
-        time.sleep(2)
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"
-                            ,"DB" : "0"})
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.tycoon.cur_jump({"CUR" : "1"})
+        r = self.tycoon.cur_get_key({"CUR" : "1"
+                                     ,"step" : "true"})
+        self.assertEqual("hoge", r["key"])
+        self.assertRaises(TycoonInvalidCursorError
+                          ,self.tycoon.cur_get_key
+                          ,{"CUR" : "1"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_increment_double(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.increment_double
-                        ,{"key" : "hoge"})
+#     def test_cur_get_value(self):
+#       pass
 
+    def test_cur_get(self):
       self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.increment_double
-                        ,{"num" : "0.1"})
+                        ,self.tycoon.cur_get
+                        ,{})
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.tycoon.set({"key" : "foo"
+                         ,"value" : "bar"})
+        self.tycoon.cur_jump({"CUR" : "1"})
+        r1 = self.tycoon.cur_get({"CUR" : "1"
+                                  ,"step" : "true"})
+        r2 = self.tycoon.cur_get({"CUR" : "1"
+                                  ,"step" : "true"})
+        self.assertEqual({"hoge" : "hage", "foo" : "bar"}
+                         ,dict([(r1["key"], r1["value"]), (r2["key"], r2["value"])]))
+        self.assertRaises(TycoonInvalidCursorError
+                          ,self.tycoon.cur_get
+                          ,{"CUR" : "1"})
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-      self.assertRaises(TycoonUnexpectedStatusError
-                        ,self.tycoon.increment_double
-                        ,{"key" : "hoge"
-                          ,"num" : "0.1"
-                          ,"DB" : "not_exist_db"})
+    def test_cur_delete(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.cur_delete
+                        ,{})
       try:
-        r = self.tycoon.increment_double({"key" : "hoge", "num" : "0.1"})
-        self.assertEqual(0.1, float(r["num"]))
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.tycoon.cur_jump({"CUR" : "1"})
+        self.tycoon.cur_delete({"CUR" : "1"})
+        self.assertRaises(TycoonInvalidCursorError
+                          ,self.tycoon.cur_get
+                          ,{"CUR" : "1"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+    def test_scan(self):
       try:
-        r = self.tycoon.increment_double({"key" : "hoge"
-                                          ,"num" : "1.1"
-                                          ,"DB" : "0"})
-        self.assertEqual(1.2, float(r["num"]))
+        self.assertEqual([], list(self.tycoon.scan()))
+        self.tycoon.set_many(("hoge{0}".format(i), "hage{0}".format(i)) for i in range(250))
+        self.tycoon.set({"key" : "foo"
+                         ,"value" : "bar"
+                         ,"xt" : "100"})
+        records = list(self.tycoon.scan(batch=16, prefetch=2))
+        self.assertEqual(251, len(records))
+        records = dict([(key, (value, xt)) for key, value, xt in records])
+        self.assertEqual(("hage10", None), records["hoge10"])
+        self.assertEqual("bar", records["foo"][0])
+        self.assertTrue(records["foo"][1] is not None)
+        keys = [key for key, value, xt in self.tycoon.scan(batch=8, start="hoge10", end="hoge12")]
+        self.assertEqual(["hoge10"] + ["hoge10{0}".format(i) for i in range(10)]
+                         + ["hoge11"] + ["hoge11{0}".format(i) for i in range(10)], keys)
+
+        scan = self.tycoon.scan(batch=4, prefetch=1)
+        scan.next()
+        scan.close()
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+  class TestPostPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.tycoon = open(method="POST")
+      self.tycoon.clear()
+
+    def test_colenc(self):
+      self.assertEqual(COLENC_RAW, _chooseColenc({"hoge" : "hage hage"}))
+      self.assertEqual(ENCODE_TYPE["URL"], _chooseColenc({"hoge" : "hage\thage hage hage"}))
+      self.assertEqual(ENCODE_TYPE["BASE64"], _chooseColenc({"hoge" : "\xff\t\x00\x01"}))
+      self.assertEqual({"hoge" : "h\xc3\xa4ge"}, _encodeUnicode({u"hoge" : u"h\xe4ge"}))
+      self.assertEqual("a=b%\xff", _unquote("a%3Db%25%fF"))
+      self.assertEqual("a=b", _unquote("a=b"))
+      self.assertEqual("x%", _unquote("x%"))
+      self.assertEqual("x%2", _unquote("x%2"))
+      self.assertEqual("x=%2g!", _unquote("x=%2g%21"))
       try:
-        r = self.tycoon.increment_double({"key" : "hoge"
-                                          ,"num" : "11.1"
-                                          ,"DB" : "0"
-                                          ,"xt" : "1"})
-        self.assertEqual(12.3, float(r["num"]))
-        
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual(12.3, float(r["value"]))
-        
-        time.sleep(2)
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"
-                            ,"DB" : "0"})
+        value = "".join(chr(i) for i in range(256)) + "=\n" * 100
+        for colenc in (None,) + tuple(ENCODE_TYPE.values()):
+          self.tycoon.set({"key" : "hoge\t"
+                           ,"value" : value}
+                          ,colenc=colenc)
+          self.assertEqual(value, self.tycoon.get({"key" : "hoge\t"}
+                                                  ,colenc=colenc)["value"])
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"}
+                        ,colenc=COLENC_RAW)
+        self.assertEqual("hage", self.tycoon.get({"key" : "hoge"})["value"])
+        for value in (u"h\xe4ge", u"h\xe4\tge"):
+          self.tycoon.set({"key" : u"h\xf6ge"
+                           ,"value" : value})
+          self.assertEqual(value.encode("utf-8"), self.tycoon.get({"key" : u"h\xf6ge"})["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_cas(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.cas
-                        ,{})
-      
+  class TestPooledPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.tycoon = open(pool_size=4, pool_timeout=5)
+      self.tycoon.clear()
+
+    def test_threads(self):
+      errors = []
+      def worker(n):
+        try:
+          for i in range(50):
+            key = "thread{0}_{1}".format(n, i)
+            self.tycoon.set({"key" : key
+                             ,"value" : key})
+            self.assertEqual(key, self.tycoon.get({"key" : key})["value"])
+        except Exception, e:
+          errors.append(e)
+      threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+      for t in threads: t.start()
+      for t in threads: t.join()
+      self.assertEqual([], errors)
+      self.assertEqual(800, int(self.tycoon.status()["count"]))
+
+    def test_connection(self):
+      with self.tycoon.connection() as t:
+        self.assertTrue(t is not self.tycoon)
+        with self.tycoon.connection() as u:
+          self.assertTrue(t is u)
+
+    def test_rest(self):
+      tycoon = open(method="REST", pool_size=2)
       try:
-        self.tycoon.cas({"key" : "hoge"})
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        self.assertEqual("4", tycoon.check({"key" : "hoge"})["vsiz"])
+      finally:
+        tycoon.close()
+
+    def test_idle_timeout(self):
+      tycoon = open(pool_size=2, idle_timeout=0.2)
+      try:
+        clients = []
+        def worker():
+          with tycoon.connection() as t:
+            t.echo()
+            clients.append(t)
+        with tycoon.connection() as t:
+          thread = threading.Thread(target=worker)
+          thread.start()
+          thread.join()
+          t.echo()
+        # the connection of the worker lies under the one kept busy here.
+        for i in range(4):
+          time.sleep(0.1)
+          tycoon.echo()
+        self.assertEqual(None, clients[0].connection.sock)
+      finally:
+        tycoon.close()
+
+  class TestCachedPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.tycoon = open(cache_size=1 << 20)
+      self.tycoon.clear()
+
+    def test_cache(self):
+      try:
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.assertEqual("hage", self.tycoon.get({"key" : "hoge"})["value"])
+        self.assertEqual("hage", self.tycoon.get({"key" : "hoge"})["value"])
+        r = self.tycoon.cache_stats()
+        self.assertEqual(1, r["hits"])
+        self.assertEqual(1, r["misses"])
+        self.assertEqual(1, r["count"])
+
+        self.tycoon.append({"key" : "hoge"
+                            ,"value" : "hage"})
+        self.assertEqual("hagehage", self.tycoon.get({"key" : "hoge"})["value"])
+        self.tycoon.set_bulk({"_hoge" : "foo"})
+        self.assertEqual("foo", self.tycoon.get({"key" : "hoge"})["value"])
+        self.tycoon.clear()
+        self.assertEqual(0, self.tycoon.cache_stats()["count"])
         self.assertRaises(TycoonRecordNotExistError
                           ,self.tycoon.get
                           ,{"key" : "hoge"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.get
+                        ,None)
 
+    def test_cache_size(self):
+      tycoon = open(cache_size=1024)
       try:
-        self.tycoon.cas({"key" : "hoge"
-                         ,"nval" : "hage"
-                         ,"DB" : "0"})
-        r =  self.tycoon.get({"key" : "hoge"
-                              ,"DB" : "0"})
-        self.assertEqual("hage", r["value"])
+        for i in range(100):
+          tycoon.set({"key" : "hoge{0}".format(i)
+                      ,"value" : "hage" * 10})
+          tycoon.get({"key" : "hoge{0}".format(i)})
+        r = tycoon.cache_stats()
+        self.assertTrue(r["size"] <= 1024)
+        self.assertEqual(100, r["count"] + r["evictions"])
+      finally:
+        tycoon.close()
+
+    def test_fp(self):
+      import StringIO
+      tycoon = open(method="REST", cache_size=1 << 20)
+      try:
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        for i in range(2):
+          f = StringIO.StringIO()
+          tycoon.get({"key" : "hoge"}, fp=f)
+          self.assertEqual("hage", f.getvalue())
+          self.assertEqual("hage", tycoon.get({"key" : "hoge"})["value"])
+      finally:
+        tycoon.close()
+
+  # Both nodes are the same server under two names, so keys are routed as
+  # with two servers while status and scan see every record twice.
+  class TestShardedPyTycoon(unittest.TestCase):
+    def setUp(self):
+      self.tycoon = open_sharded(["127.0.0.1:{0}".format(DEFAULT_PORT)
+                                  ,("localhost", DEFAULT_PORT)])
+      self.tycoon.clear()
+
+    def tearDown(self):
+      self.tycoon.close()
+
+    def test_routing(self):
+      try:
+        owners = set()
+        for i in range(20):
+          key = "hoge{0}".format(i)
+          owners.add(self.tycoon.client_for(key))
+          self.tycoon.set({"key" : key
+                           ,"value" : str(i)})
+          self.assertEqual(str(i), self.tycoon.get({"key" : key})["value"])
+        self.assertEqual(2, len(owners))
+        self.assertEqual(7, int(self.tycoon.increment({"key" : "foo"
+                                                       ,"num" : "7"})["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.get
+                        ,{})
 
-      self.assertRaises(TycoonAssumptionFaildError
-                        ,self.tycoon.cas
-                        ,{"key" : "hoge"
-                          ,"nval" : "hage"})
-        
+    def test_bulk(self):
       try:
-        self.tycoon.cas({"key" : "hoge"
-                         ,"oval" : "hage"
-                         ,"nval" : "foo"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("foo", r["value"])
+        records = dict(("_hoge{0}".format(i), str(i)) for i in range(20))
+        r = self.tycoon.set_bulk(records)
+        self.assertEqual(20, int(r["num"]))
+        d = dict((k, "") for k in records)
+        d["_foo"] = ""
+        r = self.tycoon.get_bulk(d)
+        self.assertEqual(20, int(r["num"]))
+        self.assertEqual("7", r["_hoge7"])
+        keys = [k for k, v, xt in self.tycoon.scan()]
+        self.assertEqual(sorted(keys), keys)
+        r = self.tycoon.remove_bulk(d)
+        self.assertEqual(20, int(r["num"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+  class TestReplicatedPyTycoon(unittest.TestCase):
+    def setUp(self):
+      listener = socket.socket()
+      listener.bind((DEFAULT_HOST, 0))
+      self.deadPort = listener.getsockname()[1]
+      listener.close()
+
+    def test_routing(self):
+      tycoon = open_replicated("127.0.0.1:{0}".format(DEFAULT_PORT)
+                               ,[("localhost", DEFAULT_PORT), (DEFAULT_HOST, self.deadPort)]
+                               ,check_interval=0)
       try:
-        self.tycoon.cas({"key" : "hoge"
-                         ,"oval" : "foo"})
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"})
+        tycoon.clear()
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        for i in range(50):
+          self.assertEqual("hage", tycoon.get({"key" : "hoge"})["value"])
+        health = tycoon.health()
+        self.assertEqual(False, health["{0}:{1}".format(DEFAULT_HOST, self.deadPort)])
+        self.assertEqual(True, health["localhost:{0}".format(DEFAULT_PORT)])
+        self.assertEqual(1, int(tycoon.status()["count"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      finally:
+        tycoon.close()
 
+    def test_failover(self):
+      tycoon = open_replicated((DEFAULT_HOST, self.deadPort)
+                               ,["localhost:{0}".format(DEFAULT_PORT)]
+                               ,check_interval=0.01)
       try:
-        self.tycoon.cas({"key" : "hoge"
-                         ,"nval" : "hello"
-                         ,"xt" : "1"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hello", r["value"])
-        
-        time.sleep(2)
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
+        self.assertRaises(socket.error
+                          ,tycoon.set
                           ,{"key" : "hoge"
-                            ,"DB" : "0"})
+                            ,"value" : "hage"})
+      finally:
+        tycoon.close()
+      tycoon = open_replicated((DEFAULT_HOST, self.deadPort)
+                               ,["localhost:{0}".format(DEFAULT_PORT)]
+                               ,failover=True
+                               ,check_interval=0.01)
+      try:
+        time.sleep(0.1)
+        self.assertEqual(False, tycoon.health()["{0}:{1}".format(DEFAULT_HOST, self.deadPort)])
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        self.assertEqual("hage", tycoon.get({"key" : "hoge"})["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      finally:
+        tycoon.close()
+
+    def test_rest(self):
+      tycoon = open_replicated("127.0.0.1:{0}".format(DEFAULT_PORT)
+                               ,["localhost:{0}".format(DEFAULT_PORT)]
+                               ,method="REST"
+                               ,check_interval=0)
+      try:
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        self.assertEqual("4", tycoon.check({"key" : "hoge"})["vsiz"])
+      finally:
+        tycoon.close()
 
-    def test_remove(self):
-      self.assertRaises(TycoonRequiredArgumentError
-                        ,self.tycoon.remove
-                        ,{})
-      
-      self.assertRaises(TycoonRecordNotExistError
-                        ,self.tycoon.remove
-                        ,{"key" : "not_exist_key"})
+  class TestCodecPyTycoon(unittest.TestCase):
+    def setUp(self):
+      self.codec = Codec(threshold=64
+                         ,processes=2
+                         ,parallel_size=4096)
+      self.tycoon = open(codec=self.codec)
+      self.raw = open()
+      self.tycoon.clear()
 
-      try:
-        self.tycoon.set({"key" : "hoge", "value" : "hage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hage", r["value"])
+    def tearDown(self):
+      self.tycoon.close()
+      self.raw.close()
+      self.codec.close()
 
-        self.tycoon.remove({"key" : "hoge"})
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"})
+    def test_codec(self):
+      blob = "{\"hoge\" : \"hage\"}" * 100
+      try:
+        self.tycoon.set({"key" : "blob"
+                         ,"value" : blob})
+        self.tycoon.set({"key" : "small"
+                         ,"value" : "hage"})
+        self.tycoon.set({"key" : "magic"
+                         ,"value" : CODEC_MAGIC + "z"})
+        self.raw.set({"key" : "raw"
+                      ,"value" : blob})
+        self.assertTrue(self.raw.get({"key" : "blob"})["value"].startswith(CODEC_MAGIC + "z"))
+        self.assertTrue(len(self.raw.get({"key" : "blob"})["value"]) < len(blob))
+        self.assertEqual("hage", self.raw.get({"key" : "small"})["value"])
+        for key, value in (("blob", blob), ("small", "hage"), ("magic", CODEC_MAGIC + "z"), ("raw", blob)):
+          self.assertEqual(value, self.tycoon.get({"key" : key})["value"])
+          self.assertEqual(value, self.tycoon.get({"key" : key}, views=True)["value"])
+        self.assertTrue(self.tycoon.cas({"key" : "blob"
+                                         ,"oval" : blob
+                                         ,"nval" : blob + "!"}) is None)
+        self.tycoon.cur_jump({"CUR" : "1"
+                              ,"key" : "blob"})
+        self.assertEqual(blob + "!", self.tycoon.cur_get_value({"CUR" : "1"})["value"])
+        self.tycoon.cur_delete({"CUR" : "1"})
+
+        records = dict(("_hoge{0}".format(i), blob + str(i)) for i in range(20))
+        self.tycoon.set_bulk(records)
+        r = self.tycoon.get_bulk(dict((k, "") for k in records))
+        self.assertEqual(20, int(r["num"]))
+        for k, v in records.iteritems():
+          self.assertEqual(v, r[k])
+        self.assertEqual(blob + "7", dict((k, v) for k, v, xt in self.tycoon.scan())["hoge7"])
+
+        pipeline = self.tycoon.pipeline()
+        pipeline.set({"key" : "piped"
+                      ,"value" : blob})
+        pipeline.get({"key" : "piped"})
+        self.assertEqual(blob, pipeline.execute()[1]["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
-
+      self.raw.set({"key" : "broken"
+                    ,"value" : CODEC_MAGIC + "?"})
+      self.assertRaises(TycoonCodecError
+                        ,self.tycoon.get
+                        ,{"key" : "broken"})
+      for name in ("append", "increment", "increment_double"):
+        self.assertRaises(TycoonCodecError
+                          ,getattr(self.tycoon, name)
+                          ,{"key" : "small"
+                            ,"value" : "hage"
+                            ,"num" : "1"})
+      self.assertRaises(TycoonCodecError
+                        ,self.tycoon.pipeline().append
+                        ,{"key" : "small"
+                          ,"value" : "hage"})
+      self.assertEqual("hage", self.raw.get({"key" : "small"})["value"])
+
+    def test_batch(self):
+      blob = "hage" * 100
+      batch = self.tycoon.batch()
       try:
-        self.tycoon.set({"key" : "hoge", "value" : "hage"})
-        r =  self.tycoon.get({"key" : "hoge"})
-        self.assertEqual("hage", r["value"])
-
-        self.tycoon.remove({"key" : "hoge"
-                            ,"DB" : "0"})
-        self.assertRaises(TycoonRecordNotExistError
-                          ,self.tycoon.get
-                          ,{"key" : "hoge"})
+        batch.set({"key" : "hoge"
+                   ,"value" : blob})
+        batch.get({"key" : "hoge"})
+        self.assertEqual(blob, batch.execute()[1]["value"])
+        self.assertEqual(blob, self.tycoon.get({"key" : "hoge"})["value"])
+        self.assertTrue(self.raw.get({"key" : "hoge"})["value"].startswith(CODEC_MAGIC))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
-
-    def test_set_bulk_and_get_bulk(self):
+      batch.append({"key" : "hoge"
+                    ,"value" : "!"})
+      self.assertRaises(TycoonCodecError
+                        ,batch.execute)
+      self.assertEqual(blob, self.tycoon.get({"key" : "hoge"})["value"])
+
+    def test_vcas(self):
+      blob = "hage" * 100
       try:
-        r = self.tycoon.set_bulk()
-        self.assertEqual(0, int(r["num"]))
+        version = self.tycoon.vcas({"key" : "hoge"
+                                    ,"nval" : blob})["version"]
+        self.assertTrue(self.raw.get({"key" : "hoge"})["value"].startswith(CODEC_MAGIC))
+        r = self.tycoon.vget({"key" : "hoge"})
+        self.assertEqual(blob, r["value"])
+        self.assertEqual(version, r["version"])
+        self.tycoon.vcas({"key" : "hoge"
+                          ,"version" : version
+                          ,"nval" : blob + "!"})
+        self.assertEqual(blob + "!", self.tycoon.get({"key" : "hoge"})["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      self.assertRaises(TycoonAssumptionFaildError
+                        ,self.tycoon.vcas
+                        ,{"key" : "hoge"
+                          ,"version" : version
+                          ,"nval" : blob})
 
+    def test_rest(self):
+      import StringIO
+      blob = "hage" * 100
+      tycoon = open("REST", codec=self.codec)
       try:
-        r = self.tycoon.set_bulk({"prefix_not_underline" : "hage"})
-        self.assertEqual(0, int(r["num"]))
-      except Exception, e:
-        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+        try:
+          tycoon.set({"key" : "hoge"
+                      ,"value" : blob})
+          self.assertEqual(blob, tycoon.get({"key" : "hoge"})["value"])
+        except Exception, e:
+          self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+        self.assertRaises(TycoonCodecError
+                          ,tycoon.get
+                          ,{"key" : "hoge"}
+                          ,fp=StringIO.StringIO())
+        self.assertRaises(TycoonCodecError
+                          ,tycoon.set
+                          ,{"key" : "hoge"
+                            ,"value" : StringIO.StringIO(blob + "!")})
+        self.assertEqual(blob, self.tycoon.get({"key" : "hoge"})["value"])
+      finally:
+        tycoon.close()
 
+  class TestCoalescedPyTycoon(unittest.TestCase):
+    def setUp(self):
+      from PyTycoon import fakeserver
+      self.server = fakeserver.FakeTycoonServer(port=0, latency=0.05).start()
+      self.metrics = Metrics()
+
+    def tearDown(self):
+      self.server.stop()
+
+    def concurrently(self, calls):
+      results = [None] * len(calls)
+      def run(i):
+        try:
+          results[i] = calls[i]()
+        except Exception, e:
+          results[i] = e
+      threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+      return results
+
+    def test_single_flight(self):
+      tycoon = open(port=self.server.port, pool_size=8, coalesce=True, instrument=self.metrics)
       try:
-        r = self.tycoon.set_bulk({"_hoge" : "hage"
-                                  ,"_foo" : "bar"
-                                  ,"_hello" : "world"
-                                  ,"DB" : "0"})
-        self.assertEqual(3, int(r["num"]))
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        self.metrics.reset()
+        results = self.concurrently([lambda: tycoon.get({"key" : "hoge"})] * 10
+                                    + [lambda: tycoon.get({"key" : "not_exist_key"})] * 5)
+        for r in results[:10]:
+          self.assertEqual("hage", r["value"])
+        for r in results[10:]:
+          self.assertTrue(isinstance(r, TycoonRecordNotExistError))
+        self.assertEqual(2, self.metrics.snapshot()["get"]["calls"])
+        self.assertRaises(TycoonRequiredArgumentError
+                          ,tycoon.get
+                          ,None)
+      finally:
+        tycoon.close()
+
+    def test_batch(self):
+      tycoon = open(port=self.server.port, pool_size=8, batch_window=0.2, instrument=self.metrics)
+      try:
+        tycoon.set_bulk(dict(("_hoge{0}".format(i), str(i)) for i in range(10)))
+        self.metrics.reset()
+        calls = [lambda i=i: tycoon.get({"key" : "hoge{0}".format(i)}) for i in range(10)]
+        results = self.concurrently(calls + [lambda: tycoon.get({"key" : "not_exist_key"})])
+        for i, r in enumerate(results[:10]):
+          self.assertEqual(str(i), r["value"])
+        self.assertTrue(isinstance(results[10], TycoonRecordNotExistError))
+        snapshot = self.metrics.snapshot()
+        self.assertTrue("get" not in snapshot)
+        self.assertEqual(1, snapshot["get_bulk"]["calls"])
+        self.assertEqual("0", tycoon.get({"key" : "hoge0"})["value"])
+      finally:
+        tycoon.close()
+
+    def test_batch_size(self):
+      tycoon = open(port=self.server.port, pool_size=16, batch_window=0.5, batch_size=4
+                    ,instrument=self.metrics)
+      try:
+        tycoon.set_bulk(dict(("_hoge{0}".format(i), str(i)) for i in range(10)))
+        self.metrics.reset()
+        results = self.concurrently([lambda i=i: tycoon.get({"key" : "hoge{0}".format(i)}) for i in range(10)])
+        for i, r in enumerate(results):
+          self.assertEqual(str(i), r["value"])
+        snapshot = self.metrics.snapshot()
+        self.assertTrue("get" not in snapshot)
+        self.assertEqual(3, snapshot["get_bulk"]["calls"])
+      finally:
+        tycoon.close()
+
+  class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+      self.metrics = Metrics()
+      self.tycoon = open(instrument=self.metrics)
+      self.tycoon.clear()
+      self.metrics.reset()
 
-        r = self.tycoon.get_bulk({"_hoge" : ""
-                                  ,"_foo" : ""
-                                  ,"_hello" : ""})
-        self.assertEqual(3, int(r["num"]))
-        self.assertEqual("hage", r["_hoge"])
-        self.assertEqual("bar", r["_foo"])
-        self.assertEqual("world", r["_hello"])
-      except Exception, e:
-        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+    def tearDown(self):
+      self.tycoon.close()
 
+    def test_flush(self):
       try:
-        r = self.tycoon.get_bulk({"prefix_not_underline" : ""})
-        self.assertEqual(0, int(r["num"]))
+        with self.tycoon.write_behind(max_count=10, interval=60) as buffer:
+          for i in range(25):
+            buffer.set({"key" : "hoge{0}".format(i % 15)
+                        ,"value" : str(i)})
+          buffer.remove({"key" : "hoge0"})
+          buffer.remove({"key" : "not_exist_key"})
+          buffer.set({"key" : "foo"
+                      ,"value" : "bar"
+                      ,"xt" : "60"})
+        self.assertEqual(15, int(self.tycoon.status()["count"]))
+        self.assertEqual("24", self.tycoon.get({"key" : "hoge9"})["value"])
+        self.assertEqual("12", self.tycoon.get({"key" : "hoge12"})["value"])
+        self.assertTrue(self.tycoon.get({"key" : "foo"})["xt"] is not None)
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "hoge0"})
+        self.assertTrue("set" not in self.metrics.snapshot())
+        self.assertRaises(TycoonClosedError
+                          ,buffer.set
+                          ,{"key" : "hoge"
+                            ,"value" : "hage"})
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+    def test_interval(self):
+      buffer = self.tycoon.write_behind(interval=0.05)
       try:
-        r = self.tycoon.get_bulk({"_hoge" : ""
-                                  ,"_foo" : ""
-                                  ,"_not_exist_key" : ""
-                                  ,"DB" : "0"})
-        self.assertEqual(2, int(r["num"]))
-        self.assertEqual("hage", r["_hoge"])
-        self.assertEqual("bar", r["_foo"])
+        buffer.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        time.sleep(0.3)
+        self.assertEqual(0, len(buffer))
+        self.assertEqual("hage", self.tycoon.get({"key" : "hoge"})["value"])
+        buffer.set({"key" : "foo"
+                    ,"value" : "bar"
+                    ,"DB" : "not_exist_db"})
+        self.assertRaises(TycoonBulkError
+                          ,buffer.flush)
+        self.assertEqual(1, len(buffer))
+      finally:
+        buffer.remove({"key" : "hoge"})
+        buffer.set({"key" : "foo"
+                    ,"value" : "bar"})
+        self.assertRaises(TycoonBulkError
+                          ,buffer.close)
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.get
+                        ,{"key" : "hoge"})
+
+  class TestChanges(unittest.TestCase):
+    def setUp(self):
+      self.tycoon = open(cache_size=1000)
+      self.raw = open()
+      self.changes = open_changes(ts=int(time.time() * 1e9))
+
+    def tearDown(self):
+      self.changes.close()
+      self.tycoon.close()
+      self.raw.close()
+
+    def test_stream(self):
+      try:
+        self.raw.set({"key" : "hoge"
+                      ,"value" : "hage"})
+        self.raw.set({"key" : "foo"
+                      ,"value" : "bar"
+                      ,"xt" : "-2000000000"})
+        self.raw.remove({"key" : "hoge"})
+        self.raw.clear()
+        changes = [self.changes.next() for i in range(4)]
+        self.assertEqual([("set", "hoge", "hage", None)
+                          ,("set", "foo", "bar", 2000000000)
+                          ,("remove", "hoge", None, None)
+                          ,("clear", None, None, None)]
+                         ,[(c.op, c.key, c.value, c.xt) for c in changes])
+        self.assertEqual(changes[-1].ts, self.changes.ts)
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+    def test_follow(self):
       try:
-        r = self.tycoon.set_bulk({"_hoge" : "hage"
-                                  ,"_foo" : "bar"
-                                  ,"_hello" : "world"
-                                  ,"DB" : "0"
-                                  ,"xt" : "1"})
-        self.assertEqual(3, int(r["num"]))
-        r = self.tycoon.get_bulk({"_hoge" : ""
-                                  ,"_foo" : ""
-                                  ,"_hello" : ""
-                                  ,"DB" : "0"})
-        self.assertEqual(3, int(r["num"]))
-        self.assertEqual("hage", r["_hoge"])
-        self.assertEqual("bar", r["_foo"])
-        self.assertEqual("world", r["_hello"])
-
-        time.sleep(2)
-        r = self.tycoon.get_bulk({"_hoge" : ""
-                                  ,"_foo" : ""
-                                  ,"_hello" : ""
-                                  ,"DB" : "0"})
-        self.assertEqual(0, int(r["num"]))
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.assertEqual("hage", self.tycoon.get({"key" : "hoge"})["value"])
+        self.changes.follow(self.tycoon)
+        self.raw.set({"key" : "hoge"
+                      ,"value" : "changed"})
+        for i in range(100):
+          if self.tycoon.get({"key" : "hoge"})["value"] == "changed": break
+          time.sleep(0.01)
+        self.assertEqual("changed", self.tycoon.get({"key" : "hoge"})["value"])
+        self.changes.close()
+        self.assertEqual(None, self.changes.error)
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-    def test_remove_bulk(self):
+  class TestRestPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.tycoon = open(method="REST")
+      self.tycoon.clear()
+
+    def test_stream(self):
+      import StringIO
+      value = "".join(chr(i) for i in range(256)) * 1024
       try:
-        r = self.tycoon.remove_bulk()
-        self.assertEqual(0, int(r["num"]))
+        self.tycoon.set({"key" : "hoge/hage"
+                         ,"value" : StringIO.StringIO(value)})
+        self.tycoon.set({"key" : "foo"
+                         ,"value" : memoryview(value)[:10]
+                         ,"xt" : "100"})
+        r = self.tycoon.check({"key" : "hoge/hage"})
+        self.assertEqual(len(value), int(r["vsiz"]))
+        self.assertFalse("xt" in r)
+        fp = StringIO.StringIO()
+        r = self.tycoon.get({"key" : "hoge/hage"}
+                            ,fp=fp
+                            ,chunk_size=1000)
+        self.assertEqual(value, fp.getvalue())
+        r = self.tycoon.get({"key" : "foo"})
+        self.assertEqual(value[:10], r["value"])
+        self.assertTrue(int(r["xt"]) > time.time())
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.check
+                        ,{"key" : "not_exist_key"})
+
+  class TestInstrumentedPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.metrics = Metrics()
+      self.tycoon = open(instrument=self.metrics)
+      self.tycoon.clear()
 
+    def test_metrics(self):
+      self.metrics.reset()
       try:
-        r = self.tycoon.remove_bulk({"prefix_not_underline" : "hage"})
-        self.assertEqual(0, int(r["num"]))
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "hage"})
+        self.tycoon.get({"key" : "hoge"})
+        self.assertRaises(TycoonRecordNotExistError
+                          ,self.tycoon.get
+                          ,{"key" : "not_exist_key"})
+        r = self.metrics.snapshot()
+        self.assertEqual(1, r["set"]["calls"])
+        self.assertEqual(2, r["get"]["calls"])
+        self.assertEqual({(200, "ok") : 1
+                          ,(450, "TycoonRecordNotExistError") : 1}, r["get"]["responses"])
+        self.assertTrue(r["get"]["sent_bytes"] > 0)
+        self.assertTrue(r["get"]["received_bytes"] > 0)
+        self.assertTrue(r["get"]["network_seconds"] <= r["get"]["seconds"])
+        text = self.metrics.prometheus()
+        self.assertTrue('pytycoon_calls_total{procedure="get"} 2' in text)
+        self.assertTrue('pytycoon_responses_total{procedure="get",status="450",outcome="TycoonRecordNotExistError"} 1' in text)
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
+  class TestRetryPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.tycoon = open(retry=RetryPolicy(backoff=0.001))
+      self.tycoon.clear()
+
+    def test_retry(self):
       try:
-        r = self.tycoon.set_bulk({"_hoge" : "hage"
-                                  ,"_foo" : "bar"
-                                  ,"_hello" : "world"
-                                  ,"DB" : "0"})
-        r = self.tycoon.remove_bulk({"_hoge" : ""
-                                     ,"_foo" : ""
-                                     ,"_hello" : ""})
-        self.assertEqual(3, int(r["num"]))
-        r = self.tycoon.get_bulk({"_hoge" : ""
-                                  ,"_foo" : ""
-                                  ,"_hello" : ""
-                                  ,"DB" : "0"})
-        self.assertEqual(0, int(r["num"]))
+        self.tycoon.set({"key" : "hoge"
+                         ,"value" : "1"})
+        # a keep-alive connection the server has dropped.
+        self.tycoon.connection.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual("1", self.tycoon.get({"key" : "hoge"})["value"])
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
+      self.tycoon.connection.sock.shutdown(socket.SHUT_RDWR)
+      self.assertRaises((socket.error, httplib.HTTPException)
+                        ,self.tycoon.increment
+                        ,{"key" : "hoge"
+                          ,"num" : "1"})
+      self.assertEqual("1", self.tycoon.get({"key" : "hoge"})["value"])
+
+      listener = socket.socket()
+      listener.bind((DEFAULT_HOST, 0))
+      port = listener.getsockname()[1]
+      listener.close()
+      tycoon = open(port=port
+                    ,retry=RetryPolicy(attempts=3
+                                       ,backoff=0.001))
+      self.assertRaises(socket.error
+                        ,tycoon.increment
+                        ,{"key" : "hoge"
+                          ,"num" : "1"})
 
+    def test_rest(self):
+      tycoon = open(method="REST"
+                    ,retry=RetryPolicy(backoff=0.001))
       try:
-        r = self.tycoon.set_bulk({"_hoge" : "hage"
-                                  ,"_foo" : "bar"
-                                  ,"_hello" : "world"
-                                  ,"DB" : "0"})
-        r = self.tycoon.remove_bulk({"_hoge" : ""
-                                     ,"_foo" : ""
-                                     ,"_not_exist_key" : ""})
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "1"})
+        tycoon.connection.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual("1", tycoon.get({"key" : "hoge"})["value"])
+        tycoon.connection.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual("1", tycoon.check({"key" : "hoge"})["vsiz"])
+        tycoon.connection.sock.shutdown(socket.SHUT_RDWR)
+        self.assertRaises((socket.error, httplib.HTTPException)
+                          ,tycoon.add
+                          ,{"key" : "hage"
+                            ,"value" : "1"})
+      finally:
+        tycoon.close()
+
+  class TestBinaryPyTycoon(TestGetPyTycoon):
+    def setUp(self):
+      self.tycoon = open(method="BINARY")
+      self.tycoon.clear()
+
+    def test_noreply(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.set_bulk
+                        ,{"_hoge" : "hage"
+                          ,"DB" : "not_index"})
+      try:
+        r = self.tycoon.set_bulk({"_hoge" : "hage\t\n\0"
+                                  ,"_foo" : "bar"}
+                                 ,noreply=True)
+        self.assertEqual(None, r)
+        r = self.tycoon.get_bulk({"_hoge" : ""
+                                  ,"_foo" : ""})
         self.assertEqual(2, int(r["num"]))
+        self.assertEqual("hage\t\n\0", r["_hoge"])
+        r = self.tycoon.remove_bulk({"_hoge" : ""}
+                                    ,noreply=True)
+        self.assertEqual(None, r)
+        # status goes over HTTP, so wait for the frame through the binary socket first.
         r = self.tycoon.get_bulk({"_hoge" : ""
-                                  ,"_foo" : ""
-                                  ,"_hello" : ""})
+                                  ,"_foo" : ""})
         self.assertEqual(1, int(r["num"]))
+        self.assertEqual(1, int(self.tycoon.status()["count"]))
       except Exception, e:
         self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-#     def test_vacuum(self):
-#       pass
+  class TestBenchmark(unittest.TestCase):
+    def test_run(self):
+      from PyTycoon import benchmark
+      r = benchmark.run(methods=("GET", "ASYNC")
+                        ,count=20
+                        ,bulk=10)
+      self.assertEqual("fake", r["server"])
+      self.assertEqual(8, len(r["results"]))
+      for result in r["results"]:
+        self.assertEqual(20, result["records"])
+        self.assertTrue(result["p50_ms"] <= result["p99_ms"])
+
+    def test_live(self):
+      from PyTycoon import benchmark
+      tycoon = open()
+      try:
+        tycoon.clear()
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        r = benchmark.run(methods=("GET", "ASYNC")
+                          ,host=DEFAULT_HOST
+                          ,port=DEFAULT_PORT
+                          ,count=20
+                          ,bulk=10)
+        self.assertEqual(8, len(r["results"]))
+        self.assertEqual(1, int(tycoon.status()["count"]))
+        self.assertEqual("hage", tycoon.get({"key" : "hoge"})["value"])
+        r = benchmark.run(methods=("GET", "ASYNC")
+                          ,count=0)
+        for result in r["results"]:
+          self.assertEqual(None, result["p99_ms"])
+      finally:
+        tycoon.close()
+
+    def test_unordered(self):
+      from PyTycoon import benchmark, fakeserver
+      server = fakeserver.FakeTycoonServer(port=0, ordered=False).start()
+      try:
+        tycoon = open(port=server.port)
+        tycoon.set({"key" : "hoge"
+                    ,"value" : "hage"})
+        r = benchmark.run(methods=("GET", "BINARY")
+                          ,host=server.host
+                          ,port=server.port
+                          ,count=20
+                          ,bulk=10)
+        self.assertEqual(8, len(r["results"]))
+        self.assertEqual(["set", "get", "set_bulk", "get_bulk"], [result["operation"] for result in r["results"][:4]])
+        self.assertEqual(1, int(tycoon.status()["count"]))
+        tycoon.close()
+      finally:
+        server.stop()
+
+  class TestExport(unittest.TestCase):
+    def setUp(self):
+      import tempfile
+      from PyTycoon import fakeserver
+      self.server = fakeserver.FakeTycoonServer(port=0).start()
+      self.directory = tempfile.mkdtemp()
+      tycoon = open(port=self.server.port)
+      self.records = [("hoge{0:04d}".format(i), "hage\t{0}%".format(i), None) for i in xrange(1000)]
+      tycoon.set_many((key, value) for key, value, xt in self.records)
+      tycoon.close()
 
-#     def test_cur_jump(self):
-#       pass
+    def tearDown(self):
+      import shutil
+      shutil.rmtree(self.directory)
+      self.server.stop()
+
+    def test_run(self):
+      import __builtin__
+      from PyTycoon import export
+      reports = []
+      r = export.run(self.directory, port=self.server.port, partitions=4, workers=2, batch=50
+                     ,checkpoint=100, report=reports.append, interval=0.01)
+      self.assertEqual(4, r["partitions"])
+      self.assertEqual(1000, r["records"])
+      self.assertEqual(self.records, list(export.read(self.directory)))
+      for report in reports:
+        self.assertEqual(4, report["partitions"])
+      self.assertEqual({"records" : 1000, "done" : 4, "partitions" : 4}, export.progress(self.directory))
+      # interrupted after the first checkpoint of the second partition
+      path = os.path.join(self.directory, "part-00001")
+      state = export._readJson(path + ".state")
+      with __builtin__.open(path + ".tsv", "rb") as f:
+        lines = f.readlines()
+      state.update(last=urllib.quote(lines[99].split("\t")[0]), offset=len("".join(lines[:100]))
+                   ,count=100, done=False)
+      export._writeJson(path + ".state", state)
+      with __builtin__.open(path + ".tsv", "wb") as f:
+        f.write("".join(lines[:150]) + "hoge")
+      r = export.run(self.directory, port=self.server.port, processes=True)
+      self.assertEqual(1000, r["records"])
+      self.assertEqual(self.records, list(export.read(self.directory)))
+
+  class TestAsyncPyTycoon(unittest.TestCase):
+    def setUp(self):
+      self.tycoon = open_async(method="POST", pool_size=4)
+      self.tycoon.clear().result()
 
-#     def test_cur_jump_back(self):
-#       pass
+    def tearDown(self):
+      self.tycoon.close()
 
-#     def test_cur_step(self):
-#       pass
+    def test_set_and_get(self):
+      self.assertRaises(TycoonRequiredArgumentError
+                        ,self.tycoon.get
+                        ,{})
 
-#     def test_cur_back(self):
-#       pass
+      self.assertRaises(TycoonRecordNotExistError
+                        ,self.tycoon.get({"key" : "not_exist_key"}).result)
+      try:
+        futures = [self.tycoon.set({"key" : "hoge{0}".format(i)
+                                    ,"value" : "hage{0}".format(i)}) for i in range(20)]
+        for f in futures:
+          self.assertEqual(None, f.result())
+        futures = [self.tycoon.get({"key" : "hoge{0}".format(i)}) for i in range(20)]
+        for i, f in enumerate(futures):
+          self.assertEqual("hage{0}".format(i), f.result()["value"])
+      except Exception, e:
+        self.fail("{0}\t:\t{1}".format(e.__class__.__name__, e))
 
-#     def test_cur_back(self):
-#       pass
+    def test_close(self):
+      self.tycoon.close()
+      self.assertRaises(TycoonClosedError
+                        ,self.tycoon.echo)
+
+    def test_close_race(self):
+      errors = []
+      def worker():
+        for i in range(200):
+          try:
+            self.tycoon.echo()
+          except TycoonClosedError:
+            return
+          except Exception, e:
+            errors.append(e)
+            return
+      threads = [threading.Thread(target=worker) for i in range(4)]
+      for t in threads: t.start()
+      time.sleep(0.01)
+      self.tycoon.close()
+      for t in threads: t.join()
+      self.assertEqual([], errors)
 
-#     def test_set_value(self):
-#       pass
+  getsuite = unittest.TestLoader().loadTestsFromTestCase(TestGetPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(getsuite)
 
-#     def test_cur_remove(self):
-#       pass
+  postsuite = unittest.TestLoader().loadTestsFromTestCase(TestPostPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(postsuite)
 
-#     def test_cur_get_key(self):
-#       pass
+  pooledsuite = unittest.TestLoader().loadTestsFromTestCase(TestPooledPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(pooledsuite)
 
-#     def test_cur_get_value(self):
-#       pass
+  cachedsuite = unittest.TestLoader().loadTestsFromTestCase(TestCachedPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(cachedsuite)
 
-#     def test_cur_get(self):
-#       pass
+  shardedsuite = unittest.TestLoader().loadTestsFromTestCase(TestShardedPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(shardedsuite)
 
-#     def test_cur_delete(self):
-#       pass
+  replicatedsuite = unittest.TestLoader().loadTestsFromTestCase(TestReplicatedPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(replicatedsuite)
 
-  class TestPostPyTycoon(TestGetPyTycoon):
-    def setUp(self):
-      self.tycoon = open(method="POST")
-      self.tycoon.clear()
+  codecsuite = unittest.TestLoader().loadTestsFromTestCase(TestCodecPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(codecsuite)
 
-  getsuite = unittest.TestLoader().loadTestsFromTestCase(TestGetPyTycoon)
-  unittest.TextTestRunner(verbosity=2).run(getsuite)
+  coalescedsuite = unittest.TestLoader().loadTestsFromTestCase(TestCoalescedPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(coalescedsuite)
 
-  postsuite = unittest.TestLoader().loadTestsFromTestCase(TestPostPyTycoon)
-  unittest.TextTestRunner(verbosity=2).run(postsuite)
+  writebehindsuite = unittest.TestLoader().loadTestsFromTestCase(TestWriteBehind)
+  unittest.TextTestRunner(verbosity=2).run(writebehindsuite)
+
+  changessuite = unittest.TestLoader().loadTestsFromTestCase(TestChanges)
+  unittest.TextTestRunner(verbosity=2).run(changessuite)
+
+  restsuite = unittest.TestLoader().loadTestsFromTestCase(TestRestPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(restsuite)
+
+  instrumentedsuite = unittest.TestLoader().loadTestsFromTestCase(TestInstrumentedPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(instrumentedsuite)
+
+  retrysuite = unittest.TestLoader().loadTestsFromTestCase(TestRetryPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(retrysuite)
+
+  binarysuite = unittest.TestLoader().loadTestsFromTestCase(TestBinaryPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(binarysuite)
+
+  asyncsuite = unittest.TestLoader().loadTestsFromTestCase(TestAsyncPyTycoon)
+  unittest.TextTestRunner(verbosity=2).run(asyncsuite)
+
+  benchmarksuite = unittest.TestLoader().loadTestsFromTestCase(TestBenchmark)
+  unittest.TextTestRunner(verbosity=2).run(benchmarksuite)
+  exportsuite = unittest.TestLoader().loadTestsFromTestCase(TestExport)
+  unittest.TextTestRunner(verbosity=2).run(exportsuite)
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""
+Throughput and latency of the clients, as JSON.
+
+Runs against the in-process fake server unless a live ktserver is given:
+
+python -m PyTycoon.benchmark --latency 0.0005 --count 2000 > before.json
+python -m PyTycoon.benchmark --host 10.0.0.1 --port 1978 --methods GET,BINARY
+
+Every (method, operation) pair gets an entry with the number of calls and
+records, ops/sec, records/sec and the p50/p99 call latency in milliseconds.
+The records of a run are written under a key prefix of its own and removed
+at the end, so the other records of a live database are left alone. The
+cursor and scan benchmarks need an ordered database such as a tree database
+and are left out on any other.
+"""
+
+import sys
+import time
+import random
+import json
+import optparse
+import threading
+
+import PyTycoon
+from PyTycoon import fakeserver
+
+METHODS = ("GET", "POST", "REST", "BINARY", "ASYNC")
+DEFAULT_COUNT = 1000
+DEFAULT_VALUE_SIZE = 100
+DEFAULT_BULK = 100
+
+def percentile(times, p):
+  if not times: return None
+  return times[min(len(times) - 1, int(len(times) * p))]
+
+def milliseconds(seconds):
+  return seconds * 1000 if seconds is not None else None
+
+def summarize(method, operation, times, seconds, records=None):
+  times = sorted(times)
+  records = records or len(times)
+  return {"method" : method
+          ,"operation" : operation
+          ,"calls" : len(times)
+          ,"records" : records
+          ,"seconds" : seconds
+          ,"ops_per_sec" : len(times) / seconds if seconds else None
+          ,"records_per_sec" : records / seconds if seconds else None
+          ,"p50_ms" : milliseconds(percentile(times, 0.5))
+          ,"p99_ms" : milliseconds(percentile(times, 0.99))}
+
+# Call f(i) for i in range(calls), timing every call.
+def measure(method, operation, f, calls, records=None):
+  times = []
+  start = time.time()
+  for i in xrange(calls):
+    t = time.time()
+    f(i)
+    times.append(time.time() - t)
+  return summarize(method, operation, times, time.time() - start, records)
+
+# Keys of a run, under a prefix of their own so that a live database is
+# left as it was once they are removed.
+def benchKeys(count):
+  prefix = "pytycoon-benchmark-{0:08x}-".format(random.getrandbits(32))
+  return prefix, [prefix + "{0:08d}".format(i) for i in xrange(count)]
+
+def bench(method, host, port, count, valueSize, bulk):
+  value = "v" * valueSize
+  prefix, keys = benchKeys(count)
+  bulks = [keys[i:i + bulk] for i in xrange(0, count, bulk)]
+  tycoon = PyTycoon.open(method, host, port)
+  try:
+    results = []
+    results.append(measure(method, "set"
+                           ,lambda i: tycoon.set({"key" : keys[i]
+                                                  ,"value" : value})
+                           ,count))
+    results.append(measure(method, "get"
+                           ,lambda i: tycoon.get({"key" : keys[i]})
+                           ,count))
+    results.append(measure(method, "set_bulk"
+                           ,lambda i: tycoon.set_bulk(dict(("_" + k, value) for k in bulks[i]))
+                           ,len(bulks), count))
+    results.append(measure(method, "get_bulk"
+                           ,lambda i: tycoon.get_bulk(dict(("_" + k, "") for k in bulks[i]))
+                           ,len(bulks), count))
+    # the cursor and the scan walk the keys from the prefix on, which only
+    # an ordered database can jump to: they are skipped on any other.
+    if keys:
+      try:
+        tycoon.cur_jump({"CUR" : "1"
+                         ,"key" : prefix})
+      except (PyTycoon.TycoonInvalidCursorError, PyTycoon.TycoonNotImplementedError):
+        tycoon.cur_delete({"CUR" : "1"})
+        return results
+    results.append(measure(method, "cur_get"
+                           ,lambda i: tycoon.cur_get({"CUR" : "1"
+                                                      ,"step" : "true"})
+                           ,count))
+    if keys:
+      tycoon.cur_delete({"CUR" : "1"})
+    records = tycoon.scan(prefix=prefix, batch=bulk)
+    results.append(measure(method, "scan"
+                           ,lambda i: records.next()
+                           ,count))
+    records.close()
+    return results
+  finally:
+    try:
+      for chunk in bulks:
+        tycoon.remove_bulk(dict(("_" + k, "") for k in chunk))
+    finally:
+      tycoon.close()
+
+# get and set through open_async, with every call in flight at once and
+# the latency taken from the call to the completion of its future.
+def benchAsync(host, port, count, valueSize, poolSize=8):
+  value = "v" * valueSize
+  prefix, keys = benchKeys(count)
+  tycoon = PyTycoon.open_async("GET", host, port, pool_size=poolSize)
+  try:
+    results = []
+    for operation in ("set", "get"):
+      times = []
+      lock = threading.Lock()
+      def done(start):
+        def callback(future):
+          lock.acquire()
+          try:
+            times.append(time.time() - start)
+          finally:
+            lock.release()
+        return callback
+      start = time.time()
+      futures = []
+      for key in keys:
+        d = {"key" : key}
+        if operation == "set":
+          d["value"] = value
+        future = getattr(tycoon, operation)(d)
+        future.add_done_callback(done(time.time()))
+        futures.append(future)
+      for future in futures:
+        future.result()
+      seconds = time.time() - start
+      while len(times) < count:
+        time.sleep(0.001)
+      results.append(summarize("ASYNC", operation, times, seconds))
+    return results
+  finally:
+    try:
+      for i in xrange(0, count, DEFAULT_BULK):
+        tycoon.remove_bulk(dict(("_" + k, "") for k in keys[i:i + DEFAULT_BULK])).result()
+    finally:
+      tycoon.close()
+
+# Run the benchmarks and return the report as a dict. With no host, a fake
+# server answering after latency seconds is started for the run.
+def run(methods=METHODS, host=None, port=fakeserver.DEFAULT_PORT, latency=0.0
+        ,count=DEFAULT_COUNT, value_size=DEFAULT_VALUE_SIZE, bulk=DEFAULT_BULK):
+  server = None
+  if host is None:
+    server = fakeserver.FakeTycoonServer(port=0, latency=latency).start()
+    host, port = server.host, server.port
+  try:
+    results = []
+    for method in methods:
+      if method == "ASYNC":
+        results.extend(benchAsync(host, port, count, value_size))
+      else:
+        results.extend(bench(method, host, port, count, value_size, bulk))
+  finally:
+    if server is not None:
+      server.stop()
+  return {"version" : PyTycoon.__version__
+          ,"python" : sys.version.split()[0]
+          ,"server" : server and "fake" or "{0}:{1}".format(host, port)
+          ,"latency" : server and latency or None
+          ,"count" : count
+          ,"value_size" : value_size
+          ,"bulk" : bulk
+          ,"results" : results}
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option("--host", help="a live ktserver instead of the fake server")
+  parser.add_option("--port", type="int", default=fakeserver.DEFAULT_PORT)
+  parser.add_option("--latency", type="float", default=0.0
+                    ,help="delay of the fake server before every answer, in seconds")
+  parser.add_option("--count", type="int", default=DEFAULT_COUNT)
+  parser.add_option("--value-size", type="int", default=DEFAULT_VALUE_SIZE)
+  parser.add_option("--bulk", type="int", default=DEFAULT_BULK)
+  parser.add_option("--methods", default=",".join(METHODS))
+  parser.add_option("--output", help="write the JSON report here instead of stdout")
+  options, args = parser.parse_args()
+  report = run(options.methods.split(","), options.host, options.port, options.latency
+               ,options.count, options.value_size, options.bulk)
+  out = options.output and open(options.output, "w") or sys.stdout
+  json.dump(report, out, indent=2, sort_keys=True)
+  out.write("\n")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Parallel export of a database to partitioned files.
+
+The keyspace is cut into ranges at split points sampled with a cursor, and
+the ranges are walked concurrently, each by a cursor of its own, from a pool
+of threads or processes:
+
+python -m PyTycoon.export --port 1978 --partitions 64 --workers 8 /data/export
+
+Every range is written to a file of its own, part-00000.tsv and so on, one
+record per line as the URL-encoded key, the URL-encoded value and the
+expiration time, separated by tabs. Next to it part-00000.state records how
+far the range got as of its last checkpoint, and manifest.json the split
+points; running the export again on the same directory resumes every range
+that is not done from its last checkpoint.
+
+Split points are even in the keyspace between the first and the last key,
+not in the number of records, so use several times as many partitions as
+workers for skewed keys: the workers take the ranges one after the other.
+Ranges require an ordered database such as a tree database; any other
+database is exported as a single range.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import urllib
+import optparse
+import multiprocessing
+import multiprocessing.pool
+
+import PyTycoon
+
+DEFAULT_PARTITIONS = 16
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH = 1000
+DEFAULT_CHECKPOINT = 10000
+DEFAULT_PROGRESS_INTERVAL = 1.0
+MANIFEST = "manifest.json"
+# bytes of the keys, after their common prefix, the split points are
+# interpolated over.
+SPLIT_WIDTH = 8
+
+def _quote(s):
+  return urllib.quote(s, "") if s is not None else None
+
+def _unquote(s):
+  return urllib.unquote(s) if s is not None else None
+
+def _toInt(s):
+  return int(s[:SPLIT_WIDTH].ljust(SPLIT_WIDTH, "\0").encode("hex"), 16)
+
+def _fromInt(n):
+  return ("{0:0" + str(SPLIT_WIDTH * 2) + "x}").format(n).decode("hex").rstrip("\0")
+
+# Up to partitions - 1 keys cutting the keyspace of the database into
+# ranges of about the same width, found by jumping a cursor to points
+# interpolated between the first and the last key.
+def sample_splits(tycoon, partitions, db=None):
+  d = {"CUR" : str(random.getrandbits(31))}
+  if db is not None:
+    d["DB"] = db
+  try:
+    try:
+      tycoon.cur_jump(d)
+      first = tycoon.cur_get_key(d)["key"]
+      tycoon.cur_jump_back(d)
+      last = tycoon.cur_get_key(d)["key"]
+    except (PyTycoon.TycoonInvalidCursorError, PyTycoon.TycoonNotImplementedError):
+      return []
+    prefix = os.path.commonprefix([first, last])
+    low = _toInt(first[len(prefix):])
+    high = _toInt(last[len(prefix):])
+    splits = set()
+    for i in xrange(1, partitions):
+      point = prefix + _fromInt(low + (high - low) * i // partitions)
+      try:
+        tycoon.cur_jump(dict(d, key=point))
+        key = tycoon.cur_get_key(d)["key"]
+      except PyTycoon.TycoonInvalidCursorError:
+        continue
+      if first < key <= last:
+        splits.add(key)
+    return sorted(splits)
+  finally:
+    try:
+      tycoon.cur_delete(d)
+    except PyTycoon.TycoonBaseError:
+      pass
+
+def _partPath(directory, index):
+  return os.path.join(directory, "part-{0:05d}".format(index))
+
+def _readJson(path):
+  try:
+    with open(path, "rb") as f:
+      return json.load(f)
+  except IOError:
+    return None
+
+# Replace path by a file holding obj, so that a crash leaves either the old
+# or the new one.
+def _writeJson(path, obj):
+  with open(path + ".tmp", "wb") as f:
+    json.dump(obj, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.rename(path + ".tmp", path)
+
+# Export the keys from start included to end excluded, None standing for
+# either end of the database, to the index-th partition of directory,
+# starting over from its last checkpoint. Returns the number of records of
+# the partition.
+def export_range(method, host, port, timeout, directory, index, start, end, db=None
+                 ,batch=DEFAULT_BATCH, checkpoint=DEFAULT_CHECKPOINT):
+  path = _partPath(directory, index)
+  state = _readJson(path + ".state") or {"start" : _quote(start)
+                                         ,"end" : _quote(end)
+                                         ,"last" : None
+                                         ,"offset" : 0
+                                         ,"count" : 0
+                                         ,"done" : False}
+  if state["done"]:
+    return state["count"]
+  last = _unquote(state["last"])
+  count = state["count"]
+  out = open(path + ".tsv", os.path.exists(path + ".tsv") and "r+b" or "wb")
+  tycoon = PyTycoon.open(method, host, port, timeout)
+  try:
+    # drop what was written after the checkpoint.
+    out.truncate(state["offset"])
+    out.seek(state["offset"])
+    def save(done):
+      out.flush()
+      os.fsync(out.fileno())
+      state.update(last=_quote(last), offset=out.tell(), count=count, done=done)
+      _writeJson(path + ".state", state)
+    records = tycoon.scan(db=db, batch=batch, start=start if last is None else last, end=end)
+    try:
+      for key, value, xt in records:
+        if last is not None and key <= last: continue
+        out.write("{0}\t{1}\t{2}\n".format(_quote(key), _quote(value), xt or ""))
+        last = key
+        count += 1
+        if count % checkpoint == 0:
+          save(False)
+    finally:
+      records.close()
+    save(True)
+    return count
+  finally:
+    tycoon.close()
+    out.close()
+
+def _exportRange(args):
+  return export_range(*args)
+
+# Records and finished partitions so far, from the state files.
+def progress(directory):
+  manifest = _readJson(os.path.join(directory, MANIFEST))
+  partitions = len(manifest["splits"]) + 1
+  records = 0
+  done = 0
+  for index in xrange(partitions):
+    state = _readJson(_partPath(directory, index) + ".state")
+    if state is None: continue
+    records += state["count"]
+    done += state["done"] and 1 or 0
+  return {"records" : records
+          ,"done" : done
+          ,"partitions" : partitions}
+
+# Export the database to directory, or resume the export there, and return
+# a report dict. report is called with progress(directory) every interval
+# seconds while the export runs.
+def run(directory, host=PyTycoon.DEFAULT_HOST, port=PyTycoon.DEFAULT_PORT, method="GET", db=None
+        ,partitions=DEFAULT_PARTITIONS, workers=DEFAULT_WORKERS, processes=False
+        ,batch=DEFAULT_BATCH, checkpoint=DEFAULT_CHECKPOINT, timeout=PyTycoon.DEFAULT_TIMEOUT
+        ,report=None, interval=DEFAULT_PROGRESS_INTERVAL):
+  start = time.time()
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  manifest = _readJson(os.path.join(directory, MANIFEST))
+  if manifest is None:
+    tycoon = PyTycoon.open(method, host, port, timeout)
+    try:
+      splits = sample_splits(tycoon, partitions, db)
+    finally:
+      tycoon.close()
+    manifest = {"db" : db
+                ,"splits" : [_quote(split) for split in splits]}
+    _writeJson(os.path.join(directory, MANIFEST), manifest)
+  bounds = [None] + [_unquote(split) for split in manifest["splits"]] + [None]
+  tasks = [(method, host, port, timeout, directory, index, bounds[index], bounds[index + 1]
+            ,manifest["db"], batch, checkpoint) for index in xrange(len(bounds) - 1)]
+  if processes:
+    pool = multiprocessing.Pool(workers)
+  else:
+    pool = multiprocessing.pool.ThreadPool(workers)
+  try:
+    result = pool.map_async(_exportRange, tasks)
+    while not result.ready():
+      result.wait(interval)
+      if report is not None:
+        report(progress(directory))
+    counts = result.get()
+  finally:
+    pool.terminate()
+    pool.join()
+  return {"partitions" : len(tasks)
+          ,"records" : sum(counts)
+          ,"seconds" : time.time() - start}
+
+# Iterate over the (key, value, xt) records of an export, in key order.
+def read(directory):
+  manifest = _readJson(os.path.join(directory, MANIFEST))
+  for index in xrange(len(manifest["splits"]) + 1):
+    with open(_partPath(directory, index) + ".tsv", "rb") as f:
+      for line in f:
+        key, value, xt = line.rstrip("\n").split("\t")
+        yield urllib.unquote(key), urllib.unquote(value), xt or None
+
+def main():
+  parser = optparse.OptionParser(usage="%prog [options] directory")
+  parser.add_option("--host", default=PyTycoon.DEFAULT_HOST)
+  parser.add_option("--port", type="int", default=PyTycoon.DEFAULT_PORT)
+  parser.add_option("--method", default="GET")
+  parser.add_option("--db")
+  parser.add_option("--partitions", type="int", default=DEFAULT_PARTITIONS)
+  parser.add_option("--workers", type="int", default=DEFAULT_WORKERS)
+  parser.add_option("--processes", action="store_true", default=False
+                    ,help="walk the ranges from processes instead of threads")
+  parser.add_option("--batch", type="int", default=DEFAULT_BATCH)
+  parser.add_option("--checkpoint", type="int", default=DEFAULT_CHECKPOINT)
+  options, args = parser.parse_args()
+  if len(args) != 1:
+    parser.error("no directory")
+  def report(p):
+    sys.stderr.write("{0} records, {1}/{2} partitions\n".format(p["records"], p["done"], p["partitions"]))
+  r = run(args[0], options.host, options.port, options.method, options.db
+          ,options.partitions, options.workers, options.processes
+          ,options.batch, options.checkpoint, report=report)
+  json.dump(r, sys.stdout, indent=2, sort_keys=True)
+  sys.stdout.write("\n")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,713 @@
+#!/usr/bin/env python
+
+"""
+In-process stand-in for ktserver, for tests and benchmarks.
+
+Speaks the /rpc/* procedures, the RESTful interface and the binary protocol
+(set_bulk, get_bulk, remove_bulk, play_script and replication) over one
+in-memory database, with an optional delay before every answer.
+
+from PyTycoon import fakeserver
+
+server = fakeserver.FakeTycoonServer(port=0, latency=0.001)
+server.start()
+tycoon = PyTycoon.open(port=server.port)
+...
+server.stop()
+"""
+
+import SocketServer
+import socket
+import threading
+import time
+import urllib
+import urlparse
+import base64
+import binascii
+import bisect
+import struct
+import email.utils
+import re
+import hashlib
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 1978
+DATABASES = ("0", "casket.kch")
+NO_XT = 0x7FFFFFFFFFFFFFFF
+ULOG_NO_XT = (1 << 40) - 1
+DEFAULT_SID = 1
+REASONS = {200 : "OK"
+           ,201 : "Created"
+           ,204 : "No Content"
+           ,400 : "Bad Request"
+           ,404 : "Not Found"
+           ,450 : "Logical Error"
+           ,501 : "Not Implemented"}
+COLENC_DECODERS = {"B" : base64.b64decode
+                   ,"Q" : binascii.a2b_qp
+                   ,"U" : urllib.unquote}
+ENCODE_MATCH = re.compile(r"[\t\n\r\x00-\x1f\x7f-\xff]")
+
+_SET_RECORD = struct.Struct(">HIIq")
+_KEY_RECORD = struct.Struct(">HI")
+_SCRIPT_RECORD = struct.Struct(">II")
+_COUNT = struct.Struct(">II")
+_SCRIPT_HEAD = struct.Struct(">III")
+_REPLICATION_REQUEST = struct.Struct(">IQH")
+_REPLICATION_RECORD = struct.Struct(">BQI")
+_ULOG_HEAD = struct.Struct(">HHB")
+_TS = struct.Struct(">Q")
+
+def _varnum(num):
+  data = chr(num & 0x7f)
+  num >>= 7
+  while num:
+    data = chr(0x80 | (num & 0x7f)) + data
+    num >>= 7
+  return data
+
+def _levenshtein(a, b):
+  row = range(len(b) + 1)
+  for i, ca in enumerate(a):
+    previous, row = row, [i + 1]
+    for j, cb in enumerate(b):
+      row.append(min(previous[j + 1] + 1, row[j] + 1, previous[j] + (ca != cb)))
+  return row[-1]
+
+class LogicalError(Exception):
+  pass
+
+class InvalidError(Exception):
+  pass
+
+# Stands in for the version of pytycoon.lua, which the fake cannot compute.
+def _version(value):
+  return "{0}:{1}".format(len(value), hashlib.md5(value).hexdigest())
+
+# pytycoon_batch of pytycoon.lua: run operations <i>.op on <i>.key and the
+# other <i>.* arguments in order, answering <i>.status and their results.
+def _batch(db, records):
+  if records.get("DB", "0") not in DATABASES:
+    raise InvalidError("no such database")
+  output = []
+  for i in xrange(int(records["n"])):
+    p = "{0}.".format(i)
+    d = dict((k[len(p):], v) for k, v in records.iteritems() if k.startswith(p))
+    op = d.get("op")
+    key = d.get("key")
+    r = key is not None and db.get(key)
+    xt = _expires(d.get("xt"))
+    status = "ok"
+    if key is None:
+      status = "400"
+    elif op in ("get", "vget"):
+      if r:
+        output.append((p + "value", r[0]))
+        if r[1] is not None:
+          output.append((p + "xt", str(r[1])))
+        if op == "vget":
+          output.append((p + "version", _version(r[0])))
+      else:
+        status = "450"
+    elif op == "vcas":
+      if (r and _version(r[0])) != d.get("version"):
+        status = "450"
+      elif "nval" in d:
+        db.set(key, d["nval"], xt)
+        output.append((p + "version", _version(d["nval"])))
+      elif r:
+        db.remove(key)
+    elif op in ("set", "add", "replace", "append"):
+      if op == "add" and r or op == "replace" and not r:
+        status = "450"
+      else:
+        db.set(key, (op == "append" and r and r[0] or "") + d["value"], xt)
+    elif op in ("increment", "increment_double"):
+      parse, format = op == "increment" and (int, str) or (float, lambda n: "{0:.6f}".format(n))
+      try:
+        num = (r and parse(r[0]) or parse(d.get("orig", 0))) + parse(d["num"])
+        db.set(key, format(num), xt)
+        output.append((p + "num", format(num)))
+      except ValueError:
+        status = "450"
+    elif op == "cas":
+      if (r and r[0]) != d.get("oval"):
+        status = "450"
+      elif "nval" in d:
+        db.set(key, d["nval"], xt)
+      elif r:
+        db.remove(key)
+    elif op == "remove":
+      if not db.remove(key):
+        status = "450"
+    else:
+      status = "501"
+    output.append((p + "status", status))
+  return output
+
+# Absolute expiration time of an xt argument, which is seconds from now or,
+# when negative, the epoch time.
+def _expires(xt):
+  if xt is None or xt == "": return None
+  xt = int(xt)
+  if xt < 0: return -xt
+  return int(time.time()) + xt
+
+# The records, plus a sorted key list for the cursors and the update log:
+# (ts, message) pairs in the format of the ktserver update log, ts being
+# nanoseconds since the epoch. changed is notified on every update. An
+# unordered database, like a hash database, only jumps to existing keys.
+class Database(object):
+  def __init__(self, sid=DEFAULT_SID, ordered=True):
+    self.ordered = ordered
+    self.lock = threading.RLock()
+    self.changed = threading.Condition(self.lock)
+    self.records = {}
+    self.keys = []
+    self.sid = sid
+    self.ulog = []
+
+  def clock(self):
+    ts = int(time.time() * 1000000000)
+    if self.ulog and ts <= self.ulog[-1][0]:
+      ts = self.ulog[-1][0] + 1
+    return ts
+
+  def log(self, op, key=None, value=None, xt=None):
+    message = _ULOG_HEAD.pack(self.sid, 0, op)
+    if op == 0xA1:
+      value = struct.pack(">Q", xt is None and ULOG_NO_XT or xt)[3:] + value
+      message += _varnum(len(key)) + _varnum(len(value)) + key + value
+    elif op == 0xA2:
+      message += _varnum(len(key)) + key
+    with self.lock:
+      self.ulog.append((self.clock(), message))
+      self.changed.notifyAll()
+
+  def get(self, key):
+    r = self.records.get(key)
+    if r is not None and r[1] is not None and r[1] <= time.time():
+      self.remove(key)
+      return None
+    return r
+
+  def set(self, key, value, xt=None):
+    if key not in self.records:
+      bisect.insort(self.keys, key)
+    self.records[key] = (value, xt)
+    self.log(0xA1, key, value, xt)
+
+  def remove(self, key):
+    if key not in self.records: return False
+    del self.records[key]
+    del self.keys[bisect.bisect_left(self.keys, key)]
+    self.log(0xA2, key)
+    return True
+
+  def clear(self):
+    self.records.clear()
+    del self.keys[:]
+    self.log(0xA5)
+
+class _Handler(SocketServer.StreamRequestHandler):
+  # Answers larger than a segment would otherwise wait out delayed ACKs.
+  disable_nagle_algorithm = True
+
+  def setup(self):
+    SocketServer.StreamRequestHandler.setup(self)
+    self.cursors = {}
+
+  # A client may hang up before reading all of an answer, e.g. a replication
+  # stream being closed.
+  def finish(self):
+    try:
+      SocketServer.StreamRequestHandler.finish(self)
+    except socket.error:
+      pass
+
+  def handle(self):
+    while True:
+      first = self.rfile.read(1)
+      if not first: return
+      if ord(first) in self.server.binary:
+        if not self.binary(ord(first)): return
+        continue
+      line = (first + self.rfile.readline()).strip()
+      if not line: continue
+      method, path, version = line.split(" ", 2)
+      headers = {}
+      while True:
+        header = self.rfile.readline()
+        if header in ("\r\n", "\n", ""): break
+        name, value = header.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+      body = ""
+      if "content-length" in headers:
+        body = self.rfile.read(int(headers["content-length"]))
+      self.server.delay()
+      if path.startswith("/rpc/"):
+        status, records = self.rpc(method, path, headers, body)
+        self.sendRecords(status, records)
+      else:
+        self.rest(method, path, headers, body)
+      if headers.get("connection", "").lower() == "close": return
+
+  def send(self, status, body="", headers=None, length=None):
+    head = ["HTTP/1.1 {0} {1}".format(status, REASONS[status])]
+    for name, value in (headers or {}).iteritems():
+      head.append("{0}: {1}".format(name, value))
+    head.append("Content-Length: {0}".format(len(body) if length is None else length))
+    self.wfile.write("\r\n".join(head) + "\r\n\r\n" + body)
+    self.wfile.flush()
+
+  def sendRecords(self, status, records):
+    if any(ENCODE_MATCH.search(k) or ENCODE_MATCH.search(v) for k, v in records):
+      body = "".join("{0}\t{1}\n".format(urllib.quote(k), urllib.quote(v)) for k, v in records)
+      contentType = "text/tab-separated-values; colenc=U"
+    else:
+      body = "".join("{0}\t{1}\n".format(k, v) for k, v in records)
+      contentType = "text/tab-separated-values"
+    self.send(status, body, {"Content-Type" : contentType})
+
+  def rpc(self, method, path, headers, body):
+    url = urlparse.urlparse(path)
+    params = []
+    if url.query:
+      params = urlparse.parse_qsl(url.query, keep_blank_values=True)
+    if method == "POST" and body:
+      m = re.search(r"colenc=([BQU])", headers.get("content-type", ""))
+      decode = m and COLENC_DECODERS[m.group(1)] or (lambda s: s)
+      for line in body.split("\n"):
+        if not line: continue
+        k, sep, v = line.partition("\t")
+        params.append((decode(k), decode(v)))
+    d = dict(params)
+    if d.get("DB", "0") not in DATABASES:
+      return 400, [("ERROR", "no such database")]
+    procedure = getattr(self, "rpc_" + url.path[5:], None)
+    if procedure is None:
+      return 501, [("ERROR", "not implemented")]
+    db = self.server.db
+    try:
+      with db.lock:
+        return 200, procedure(db, d, params) or []
+    except LogicalError, e:
+      return 450, [("ERROR", str(e))]
+    except InvalidError, e:
+      return 400, [("ERROR", str(e))]
+    except KeyError, e:
+      return 400, [("ERROR", "missing argument: {0}".format(e))]
+
+  def rpc_echo(self, db, d, params):
+    return params
+
+  def rpc_report(self, db, d, params):
+    return [("conf_kc_version", "fakeserver")
+            ,("db_total_count", str(len(db.records)))]
+
+  # Procedures registered on the server are called with the database and
+  # the input records; anything else echoes its input back.
+  def rpc_play_script(self, db, d, params):
+    procedure = self.server.procedures.get(d["name"])
+    if procedure is None:
+      return [(k, v) for k, v in params if k[:1] == "_"]
+    output = procedure(db, dict((k[1:], v) for k, v in params if k[:1] == "_"))
+    return [("_" + k, v) for k, v in output or []]
+
+  def rpc_status(self, db, d, params):
+    return [("count", str(len(db.records)))
+            ,("size", str(sum(len(k) + len(r[0]) for k, r in db.records.iteritems())))]
+
+  def rpc_clear(self, db, d, params):
+    db.clear()
+
+  def rpc_synchronize(self, db, d, params):
+    pass
+
+  def rpc_vacuum(self, db, d, params):
+    pass
+
+  def rpc_set(self, db, d, params):
+    db.set(d["key"], d["value"], _expires(d.get("xt")))
+
+  def rpc_add(self, db, d, params):
+    if db.get(d["key"]): raise LogicalError("the record exists")
+    self.rpc_set(db, d, params)
+
+  def rpc_replace(self, db, d, params):
+    if not db.get(d["key"]): raise LogicalError("no record was found")
+    self.rpc_set(db, d, params)
+
+  def rpc_append(self, db, d, params):
+    r = db.get(d["key"])
+    db.set(d["key"], (r and r[0] or "") + d["value"], _expires(d.get("xt")))
+
+  def rpc_increment(self, db, d, params):
+    return self.__increment(db, d, int, str)
+
+  def rpc_increment_double(self, db, d, params):
+    return self.__increment(db, d, float, lambda n: "{0:.6f}".format(n))
+
+  def __increment(self, db, d, parse, format):
+    r = db.get(d["key"])
+    try:
+      num = (r and parse(r[0]) or parse(0)) + parse(d["num"])
+    except ValueError:
+      raise LogicalError("the existing record was not compatible")
+    db.set(d["key"], format(num), _expires(d.get("xt")))
+    return [("num", format(num))]
+
+  def rpc_cas(self, db, d, params):
+    r = db.get(d["key"])
+    if (r and r[0]) != d.get("oval"): raise LogicalError("the old value assumption was failed")
+    if "nval" in d:
+      db.set(d["key"], d["nval"], _expires(d.get("xt")))
+    else:
+      db.remove(d["key"])
+
+  def rpc_remove(self, db, d, params):
+    if not db.get(d["key"]): raise LogicalError("no record was found")
+    db.remove(d["key"])
+
+  def rpc_get(self, db, d, params):
+    r = db.get(d["key"])
+    if not r: raise LogicalError("no record was found")
+    return self.__record(None, r)
+
+  def rpc_set_bulk(self, db, d, params):
+    xt = _expires(d.get("xt"))
+    records = [(k[1:], v) for k, v in params if k[:1] == "_"]
+    for k, v in records:
+      db.set(k, v, xt)
+    return [("num", str(len(records)))]
+
+  def rpc_remove_bulk(self, db, d, params):
+    num = 0
+    for k, v in params:
+      if k[:1] == "_" and db.get(k[1:]):
+        db.remove(k[1:])
+        num += 1
+    return [("num", str(num))]
+
+  def rpc_get_bulk(self, db, d, params):
+    records = []
+    for k, v in params:
+      if k[:1] == "_":
+        r = db.get(k[1:])
+        if r: records.append((k, r[0]))
+    return [("num", str(len(records)))] + records
+
+  def rpc_match_prefix(self, db, d, params):
+    return self.__match(db, d, lambda k: k.startswith(d["prefix"]))
+
+  def rpc_match_regex(self, db, d, params):
+    try:
+      regex = re.compile(d["regex"])
+    except re.error, e:
+      raise LogicalError("invalid regular expression: {0}".format(e))
+    return self.__match(db, d, lambda k: regex.search(k))
+
+  def rpc_match_similar(self, db, d, params):
+    origin = d["origin"]
+    limit = int(d.get("range", 1))
+    if limit < 0:
+      limit = 1
+    if "utf" in d:
+      origin = origin.decode("utf-8", "replace")
+      distance = lambda k: _levenshtein(origin, k.decode("utf-8", "replace"))
+    else:
+      distance = lambda k: _levenshtein(origin, k)
+    matches = []
+    for k in list(db.keys):
+      n = distance(k)
+      if n <= limit and db.get(k):
+        matches.append((n, k))
+    matches.sort()
+    return self.__match(db, d, None, matches)
+
+  def __match(self, db, d, match, matches=None):
+    if matches is None:
+      matches = [(i, k) for i, k in enumerate(k for k in list(db.keys) if match(k) and db.get(k))]
+    limit = int(d.get("max", -1))
+    if limit >= 0:
+      matches = matches[:limit]
+    return [("num", str(len(matches)))] + [("_" + k, str(n)) for n, k in matches]
+
+  # A cursor is the key of the record it points to; it moves on to the next
+  # key when that record goes away.
+  def __cursor(self, db, d):
+    key = self.cursors.get(d["CUR"])
+    if key is not None:
+      i = bisect.bisect_left(db.keys, key)
+      if i < len(db.keys):
+        self.cursors[d["CUR"]] = db.keys[i]
+        return i
+    self.cursors.pop(d["CUR"], None)
+    raise LogicalError("the cursor is invalidated")
+
+  def __step(self, db, d, i, offset=1):
+    i += offset
+    if 0 <= i < len(db.keys):
+      self.cursors[d["CUR"]] = db.keys[i]
+    else:
+      self.cursors.pop(d["CUR"], None)
+
+  def __record(self, key, r):
+    records = []
+    if key is not None:
+      records.append(("key", key))
+    records.append(("value", r[0]))
+    if r[1] is not None:
+      records.append(("xt", str(r[1])))
+    return records
+
+  def rpc_cur_jump(self, db, d, params):
+    if not db.ordered and "key" in d and d["key"] not in db.records:
+      self.cursors.pop(d["CUR"], None)
+      raise LogicalError("no record was found")
+    i = bisect.bisect_left(db.keys, d.get("key", ""))
+    if i >= len(db.keys):
+      self.cursors.pop(d["CUR"], None)
+      raise LogicalError("the cursor is invalidated")
+    self.cursors[d["CUR"]] = db.keys[i]
+
+  def rpc_cur_jump_back(self, db, d, params):
+    if "key" in d:
+      i = bisect.bisect_right(db.keys, d["key"]) - 1
+    else:
+      i = len(db.keys) - 1
+    if i < 0:
+      self.cursors.pop(d["CUR"], None)
+      raise LogicalError("the cursor is invalidated")
+    self.cursors[d["CUR"]] = db.keys[i]
+
+  def rpc_cur_step(self, db, d, params):
+    self.__step(db, d, self.__cursor(db, d))
+
+  def rpc_cur_step_back(self, db, d, params):
+    self.__step(db, d, self.__cursor(db, d), -1)
+
+  def rpc_cur_set_value(self, db, d, params):
+    i = self.__cursor(db, d)
+    key = db.keys[i]
+    db.set(key, d["value"], _expires(d.get("xt")))
+    if "step" in d:
+      self.__step(db, d, i)
+
+  def rpc_cur_remove(self, db, d, params):
+    db.remove(db.keys[self.__cursor(db, d)])
+
+  def rpc_cur_get_key(self, db, d, params):
+    i = self.__cursor(db, d)
+    key = db.keys[i]
+    if "step" in d:
+      self.__step(db, d, i)
+    return [("key", key)]
+
+  def rpc_cur_get_value(self, db, d, params):
+    i = self.__cursor(db, d)
+    r = db.records[db.keys[i]]
+    if "step" in d:
+      self.__step(db, d, i)
+    return [("value", r[0])]
+
+  def rpc_cur_get(self, db, d, params):
+    i = self.__cursor(db, d)
+    key = db.keys[i]
+    r = db.records[key]
+    if "step" in d:
+      self.__step(db, d, i)
+    return self.__record(key, r)
+
+  def rpc_cur_delete(self, db, d, params):
+    self.cursors.pop(d["CUR"], None)
+
+  def rest(self, method, path, headers, body):
+    key = path[1:]
+    if "/" in key:
+      name, key = key.split("/", 1)
+      if urllib.unquote(name) not in DATABASES:
+        return self.send(400)
+    key = urllib.unquote(key)
+    db = self.server.db
+    with db.lock:
+      r = db.get(key)
+      if method in ("GET", "HEAD"):
+        if not r: return self.send(404)
+        headers = {}
+        if r[1] is not None:
+          headers["X-Kt-Xt"] = email.utils.formatdate(r[1], usegmt=True)
+        if method == "HEAD":
+          return self.send(200, "", headers, len(r[0]))
+        return self.send(200, r[0], headers)
+      elif method == "PUT":
+        mode = headers.get("x-kt-mode", "set")
+        if mode == "add" and r or mode == "replace" and not r:
+          return self.send(450)
+        xt = headers.get("x-kt-xt")
+        if xt is not None:
+          try:
+            xt = _expires(xt)
+          except ValueError:
+            xt = email.utils.mktime_tz(email.utils.parsedate_tz(xt))
+        db.set(key, body, xt)
+        return self.send(201)
+      elif method == "DELETE":
+        if not r: return self.send(404)
+        db.remove(key)
+        return self.send(204)
+    return self.send(501)
+
+  def read(self, size):
+    data = self.rfile.read(size)
+    if len(data) != size:
+      raise EOFError()
+    return data
+
+  # One binary protocol frame; returns False when the connection is over.
+  def binary(self, magic):
+    try:
+      if magic == 0xB1:
+        try:
+          return self.replicate(*_REPLICATION_REQUEST.unpack(self.read(_REPLICATION_REQUEST.size)))
+        except socket.error:
+          return False
+      if magic == 0xB4:
+        flags, size, num = _SCRIPT_HEAD.unpack(self.read(_SCRIPT_HEAD.size))
+        name = self.read(size)
+        records = {}
+        for i in xrange(num):
+          ksiz, vsiz = _SCRIPT_RECORD.unpack(self.read(_SCRIPT_RECORD.size))
+          key = self.read(ksiz)
+          records[key] = self.read(vsiz)
+        self.server.delay()
+        procedure = self.server.procedures.get(name)
+        try:
+          with self.server.db.lock:
+            if procedure is not None:
+              records = dict(procedure(self.server.db, records) or [])
+        except (LogicalError, InvalidError):
+          self.wfile.write("\xbf")
+          self.wfile.flush()
+          return True
+        if flags & 1: return True
+        body = "".join(_SCRIPT_RECORD.pack(len(k), len(v)) + k + v for k, v in records.iteritems())
+        self.wfile.write(struct.pack(">BI", magic, len(records)) + body)
+        self.wfile.flush()
+        return True
+      flags, num = _COUNT.unpack(self.read(_COUNT.size))
+      db = self.server.db
+      hits = 0
+      output = []
+      entries = []
+      for i in xrange(num):
+        if magic == 0xB8:
+          index, ksiz, vsiz, xt = _SET_RECORD.unpack(self.read(_SET_RECORD.size))
+          entries.append((self.read(ksiz), self.read(vsiz), xt))
+        else:
+          index, ksiz = _KEY_RECORD.unpack(self.read(_KEY_RECORD.size))
+          entries.append((self.read(ksiz), index))
+      self.server.delay()
+      with db.lock:
+        for entry in entries:
+          if magic == 0xB8:
+            key, value, xt = entry
+            db.set(key, value, None if xt == NO_XT else _expires(xt))
+            hits += 1
+            continue
+          key, index = entry
+          r = db.get(key)
+          if not r: continue
+          hits += 1
+          if magic == 0xB9:
+            db.remove(key)
+          else:
+            output.append(_SET_RECORD.pack(index, len(key), len(r[0]), r[1] or NO_XT) + key + r[0])
+      if flags & 1: return True
+      self.wfile.write(struct.pack(">BI", magic, hits) + "".join(output))
+      self.wfile.flush()
+      return True
+    except EOFError:
+      return False
+
+  # Stream the update log after ts, skipping the messages of server sid
+  # (or, with flags & 1, all the others), with a NOP every heartbeat
+  # seconds the client must acknowledge. Ends with the connection.
+  def replicate(self, flags, ts, sid):
+    db = self.server.db
+    self.wfile.write("\xb1")
+    self.wfile.flush()
+    position = 0
+    while not self.server.stopped.isSet():
+      with db.lock:
+        while position < len(db.ulog) and db.ulog[position][0] <= ts:
+          position += 1
+        if position == len(db.ulog):
+          db.changed.wait(self.server.heartbeat)
+        entries = db.ulog[position:]
+        position = len(db.ulog)
+        now = db.clock()
+      for mts, message in entries:
+        msid = _ULOG_HEAD.unpack_from(message)[0]
+        if (flags & 1) and msid != sid or not (flags & 1) and msid == sid: continue
+        self.wfile.write(_REPLICATION_RECORD.pack(0xB1, mts, len(message)) + message)
+      if entries:
+        ts = entries[-1][0]
+        self.wfile.flush()
+      else:
+        self.wfile.write("\xb0" + _TS.pack(now))
+        self.wfile.flush()
+        if self.read(1) != "\xb1": return False
+    return False
+
+# A threaded server on host and port, port 0 picking a free one. latency is
+# the delay in seconds before every answer, to stand in for the network.
+# procedures maps play_script names to functions called with the database
+# and the input records, without their "_" prefixes, and returning a list of
+# (key, value) output records; raising LogicalError answers with status 450,
+# and InvalidError with status 400.
+# It starts with pytycoon_batch, the procedure of pytycoon.lua.
+class FakeTycoonServer(SocketServer.ThreadingTCPServer):
+  allow_reuse_address = True
+  daemon_threads = True
+  request_queue_size = 128
+  binary = (0xB1, 0xB4, 0xB8, 0xB9, 0xBA)
+  # seconds between two NOPs of an idle replication stream.
+  heartbeat = 1.0
+
+  def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, latency=0.0, ordered=True):
+    SocketServer.ThreadingTCPServer.__init__(self, (host, port), _Handler)
+    self.host, self.port = self.server_address
+    self.latency = latency
+    self.db = Database(ordered=ordered)
+    self.procedures = {"pytycoon_batch" : _batch}
+    self.stopped = threading.Event()
+    self.__thread = None
+
+  def delay(self):
+    if self.latency:
+      time.sleep(self.latency)
+
+  def start(self):
+    self.__thread = threading.Thread(target=self.serve_forever)
+    self.__thread.daemon = True
+    self.__thread.start()
+    return self
+
+  def stop(self):
+    self.stopped.set()
+    self.shutdown()
+    self.server_close()
+    self.__thread.join()
+
+def main():
+  import optparse
+  parser = optparse.OptionParser()
+  parser.add_option("--host", default=DEFAULT_HOST)
+  parser.add_option("--port", type="int", default=DEFAULT_PORT)
+  parser.add_option("--latency", type="float", default=0.0)
+  options, args = parser.parse_args()
+  FakeTycoonServer(options.host, options.port, options.latency).serve_forever()
+
+if __name__ == "__main__":
+  main()
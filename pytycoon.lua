@@ -0,0 +1,133 @@
+--
+-- Server-side procedures used by PyTycoon, for ktserver -scr pytycoon.lua.
+--
+
+-- the maximum expiration time of a timed database, i.e. no expiration.
+local XTMAX = 1099511627775
+
+-- the version of a value for vget and vcas: its size and two hashes.
+local function version(value)
+   return string.format("%d:%.0f:%.0f", #value, kt.hash_murmur(value), kt.hash_fnv(value))
+end
+
+-- the RPC status code of a failed database operation.
+local function status(db)
+   local code = db:error():code()
+   if code == kt.Error.NOREC or code == kt.Error.DUPREC or code == kt.Error.LOGIC then
+      return "450"
+   end
+   return "500"
+end
+
+-- pytycoon_batch
+-- Run the operations of a PyTycoon batch in order.
+-- input: n: the number of operations.
+-- input: DB: (optional): the database identifier.
+-- input: <i>.op: the name of the i-th operation: get, set, add, replace,
+--        append, increment, increment_double, cas, remove, vget or vcas.
+-- input: <i>.key, <i>.value, <i>.num, <i>.orig, <i>.oval, <i>.nval, <i>.xt:
+--        (optional): its arguments, as for the RPC procedure of that name.
+-- input: <i>.version: (optional): for vcas, the version of the current
+--        value as given by vget; if omitted, the record must not exist.
+-- output: <i>.status: "ok", or the status code of the RPC procedure; 450
+--         when the record of a vget is missing or the version of a vcas
+--         does not match.
+-- output: <i>.value, <i>.num, <i>.xt, <i>.version: (optional): its results.
+-- output: <i>.error: (optional): the error message.
+function pytycoon_batch(inmap, outmap)
+   local db = kt.db
+   if inmap.DB then
+      -- kt.dbs holds the databases by 1-based index and by path.
+      local index = tonumber(inmap.DB)
+      if index then
+         db = kt.dbs[index + 1]
+      else
+         db = kt.dbs[inmap.DB]
+      end
+      if not db then
+         return kt.RVEINVALID
+      end
+   end
+   local n = tonumber(inmap.n)
+   if not n then
+      return kt.RVEINVALID
+   end
+   for i = 0, n - 1 do
+      local p = i .. "."
+      local op = inmap[p .. "op"]
+      local key = inmap[p .. "key"]
+      local xt = tonumber(inmap[p .. "xt"])
+      local ok = false
+      local mismatch = false
+      if not key then
+         outmap[p .. "status"] = "400"
+      else
+         if op == "get" or op == "vget" then
+            local value, vxt = db:get(key)
+            if value then
+               outmap[p .. "value"] = value
+               if vxt and vxt < XTMAX then
+                  outmap[p .. "xt"] = string.format("%d", vxt)
+               end
+               if op == "vget" then
+                  outmap[p .. "version"] = version(value)
+               end
+               ok = true
+            end
+         elseif op == "vcas" then
+            local expected = inmap[p .. "version"]
+            local nval = inmap[p .. "nval"]
+            local function visit(vkey, value, vxt)
+               if (value and version(value)) ~= expected then
+                  mismatch = true
+                  return kt.Visitor.NOP
+               end
+               if nval then
+                  return nval, xt
+               end
+               return kt.Visitor.REMOVE
+            end
+            ok = db:accept(key, visit, true) and not mismatch
+            if ok and nval then
+               outmap[p .. "version"] = version(nval)
+            end
+         elseif op == "set" then
+            ok = db:set(key, inmap[p .. "value"], xt)
+         elseif op == "add" then
+            ok = db:add(key, inmap[p .. "value"], xt)
+         elseif op == "replace" then
+            ok = db:replace(key, inmap[p .. "value"], xt)
+         elseif op == "append" then
+            ok = db:append(key, inmap[p .. "value"], xt)
+         elseif op == "increment" or op == "increment_double" then
+            local num = db[op](db, key, tonumber(inmap[p .. "num"]), tonumber(inmap[p .. "orig"]) or 0, xt)
+            if num then
+               if op == "increment" then
+                  outmap[p .. "num"] = string.format("%d", num)
+               else
+                  outmap[p .. "num"] = string.format("%.6f", num)
+               end
+               ok = true
+            end
+         elseif op == "cas" then
+            ok = db:cas(key, inmap[p .. "oval"], inmap[p .. "nval"], xt)
+         elseif op == "remove" then
+            ok = db:remove(key)
+         end
+         if ok then
+            outmap[p .. "status"] = "ok"
+         elseif mismatch then
+            outmap[p .. "status"] = "450"
+            outmap[p .. "error"] = "the version assumption was failed"
+         elseif op == "get" or op == "set" or op == "add" or op == "replace" or op == "append"
+            or op == "increment" or op == "increment_double" or op == "cas" or op == "remove"
+            or op == "vget" or op == "vcas" then
+            outmap[p .. "status"] = status(db)
+            outmap[p .. "error"] = tostring(db:error())
+         else
+            outmap[p .. "status"] = "501"
+         end
+      end
+   end
+   return kt.RVSUCCESS
+end